@@ -2,6 +2,7 @@
 主应用入口 - 中国皮影戏学习平台
 """
 import os
+import click
 from dotenv import load_dotenv
 from app import create_app, db
 
@@ -14,12 +15,14 @@ app = create_app(os.environ.get('FLASK_ENV', 'development'))
 
 # CLI命令
 @app.cli.command()
-def init_db():
-    """初始化数据库"""
+@click.option('--seed/--no-seed', default=True, help='是否写入初始数据')
+def init_db(seed):
+    """初始化数据库（建表并写入初始数据，部署时执行一次）"""
     with app.app_context():
         db.create_all()
-        from app.utils.init_data import init_database
-        init_database()
+        if seed:
+            from app.utils.init_data import init_database
+            init_database()
         print("数据库初始化完成！")
 
 
@@ -46,6 +49,140 @@ def create_admin():
     print(f"管理员账户 {username} 创建成功！")
 
 
+@app.cli.command()
+def rebuild_trending():
+    """从浏览记录重建趋势分数（修改半衰期后执行）"""
+    from app.models import Story, LearningModule, ContentView
+    from app.services.trending import rebuild_trending_scores
+    stories = rebuild_trending_scores(Story, ContentView.story_id)
+    modules = rebuild_trending_scores(LearningModule, ContentView.module_id)
+    print(f"趋势分数重建完成：{stories} 个故事，{modules} 个学习模块")
+
+
+@app.cli.command()
+@click.option('--fix', is_flag=True, help='修正不一致的计数')
+def check_comment_counters(fix):
+    """校验评论冗余计数（故事/模块评论数、回复数）"""
+    from app.models import Comment
+    mismatches = Comment.check_counters(fix=fix)
+    for table, row_id, stored, expected in mismatches:
+        print(f"{table}#{row_id}: 记录值 {stored}，实际值 {expected}")
+    if fix and mismatches:
+        db.session.commit()
+        print(f"已修正 {len(mismatches)} 处不一致")
+    elif not mismatches:
+        print("评论计数一致")
+
+
+@app.cli.command()
+@click.option('--keep', is_flag=True, help='保留原逐题答题记录')
+@click.option('--batch-size', default=200, help='每个事务处理的用户数')
+def compact_quiz_answers(keep, batch_size):
+    """将历史逐题答题记录合并为测验提交记录"""
+    from app.models import QuizAttempt
+    attempts, processed = QuizAttempt.compact_answers(keep=keep, batch_size=batch_size)
+    print(f"已将 {processed} 条答题记录合并为 {attempts} 条提交记录")
+
+
+@app.cli.command()
+@click.option('--quiz-id', type=int, default=None, help='只重建指定测验')
+def backfill_item_stats(quiz_id):
+    """从测验提交记录重建题目统计"""
+    from app.services.item_analysis import backfill
+    count = backfill(quiz_id)
+    print(f"已重建 {count} 道题目的统计")
+
+
+@app.cli.command()
+@click.option('--fix', is_flag=True, help='将余额修正为流水之和')
+def reconcile_points(fix):
+    """按积分流水校验用户积分余额（可由定时任务周期执行）"""
+    from app.models import PointsLedger
+    openings, mismatches = PointsLedger.reconcile(fix=fix)
+    for user_id, stored, expected in mismatches:
+        print(f"用户#{user_id}: 余额 {stored}，流水之和 {expected}")
+    db.session.commit()
+    if openings:
+        print(f"已为 {openings} 个用户写入期初余额")
+    if fix and mismatches:
+        print(f"已修正 {len(mismatches)} 个用户的积分")
+    elif not mismatches:
+        print("积分余额与流水一致")
+
+
+@app.cli.command()
+def purge_revoked_tokens():
+    """删除已过期的令牌吊销记录（可由定时任务周期执行）"""
+    from app.models import RevokedToken
+    deleted = RevokedToken.purge_expired()
+    db.session.commit()
+    print(f"已删除 {deleted} 条过期的吊销记录")
+
+
+@app.cli.command()
+@click.option('--config', 'config_name', default='production', help='要测量的配置名称')
+@click.option('--top', default=15, help='显示累计导入耗时最长的模块数（只统计前两层导入）')
+def profile_startup(config_name, top):
+    """在新进程中测量导入耗时和 create_app 耗时（工作进程启动成本）"""
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "from app import create_app\n"
+        "imported = time.perf_counter()\n"
+        "create_app(sys.argv[1])\n"
+        "print(f'{imported - start:.4f} {time.perf_counter() - imported:.4f}')\n"
+    )
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, config_name],
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        print(result.stderr)
+        return
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            modules.append((int(cumulative_us), name.strip()))
+
+    import_seconds, create_seconds = map(float, result.stdout.split()[-2:])
+    print(f"导入 app: {import_seconds * 1000:.1f} ms")
+    print(f"create_app('{config_name}'): {create_seconds * 1000:.1f} ms")
+    print(f"\n{'cumulative(ms)':>14}  module")
+    for cumulative_us, name in sorted(modules, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f}  {name}")
+
+
+@app.cli.command()
+@click.option('--master-pid', type=int, required=True, help='gunicorn 主进程PID')
+def memory_report(master_pid):
+    """统计 gunicorn 主进程和各工作进程的内存（RSS/PSS/共享/私有，单位 MB）"""
+    from app.utils.prefork import memory_report as collect
+
+    print(f"{'role':>7} {'pid':>7} {'rss':>8} {'pss':>8} {'shared':>8} {'private':>8}")
+    totals = {'Rss': 0, 'Pss': 0, 'Private': 0}
+    for role, pid, usage in collect(master_pid):
+        if usage is None:
+            print(f"{role:>7} {pid:>7}  无法读取 /proc/{pid}/smaps_rollup")
+            continue
+        shared = usage.get('Shared_Clean', 0) + usage.get('Shared_Dirty', 0)
+        private = usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0)
+        totals['Rss'] += usage.get('Rss', 0)
+        totals['Pss'] += usage.get('Pss', 0)
+        totals['Private'] += private
+        print(f"{role:>7} {pid:>7} {usage.get('Rss', 0) / 1024:>8.1f} {usage.get('Pss', 0) / 1024:>8.1f} "
+              f"{shared / 1024:>8.1f} {private / 1024:>8.1f}")
+    # PSS 之和才是实际占用的物理内存，RSS 之和会重复计算共享页
+    print(f"{'total':>7} {'':>7} {totals['Rss'] / 1024:>8.1f} {totals['Pss'] / 1024:>8.1f} "
+          f"{'':>8} {totals['Private'] / 1024:>8.1f}")
+
+
 @app.shell_context_processor
 def make_shell_context():
     """Flask Shell上下文"""
@@ -1,13 +1,14 @@
 """
 应用工厂 - 使用工厂模式创建Flask应用
 """
-from flask import Flask
+from flask import Flask, current_app, g, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_babel import Babel
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
+from sqlalchemy import event
 from config import config
 import os
 import logging
@@ -65,12 +66,68 @@ def create_app(config_name=None):
     app.register_blueprint(learning.bp, url_prefix='/learning')
     app.register_blueprint(admin.bp, url_prefix='/admin')
 
-    # 创建数据库表
-    with app.app_context():
-        db.create_all()
-        # 初始化数据
-        from app.utils.init_data import init_database
-        init_database()
+    # 趋势分数所需的数据库函数（需在建立第一个连接前注册）
+    from app.services.trending import init_trending
+    init_trending(app)
+
+    # 创建数据库表并初始化数据（仅开发环境默认开启，其余环境通过 flask init-db 执行）
+    if app.config.get('AUTO_CREATE_DB'):
+        with app.app_context():
+            db.create_all()
+            from app.utils.init_data import init_database
+            init_database()
+
+    # 热门内容快照
+    from app.services.popularity import init_popularity
+    init_popularity(app)
+
+    # 互动写后缓冲
+    from app.services.reactions import init_reactions
+    init_reactions(app)
+
+    # 评论防刷
+    from app.services.antispam import init_antispam
+    init_antispam(app)
+
+    # 测验答案表缓存
+    from app.services.quiz_grading import init_quiz_grading
+    init_quiz_grading(app)
+
+    # 测验会话
+    from app.services.quiz_sessions import init_quiz_sessions
+    init_quiz_sessions(app)
+
+    # 学习心跳合并
+    from app.services.heartbeats import init_heartbeats
+    init_heartbeats(app)
+
+    # 积分排行榜
+    from app.services.leaderboard import init_leaderboard
+    init_leaderboard(app)
+
+    # 用户学习统计缓存
+    from app.services.user_stats import init_user_stats
+    init_user_stats(app)
+
+    # 成就引擎
+    from app.services.achievements import init_achievements
+    init_achievements(app)
+
+    # 用户快照缓存
+    from app.services.user_cache import init_user_cache
+    init_user_cache(app)
+
+    # 密码校验线程池
+    from app.services.passwords import init_passwords
+    init_passwords(app)
+
+    # JWT吊销列表
+    from app.services.tokens import init_tokens
+    init_tokens(app)
+
+    # 活动日志批量写入
+    from app.services.activity_log import init_activity_log
+    init_activity_log(app)
 
     # 配置日志
     setup_logging(app)
@@ -158,8 +215,29 @@ def get_locale():
     return request.accept_languages.best_match(['zh_CN', 'en_US']) or 'zh_CN'
 
 
+@event.listens_for(db.session, 'after_commit')
+def count_request_commits(session):
+    """
+    统计每个请求的提交次数
+
+    STRICT_SINGLE_COMMIT 开启时（测试配置默认开启），同一请求第二次提交即
+    抛出异常，用于发现把副作用拆成多个事务的代码；有意分块提交的路由用
+    multiple_commits_allowed 装饰器豁免。
+    """
+    if not has_request_context():
+        return
+    # 测试中多个请求可能共用同一应用上下文，按请求对象重新计数
+    current = request._get_current_object()
+    if g.get('commit_request') is not current:
+        g.commit_request, g.commit_count = current, 0
+    g.commit_count += 1
+    if g.commit_count > 1 and current_app.config.get('STRICT_SINGLE_COMMIT') and \
+            g.get('multiple_commits_allowed') is not current:
+        raise RuntimeError(f'请求 {request.endpoint} 提交了 {g.commit_count} 次事务')
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    """加载用户回调"""
-    from app.models.user import User
-    return User.query.get(int(user_id))
+    """加载用户回调（返回缓存的用户快照，多数请求不查询用户表）"""
+    from app.services.user_cache import get_user_snapshot
+    return get_user_snapshot(user_id)
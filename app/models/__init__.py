@@ -2,24 +2,36 @@
 数据库模型包 - 导出所有模型
 """
 from app.models.user import User
-from app.models.story import Story
+from app.models.story import Story, Scene
 from app.models.character import Character
 from app.models.comment import Comment
-from app.models.learning import LearningModule, Quiz, QuizQuestion, QuizAnswer, UserProgress
+from app.models.learning import LearningModule, Quiz, QuizQuestion, QuizAnswer, QuizAttempt, QuizQuestionStats, UserProgress
 from app.models.rating import Rating
 from app.models.analytics import UserActivity, ContentView
+from app.models.reaction import Reaction
+from app.models.points import PointsLedger
+from app.models.achievement import UserAchievement, AchievementCounter
+from app.models.token import RevokedToken
 
 __all__ = [
     'User',
     'Story',
+    'Scene',
     'Character',
     'Comment',
     'LearningModule',
     'Quiz',
     'QuizQuestion',
     'QuizAnswer',
+    'QuizAttempt',
+    'QuizQuestionStats',
     'UserProgress',
     'Rating',
     'UserActivity',
-    'ContentView'
+    'ContentView',
+    'Reaction',
+    'PointsLedger',
+    'UserAchievement',
+    'AchievementCounter',
+    'RevokedToken'
 ]
@@ -0,0 +1,38 @@
+"""
+成就模型 - 用户获得的成就及成就规则的增量计数
+"""
+from datetime import datetime
+from app import db
+
+
+class UserAchievement(db.Model):
+    """用户获得的成就（每个成就只授予一次）"""
+
+    __tablename__ = 'user_achievements'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    code = db.Column(db.String(50), nullable=False)
+    awarded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'code', name='unique_user_achievement'),
+    )
+
+    def __repr__(self):
+        return f'<UserAchievement {self.code} user={self.user_id}>'
+
+
+class AchievementCounter(db.Model):
+    """成就规则的计数状态（计数型为累计值，连续型为当前连续天数）"""
+
+    __tablename__ = 'achievement_counters'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    rule = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+    last_day = db.Column(db.Date)  # 连续型规则最近一次计入的日期
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AchievementCounter {self.rule} user={self.user_id} value={self.value}>'
@@ -46,8 +46,22 @@ class UserActivity(db.Model):
         }
 
     @staticmethod
-    def log_activity(user_id, activity_type, details=None, request=None):
-        """记录用户活动"""
+    def request_fields(request):
+        """从请求中提取IP、User-Agent和设备类型"""
+        user_agent = request.headers.get('User-Agent', '')
+        # 简单的设备类型检测
+        lowered = user_agent.lower()
+        if 'mobile' in lowered:
+            device_type = 'mobile'
+        elif 'tablet' in lowered or 'ipad' in lowered:
+            device_type = 'tablet'
+        else:
+            device_type = 'desktop'
+        return {'ip_address': request.remote_addr, 'user_agent': user_agent, 'device_type': device_type}
+
+    @staticmethod
+    def log_activity(user_id, activity_type, details=None, request=None, commit=True):
+        """记录用户活动（commit=False 时随调用方的事务一起提交）"""
         activity = UserActivity(
             user_id=user_id,
             activity_type=activity_type,
@@ -55,19 +69,17 @@ class UserActivity(db.Model):
         )
 
         if request:
-            activity.ip_address = request.remote_addr
-            activity.user_agent = request.headers.get('User-Agent', '')
-            # 简单的设备类型检测
-            user_agent = activity.user_agent.lower()
-            if 'mobile' in user_agent:
-                activity.device_type = 'mobile'
-            elif 'tablet' in user_agent or 'ipad' in user_agent:
-                activity.device_type = 'tablet'
-            else:
-                activity.device_type = 'desktop'
+            for field, value in UserActivity.request_fields(request).items():
+                setattr(activity, field, value)
 
         db.session.add(activity)
-        db.session.commit()
+
+        # 登记活动事件，事务提交后由成就引擎处理
+        db.session.info.setdefault('activity_events', []).append(
+            (user_id, activity_type, activity.details, datetime.utcnow()))
+
+        if commit:
+            db.session.commit()
         return activity
 
     @staticmethod
@@ -111,6 +123,11 @@ class ContentView(db.Model):
 
     __tablename__ = 'content_views'
 
+    # 复合索引：支持推荐查询中"用户是否已浏览"的反连接
+    __table_args__ = (
+        db.Index('ix_content_views_user_story', 'user_id', 'story_id'),
+    )
+
     # 基本信息
     id = db.Column(db.Integer, primary_key=True)
 
@@ -157,14 +174,15 @@ class ContentView(db.Model):
 
     @staticmethod
     def log_view(story_id=None, module_id=None, user_id=None, duration=None,
-                 completed=False, request=None):
-        """记录内容浏览"""
+                 completed=False, request=None, commit=True):
+        """记录内容浏览（commit=False 时随调用方的事务一起提交）"""
         view = ContentView(
             user_id=user_id,
             story_id=story_id,
             module_id=module_id,
             duration=duration,
-            completed=completed
+            completed=completed,
+            created_at=datetime.utcnow()
         )
 
         if request:
@@ -179,7 +197,18 @@ class ContentView(db.Model):
                 view.device_type = 'desktop'
 
         db.session.add(view)
-        db.session.commit()
+
+        # 增量更新趋势分数（会话中已加载的对象不会产生额外查询）
+        from app.services import trending
+        from app.models.story import Story
+        from app.models.learning import LearningModule
+        content = Story.query.get(story_id) if story_id else \
+            LearningModule.query.get(module_id) if module_id else None
+        if content is not None:
+            trending.record_view(content, now=view.created_at)
+
+        if commit:
+            db.session.commit()
         return view
 
     @staticmethod
@@ -10,6 +10,13 @@ class Comment(db.Model):
 
     __tablename__ = 'comments'
 
+    # 复合索引：支持顶级评论的 (is_pinned, created_at, id) 游标分页和回复展开
+    __table_args__ = (
+        db.Index('ix_comments_story_thread', 'story_id', 'parent_id', 'is_pinned', 'created_at'),
+        db.Index('ix_comments_module_thread', 'module_id', 'parent_id', 'is_pinned', 'created_at'),
+        db.Index('ix_comments_parent', 'parent_id'),
+    )
+
     # 基本信息
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -27,6 +34,7 @@ class Comment(db.Model):
     # 互动统计
     like_count = db.Column(db.Integer, default=0)
     dislike_count = db.Column(db.Integer, default=0)
+    reply_count = db.Column(db.Integer, default=0, nullable=False)  # 可见的直接回复数（冗余计数）
 
     # 状态
     is_approved = db.Column(db.Boolean, default=True)  # 是否通过审核
@@ -40,26 +48,37 @@ class Comment(db.Model):
     def __repr__(self):
         return f'<Comment {self.id} by User {self.user_id}>'
 
-    def to_dict(self, include_user=True):
-        """转换为字典"""
+    def to_dict(self, include_user=True, author=None, reply_count=None):
+        """
+        转换为字典
+
+        Args:
+            include_user: 是否包含作者信息
+            author: 预先批量加载的作者（避免逐条懒加载）
+            reply_count: 覆盖冗余的回复计数
+        """
+        if reply_count is None:
+            reply_count = self.reply_count or 0
+
         data = {
             'id': self.id,
             'content': self.content,
             'like_count': self.like_count,
             'dislike_count': self.dislike_count,
             'is_pinned': self.is_pinned,
-            'reply_count': self.replies.filter_by(is_deleted=False).count(),
+            'reply_count': reply_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-        if include_user and self.author:
+        author = author or (self.author if include_user else None)
+        if include_user and author:
             data['author'] = {
-                'id': self.author.id,
-                'username': self.author.username,
-                'nickname': self.author.nickname or self.author.username,
-                'avatar': self.author.avatar,
-                'level': self.author.level
+                'id': author.id,
+                'username': author.username,
+                'nickname': author.nickname or author.username,
+                'avatar': author.avatar,
+                'level': author.level
             }
 
         if self.parent_id:
@@ -77,11 +96,94 @@ class Comment(db.Model):
         self.dislike_count += 1
         db.session.commit()
 
+    def is_visible(self):
+        """是否对外可见（已审核且未删除）；未刷新到数据库前按默认值处理"""
+        return self.is_approved is not False and not self.is_deleted
+
+    def _adjust_counters(self, delta):
+        """在当前事务中原子调整故事、模块和父评论的冗余计数"""
+        from app.models.story import Story
+        from app.models.learning import LearningModule
+
+        if self.story_id:
+            Story.query.filter_by(id=self.story_id).update(
+                {Story.comment_count: Story.comment_count + delta})
+        if self.module_id:
+            LearningModule.query.filter_by(id=self.module_id).update(
+                {LearningModule.comment_count: LearningModule.comment_count + delta})
+        if self.parent_id:
+            Comment.query.filter_by(id=self.parent_id).update(
+                {Comment.reply_count: Comment.reply_count + delta})
+
+    def set_state(self, is_approved=None, is_deleted=None):
+        """修改审核/删除状态，可见性变化时同步调整冗余计数（不提交）"""
+        was_visible = self.is_visible()
+        if is_approved is not None:
+            self.is_approved = is_approved
+        if is_deleted is not None:
+            self.is_deleted = is_deleted
+        now_visible = self.is_visible()
+        if was_visible != now_visible:
+            self._adjust_counters(1 if now_visible else -1)
+
+    def approve(self):
+        """批准评论（不提交）"""
+        self.set_state(is_approved=True)
+
+    def restore(self):
+        """恢复已删除的评论（不提交）"""
+        self.set_state(is_deleted=False)
+
     def soft_delete(self):
         """软删除评论"""
-        self.is_deleted = True
+        self.set_state(is_deleted=True)
         db.session.commit()
 
+    @staticmethod
+    def create_comment(content, user_id, story_id=None, module_id=None, parent_id=None, **kwargs):
+        """创建评论并在同一事务中更新冗余计数（不提交）"""
+        comment = Comment(content=content, user_id=user_id, story_id=story_id,
+                          module_id=module_id, parent_id=parent_id, **kwargs)
+        db.session.add(comment)
+        if comment.is_visible():
+            comment._adjust_counters(1)
+        return comment
+
+    @staticmethod
+    def check_counters(fix=False):
+        """
+        校验冗余计数与实际可见评论数是否一致
+
+        Args:
+            fix: 是否将不一致的计数修正为实际值（不提交）
+
+        Returns:
+            [(表名, ID, 冗余值, 实际值), ...]
+        """
+        from app.models.story import Story
+        from app.models.learning import LearningModule
+
+        visible = db.and_(Comment.is_deleted == False, Comment.is_approved == True)
+        targets = [
+            (Story, Story.comment_count, Comment.story_id),
+            (LearningModule, LearningModule.comment_count, Comment.module_id),
+            (Comment, Comment.reply_count, Comment.parent_id),
+        ]
+
+        mismatches = []
+        for model, counter, foreign_key in targets:
+            actual = dict(db.session.query(foreign_key, db.func.count(Comment.id))
+                          .filter(foreign_key.isnot(None), visible)
+                          .group_by(foreign_key).all())
+            for row_id, stored in db.session.query(model.id, counter).all():
+                expected = actual.get(row_id, 0)
+                if (stored or 0) != expected:
+                    mismatches.append((model.__tablename__, row_id, stored, expected))
+                    if fix:
+                        model.query.filter_by(id=row_id).update(
+                            {counter: expected}, synchronize_session=False)
+        return mismatches
+
     @staticmethod
     def get_recent_comments(limit=10):
         """获取最新评论"""
@@ -1,9 +1,33 @@
 """
 学习模型 - 管理学习模块、测验和用户进度
 """
+from collections import namedtuple
 from datetime import datetime
+from sqlalchemy import event
 from app import db
 
+# 与 QuizAnswer 字段一致的逐题答题行，由 QuizAttempt 展开得到
+QuizAnswerRow = namedtuple('QuizAnswerRow', [
+    'user_id', 'quiz_id', 'question_id', 'user_answer',
+    'is_correct', 'points_earned', 'answered_at', 'attempt_id'
+])
+
+
+def pack_bits(flags):
+    """将布尔列表打包为字节串（第i位对应第i题）"""
+    packed = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            packed[i >> 3] |= 1 << (i & 7)
+    return bytes(packed)
+
+
+def unpack_bits(packed, count):
+    """将字节串还原为长度为 count 的布尔列表"""
+    packed = packed or b''
+    return [bool(packed[i >> 3] >> (i & 7) & 1) if (i >> 3) < len(packed) else False
+            for i in range(count)]
+
 
 class LearningModule(db.Model):
     """学习模块模型"""
@@ -40,6 +64,8 @@ class LearningModule(db.Model):
     # 统计
     enrollment_count = db.Column(db.Integer, default=0)
     completion_count = db.Column(db.Integer, default=0)
+    comment_count = db.Column(db.Integer, default=0, nullable=False)  # 可见评论数（冗余计数）
+    trending_score = db.Column(db.Float, index=True)  # 对数形式的时间衰减趋势分数
 
     # 状态
     is_published = db.Column(db.Boolean, default=True)
@@ -78,6 +104,7 @@ class LearningModule(db.Model):
             'enrollment_count': self.enrollment_count,
             'completion_count': self.completion_count,
             'completion_rate': self.get_completion_rate(),
+            'comment_count': self.comment_count or 0,
             'quiz_count': self.quizzes.count()
         }
 
@@ -94,15 +121,17 @@ class LearningModule(db.Model):
             return 0
         return round((self.completion_count / self.enrollment_count) * 100, 2)
 
-    def increment_enrollment(self):
+    def increment_enrollment(self, commit=True):
         """增加注册人数"""
         self.enrollment_count += 1
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
-    def increment_completion(self):
+    def increment_completion(self, commit=True):
         """增加完成人数"""
         self.completion_count += 1
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
 
 class Quiz(db.Model):
@@ -124,6 +153,9 @@ class Quiz(db.Model):
     max_attempts = db.Column(db.Integer, default=3)  # 最大尝试次数
     shuffle_questions = db.Column(db.Boolean, default=True)  # 是否打乱题目顺序
 
+    # 题目版本：题目增删改时递增，用于使缓存的答案表失效
+    version = db.Column(db.Integer, default=1, nullable=False)
+
     # 时间戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -206,6 +238,18 @@ class QuizQuestion(db.Model):
         return user_answer == self.correct_answer
 
 
+@event.listens_for(QuizQuestion, 'after_insert')
+@event.listens_for(QuizQuestion, 'after_update')
+@event.listens_for(QuizQuestion, 'after_delete')
+def _bump_quiz_version(mapper, connection, target):
+    """题目变更时在同一事务内递增所属测验的版本号"""
+    quizzes = Quiz.__table__
+    connection.execute(
+        quizzes.update().where(quizzes.c.id == target.quiz_id)
+        .values(version=quizzes.c.version + 1)
+    )
+
+
 class QuizAnswer(db.Model):
     """用户测验答题记录"""
 
@@ -234,11 +278,250 @@ class QuizAnswer(db.Model):
         return f'<QuizAnswer user={self.user_id} question={self.question_id}>'
 
 
+class QuizAttempt(db.Model):
+    """
+    测验提交记录
+
+    一次提交一行：逐题对错打包为位图，题目ID、用户答案和得分
+    存放在一个JSON字段中，替代逐题写入 QuizAnswer。
+    """
+
+    __tablename__ = 'quiz_attempts'
+
+    __table_args__ = (
+        db.Index('ix_quiz_attempts_user_quiz', 'user_id', 'quiz_id'),
+        db.Index('ix_quiz_attempts_quiz', 'quiz_id', 'submitted_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
+    quiz_version = db.Column(db.Integer)  # 提交时的题目版本
+
+    # 成绩
+    question_count = db.Column(db.Integer, default=0)
+    correct_bits = db.Column(db.LargeBinary)  # 逐题对错位图
+    earned_points = db.Column(db.Integer, default=0)
+    total_points = db.Column(db.Integer, default=0)
+    score = db.Column(db.Integer, default=0)
+    passed = db.Column(db.Boolean, default=False)
+
+    # 明细：{"question_ids": [...], "answers": [...], "points": [...]}
+    payload = db.Column(db.JSON)
+
+    # 时间
+    started_at = db.Column(db.DateTime)
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    time_spent = db.Column(db.Integer)  # 答题用时（秒）
+
+    def __repr__(self):
+        return f'<QuizAttempt user={self.user_id} quiz={self.quiz_id}>'
+
+    @property
+    def correct(self):
+        """逐题对错列表"""
+        return unpack_bits(self.correct_bits, self.question_count or 0)
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'quiz_id': self.quiz_id,
+            'score': self.score,
+            'passed': self.passed,
+            'earned_points': self.earned_points,
+            'total_points': self.total_points,
+            'correct_count': sum(self.correct),
+            'question_count': self.question_count,
+            'time_spent': self.time_spent,
+            'submitted_at': self.submitted_at.isoformat() if self.submitted_at else None
+        }
+
+    def answer_rows(self):
+        """展开为逐题答题行（兼容原 QuizAnswer 的分析代码）"""
+        payload = self.payload or {}
+        question_ids = payload.get('question_ids', [])
+        answers = payload.get('answers', [None] * len(question_ids))
+        points = payload.get('points', [0] * len(question_ids))
+        for question_id, answer, is_correct, earned in zip(
+                question_ids, answers, unpack_bits(self.correct_bits, len(question_ids)), points):
+            yield QuizAnswerRow(self.user_id, self.quiz_id, question_id, answer,
+                                is_correct, earned, self.submitted_at, self.id)
+
+    @staticmethod
+    def record(user_id, quiz, key, graded, passed, started_at=None, time_spent=None):
+        """
+        记录一次提交（一条INSERT，不提交事务）
+
+        Args:
+            key: quiz_grading.AnswerKey
+            graded: quiz_grading.GradeResult
+        """
+        now = datetime.utcnow()
+        if time_spent is None and started_at is not None:
+            time_spent = int((now - started_at).total_seconds())
+        attempt = QuizAttempt(
+            user_id=user_id,
+            quiz_id=quiz.id,
+            quiz_version=key.version,
+            question_count=len(key.question_ids),
+            correct_bits=pack_bits(graded.correct),
+            earned_points=graded.earned_points,
+            total_points=graded.total_points,
+            score=graded.score,
+            passed=passed,
+            payload={
+                'question_ids': list(key.question_ids),
+                'answers': list(graded.user_answers),
+                'points': list(graded.earned)
+            },
+            started_at=started_at,
+            submitted_at=now,
+            time_spent=time_spent
+        )
+        db.session.add(attempt)
+        return attempt
+
+    @staticmethod
+    def iter_answer_rows(quiz_id=None, user_id=None, batch_size=500):
+        """
+        按条件逐题展开提交记录，用于按题目的统计分析
+
+        逐题兼容层以生成器而非数据库视图提供：展开位图和JSON明细需要
+        各数据库不同的函数（json_each、jsonb_array_elements、位运算），
+        无法用一个可移植的 CREATE VIEW 表达。
+        """
+        query = QuizAttempt.query
+        if quiz_id is not None:
+            query = query.filter(QuizAttempt.quiz_id == quiz_id)
+        if user_id is not None:
+            query = query.filter(QuizAttempt.user_id == user_id)
+        for attempt in query.order_by(QuizAttempt.id).yield_per(batch_size):
+            yield from attempt.answer_rows()
+
+    @staticmethod
+    def compact_answers(keep=False, batch_size=200):
+        """
+        将历史 QuizAnswer 逐题记录合并为 QuizAttempt
+
+        同一用户同一测验的记录按ID顺序分组，题目重复出现或与上一题
+        间隔超过一小时即视为新的一次提交。总分按题目当前分值计算。
+
+        Args:
+            keep: 是否保留原 QuizAnswer 记录
+            batch_size: 每个事务处理的用户数
+
+        Returns:
+            (生成的提交记录数, 处理的答题记录数)
+        """
+        points_by_question = dict(db.session.query(QuizQuestion.id, QuizQuestion.points).all())
+        passing = dict(db.session.query(Quiz.id, Quiz.passing_score).all())
+
+        def build(group):
+            earned = sum(r.points_earned or 0 for r in group)
+            total = sum(points_by_question.get(r.question_id) or 0 for r in group)
+            score = int(earned / total * 100) if total > 0 else 0
+            spent = [r.time_spent for r in group if r.time_spent is not None]
+            return {
+                'user_id': group[0].user_id,
+                'quiz_id': group[0].quiz_id,
+                'quiz_version': None,
+                'question_count': len(group),
+                'correct_bits': pack_bits([bool(r.is_correct) for r in group]),
+                'earned_points': earned,
+                'total_points': total,
+                'score': score,
+                'passed': score >= (passing.get(group[0].quiz_id) or 0),
+                'payload': {
+                    'question_ids': [r.question_id for r in group],
+                    'answers': [r.user_answer for r in group],
+                    'points': [r.points_earned or 0 for r in group]
+                },
+                'started_at': group[0].answered_at,
+                'submitted_at': group[-1].answered_at,
+                'time_spent': sum(spent) if spent else None
+            }
+
+        def split(rows):
+            group, seen = [], set()
+            for row in rows:
+                if group and (
+                    (row.user_id, row.quiz_id) != (group[0].user_id, group[0].quiz_id)
+                    or row.question_id in seen
+                    or (row.answered_at and group[-1].answered_at and
+                        (row.answered_at - group[-1].answered_at).total_seconds() > 3600)
+                ):
+                    yield group
+                    group, seen = [], set()
+                group.append(row)
+                seen.add(row.question_id)
+            if group:
+                yield group
+
+        # 按用户分批处理，同一次提交不会跨批次
+        user_ids = [r[0] for r in db.session.query(QuizAnswer.user_id).distinct()
+                    .order_by(QuizAnswer.user_id).all()]
+        attempts = 0
+        processed = 0
+        for start in range(0, len(user_ids), batch_size):
+            rows = db.session.query(
+                QuizAnswer.id, QuizAnswer.user_id, QuizAnswer.quiz_id, QuizAnswer.question_id,
+                QuizAnswer.user_answer, QuizAnswer.is_correct, QuizAnswer.points_earned,
+                QuizAnswer.answered_at, QuizAnswer.time_spent
+            ).filter(QuizAnswer.user_id.in_(user_ids[start:start + batch_size]))\
+                .order_by(QuizAnswer.user_id, QuizAnswer.quiz_id, QuizAnswer.id).all()
+            if not rows:
+                continue
+
+            records = [build(group) for group in split(rows)]
+            db.session.execute(QuizAttempt.__table__.insert(), records)
+            if not keep:
+                ids = [r.id for r in rows]
+                for i in range(0, len(ids), 500):
+                    db.session.execute(QuizAnswer.__table__.delete()
+                                       .where(QuizAnswer.__table__.c.id.in_(ids[i:i + 500])))
+            db.session.commit()
+            attempts += len(records)
+            processed += len(rows)
+
+        return attempts, processed
+
+
+class QuizQuestionStats(db.Model):
+    """
+    题目统计（随评分增量维护）
+
+    total 指所在提交的百分制得分，用于计算点二列区分度。
+    """
+
+    __tablename__ = 'quiz_question_stats'
+
+    question_id = db.Column(db.Integer, db.ForeignKey('quiz_questions.id'), primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False, index=True)
+
+    n = db.Column(db.Integer, default=0, nullable=False)  # 作答次数
+    n_correct = db.Column(db.Integer, default=0, nullable=False)  # 答对次数
+    sum_total = db.Column(db.Float, default=0.0, nullable=False)  # Σ total
+    sum_sq = db.Column(db.Float, default=0.0, nullable=False)  # Σ total²
+    sum_total_correct = db.Column(db.Float, default=0.0, nullable=False)  # 答对者的 Σ total
+    option_counts = db.Column(db.JSON)  # {选项: 被选次数}
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<QuizQuestionStats question={self.question_id} n={self.n}>'
+
+
 class UserProgress(db.Model):
     """用户学习进度模型"""
 
     __tablename__ = 'user_progress'
 
+    # 复合索引：支持按用户查找进度及"是否已完成"的反连接
+    __table_args__ = (
+        db.Index('ix_user_progress_user_module', 'user_id', 'module_id'),
+    )
+
     # 基本信息
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -288,22 +571,24 @@ class UserProgress(db.Model):
         self.last_accessed = datetime.utcnow()
 
         if self.progress >= 100 and not self.completed:
-            self.complete()
+            self.complete(commit=False)
 
         db.session.commit()
 
-    def complete(self):
-        """标记为完成"""
+    def complete(self, commit=True):
+        """标记为完成（commit=False 时随调用方的事务一起提交）"""
         self.completed = True
         self.completed_at = datetime.utcnow()
         self.progress = 100
 
         # 增加用户积分
         if self.user and self.module:
-            self.user.add_points(self.module.points_reward)
-            self.module.increment_completion()
+            self.user.add_points(self.module.points_reward, source='module_complete',
+                                 reference_id=self.module_id)
+            self.module.increment_completion(commit=False)
 
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
     def add_time(self, minutes):
         """增加学习时长"""
@@ -0,0 +1,115 @@
+"""
+积分流水模型 - 只追加的积分变动记录
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+
+# 每100积分升1级
+POINTS_PER_LEVEL = 100
+
+
+class PointsLedger(db.Model):
+    """积分流水（用户积分余额应等于其流水之和）"""
+
+    __tablename__ = 'points_ledger'
+
+    __table_args__ = (
+        db.Index('ix_points_ledger_user', 'user_id', 'created_at'),
+        db.Index('ix_points_ledger_source', 'source', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    points = db.Column(db.Integer, nullable=False)
+    source = db.Column(db.String(50), nullable=False)  # comment, rating, quiz_pass, module_complete, opening...
+    reference_id = db.Column(db.Integer)  # 关联对象ID（评论、测验等）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    user = db.relationship('User', backref=db.backref('points_entries', lazy='dynamic'))
+
+    def __repr__(self):
+        return f'<PointsLedger user={self.user_id} {self.points:+d} {self.source}>'
+
+    @staticmethod
+    def ledger_cutoff():
+        """
+        积分流水的启用时间
+
+        取配置 POINTS_LEDGER_CUTOFF（ISO格式），未配置时取最早一条非期初流水的时间；
+        还没有任何流水时返回 None。
+        """
+        cutoff = current_app.config.get('POINTS_LEDGER_CUTOFF')
+        if cutoff:
+            return cutoff if isinstance(cutoff, datetime) else datetime.fromisoformat(cutoff)
+        return db.session.query(db.func.min(PointsLedger.created_at))\
+            .filter(PointsLedger.source != 'opening').scalar()
+
+    @staticmethod
+    def reconcile(fix=False):
+        """
+        按流水校验用户积分余额
+
+        流水启用前注册、还没有 opening 期初记录的老用户先写入一条，金额为
+        当前余额减去已有流水之和：流水启用前获得的积分（包括启用后又获得过
+        积分的老用户）由期初记录承接，不会被修正掉。流水启用后注册的用户
+        余额从0开始，不写期初记录，余额与流水之和不一致即视为异常。
+        首次对账为老用户建立基线，应在部署后尽早执行一次。
+
+        Args:
+            fix: 是否将余额和等级修正为按流水计算的值（不提交）
+
+        Returns:
+            (写入的期初记录数, [(用户ID, 记录余额, 流水之和), ...])
+        """
+        from app.models.user import User
+
+        # 余额和流水之和在同一条语句中读取，与并发的积分变动保持一致
+        ledger_sum = db.session.query(db.func.coalesce(db.func.sum(PointsLedger.points), 0))\
+            .filter(PointsLedger.user_id == User.id).scalar_subquery()
+        has_opening = db.session.query(PointsLedger.id).filter(
+            PointsLedger.user_id == User.id,
+            PointsLedger.source == 'opening'
+        ).exists()
+
+        query = db.session.query(User.id, User.points, ledger_sum).filter(~has_opening)
+        cutoff = PointsLedger.ledger_cutoff()
+        if cutoff is not None:
+            query = query.filter(User.created_at < cutoff)
+        openings = query.all()
+        if openings:
+            now = datetime.utcnow()
+            db.session.execute(PointsLedger.__table__.insert(), [
+                {'user_id': user_id, 'points': (points or 0) - int(total), 'source': 'opening',
+                 'created_at': now}
+                for user_id, points, total in openings
+            ])
+
+        mismatches = []
+        for user_id, stored, expected in db.session.query(User.id, User.points, ledger_sum).all():
+            expected = int(expected)
+            if (stored or 0) != expected:
+                mismatches.append((user_id, stored, expected))
+                if fix:
+                    User.query.filter_by(id=user_id).update({
+                        User.points: expected,
+                        User.level: expected // POINTS_PER_LEVEL + 1
+                    }, synchronize_session=False)
+        return len(openings), mismatches
+
+    @staticmethod
+    def source_stats(days=None):
+        """按来源统计发放次数、积分总数和涉及用户数"""
+        query = db.session.query(
+            PointsLedger.source,
+            db.func.count(PointsLedger.id),
+            db.func.sum(PointsLedger.points),
+            db.func.count(db.func.distinct(PointsLedger.user_id))
+        )
+        if days:
+            query = query.filter(PointsLedger.created_at >= datetime.utcnow() - timedelta(days=days))
+        return [
+            {'source': source, 'awards': count, 'points': int(total or 0), 'users': users}
+            for source, count, total, users in
+            query.group_by(PointsLedger.source).order_by(db.func.sum(PointsLedger.points).desc()).all()
+        ]
@@ -0,0 +1,32 @@
+"""
+互动模型 - 记录用户对故事和评论的点赞/踩
+"""
+from datetime import datetime
+from app import db
+
+
+class Reaction(db.Model):
+    """用户互动记录（每个用户对同一对象的同一种互动只记录一次）"""
+
+    __tablename__ = 'reactions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    # 互动对象
+    target_type = db.Column(db.String(20), nullable=False)  # story, comment
+    target_id = db.Column(db.Integer, nullable=False)
+
+    # 互动类型
+    kind = db.Column(db.String(20), nullable=False)  # like, dislike
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'target_type', 'target_id', 'kind',
+                            name='unique_user_reaction'),
+        db.Index('ix_reactions_target', 'target_type', 'target_id'),
+    )
+
+    def __repr__(self):
+        return f'<Reaction {self.kind} {self.target_type}={self.target_id} by User {self.user_id}>'
@@ -45,6 +45,8 @@ class Story(db.Model):
     view_count = db.Column(db.Integer, default=0)
     like_count = db.Column(db.Integer, default=0)
     share_count = db.Column(db.Integer, default=0)
+    comment_count = db.Column(db.Integer, default=0, nullable=False)  # 可见评论数（冗余计数）
+    trending_score = db.Column(db.Float, index=True)  # 对数形式的时间衰减趋势分数
 
     # 状态
     is_published = db.Column(db.Boolean, default=True)
@@ -94,7 +96,7 @@ class Story(db.Model):
             'duration': self.duration,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'average_rating': self.get_average_rating(),
-            'total_comments': self.comments.count()
+            'total_comments': self.comment_count or 0
         }
 
         if include_content:
@@ -107,13 +109,15 @@ class Story(db.Model):
 
     def get_average_rating(self):
         """获取平均评分"""
+        from app.models.rating import Rating
         avg = db.session.query(db.func.avg(Rating.score)).filter_by(story_id=self.id).scalar()
         return round(avg, 2) if avg else 0
 
-    def increment_view(self):
+    def increment_view(self, commit=True):
         """增加浏览次数"""
         self.view_count += 1
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
     def increment_like(self):
         """增加点赞次数"""
@@ -134,10 +138,9 @@ class Story(db.Model):
 
     @staticmethod
     def get_popular_stories(limit=10):
-        """获取热门故事"""
-        return Story.query.filter_by(is_published=True)\
-                         .order_by(Story.view_count.desc())\
-                         .limit(limit).all()
+        """获取热门故事（读取预计算的热门快照）"""
+        from app.services.popularity import get_popular_stories
+        return get_popular_stories(limit=limit)
 
 
 class Scene(db.Model):
@@ -0,0 +1,28 @@
+"""
+令牌模型 - 已吊销的JWT
+"""
+from datetime import datetime
+from app import db
+
+
+class RevokedToken(db.Model):
+    """已吊销的令牌（按 jti 记录，过期后可清理）"""
+
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    token_type = db.Column(db.String(20), nullable=False)  # access, refresh
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
+
+    @staticmethod
+    def purge_expired(now=None):
+        """删除已过期的吊销记录（不提交），返回删除数"""
+        now = now or datetime.utcnow()
+        return RevokedToken.query.filter(RevokedToken.expires_at < now)\
+            .delete(synchronize_session=False)
@@ -2,10 +2,29 @@
 用户模型 - 管理用户账户和认证
 """
 from datetime import datetime
+from functools import lru_cache
+from flask import current_app, has_app_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.orm.attributes import set_committed_value
 from app import db
 
+# 未配置 PASSWORD_HASH_METHOD 时使用的哈希方法
+DEFAULT_PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+
+
+def password_hash_method():
+    """当前配置的密码哈希方法"""
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_PASSWORD_HASH_METHOD)
+    return DEFAULT_PASSWORD_HASH_METHOD
+
+
+@lru_cache(maxsize=None)
+def _hash_prefix(method):
+    """哈希方法对应的完整前缀（补全省略的默认参数，如 'scrypt' -> 'scrypt:32768:8:1'）"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
 
 class User(UserMixin, db.Model):
     """用户模型"""
@@ -28,6 +47,7 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     is_admin = db.Column(db.Boolean, default=False)
     email_verified = db.Column(db.Boolean, default=False)
+    token_version = db.Column(db.Integer, default=0, nullable=False)  # 递增后已签发的令牌失效
 
     # 偏好设置
     language = db.Column(db.String(10), default='zh_CN')
@@ -52,22 +72,75 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
     def set_password(self, password):
-        """设置密码哈希"""
-        self.password_hash = generate_password_hash(password)
+        """按当前配置的哈希方法设置密码哈希（算法和代价记录在哈希串前缀中）"""
+        self.password_hash = generate_password_hash(password, method=password_hash_method())
 
     def check_password(self, password):
         """验证密码"""
         return check_password_hash(self.password_hash, password)
 
-    def add_points(self, points):
-        """增加积分并更新等级"""
-        self.points += points
-        # 简单的等级计算：每100积分升1级
-        new_level = (self.points // 100) + 1
-        if new_level > self.level:
-            self.level = new_level
-            return True  # 表示升级了
-        return False
+    def revoke_tokens(self):
+        """使已签发的全部令牌失效（不提交）"""
+        self.token_version = (self.token_version or 0) + 1
+
+    def password_needs_rehash(self):
+        """密码哈希的算法或代价与当前配置不一致时返回 True"""
+        if not self.password_hash:
+            return False
+        return self.password_hash.split('$', 1)[0] != _hash_prefix(password_hash_method())
+
+    def add_points(self, points, source='other', reference_id=None):
+        """
+        增加积分并更新等级（不提交事务）
+
+        余额和等级由一条 UPDATE 在数据库中原子计算，并发发放不会丢失更新；
+        同时追加一条积分流水。每100积分升1级，等级只升不降。
+
+        Returns:
+            是否升级
+        """
+        from app.models.points import PointsLedger, POINTS_PER_LEVEL
+
+        if self.id is None:
+            # 尚未写入数据库的新用户直接修改属性
+            self.points = (self.points or 0) + points
+            new_level = self.points // POINTS_PER_LEVEL + 1
+            leveled_up = new_level > (self.level or 1)
+            self.level = max(self.level or 1, new_level)
+            db.session.add(PointsLedger(user=self, points=points, source=source,
+                                        reference_id=reference_id))
+            return leveled_up
+
+        users = User.__table__
+        new_points = users.c.points + points
+        derived_level = new_points // POINTS_PER_LEVEL + 1
+        old_level = self.level
+        stmt = users.update().where(users.c.id == self.id).values(
+            points=new_points,
+            level=db.case((derived_level > users.c.level, derived_level), else_=users.c.level)
+        )
+        if db.engine.dialect.update_returning:
+            balance, level = db.session.execute(stmt.returning(users.c.points, users.c.level)).one()
+        else:
+            db.session.execute(stmt)
+            balance, level = db.session.execute(
+                db.select(users.c.points, users.c.level).where(users.c.id == self.id)
+            ).one()
+        db.session.execute(PointsLedger.__table__.insert().values(
+            user_id=self.id, points=points, source=source, reference_id=reference_id,
+            created_at=datetime.utcnow()
+        ))
+
+        # 同步内存中的属性，不产生额外的查询或脏标记
+        set_committed_value(self, 'points', balance)
+        set_committed_value(self, 'level', level)
+
+        # 登记变动，提交后由排行榜增量应用，并使用户快照失效
+        db.session.info.setdefault('points_changes', []).append(
+            (self.id, points, source, datetime.utcnow()))
+        from app.services.user_cache import mark_user_dirty
+        mark_user_dirty(db.session, self.id)
+        return level > (old_level or 1)
 
     def to_dict(self, include_email=False):
         """转换为字典"""
@@ -97,25 +170,13 @@ class User(UserMixin, db.Model):
         db.session.add(user)
         return user
 
-    def update_last_login(self):
-        """更新最后登录时间"""
+    def update_last_login(self, commit=True):
+        """更新最后登录时间（commit=False 时随调用方的事务一起提交）"""
         self.last_login = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
     def get_learning_stats(self):
-        """获取学习统计"""
-        completed_modules = UserProgress.query.filter_by(
-            user_id=self.id,
-            completed=True
-        ).count()
-
-        total_progress = db.session.query(
-            db.func.avg(UserProgress.progress)
-        ).filter_by(user_id=self.id).scalar() or 0
-
-        return {
-            'completed_modules': completed_modules,
-            'average_progress': round(total_progress, 2),
-            'total_comments': self.comments.count(),
-            'total_ratings': self.ratings.count()
-        }
+        """获取学习统计（单条聚合查询，按用户缓存）"""
+        from app.services.user_stats import get_learning_stats
+        return get_learning_stats(self.id)
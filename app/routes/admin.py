@@ -6,7 +6,7 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import (User, Story, LearningModule, Character, Comment,
                        Quiz, QuizQuestion, UserActivity, ContentView)
-from app.utils.decorators import admin_required
+from app.utils.decorators import admin_required, multiple_commits_allowed
 from app.utils.helpers import generate_slug
 from datetime import datetime, timedelta
 
@@ -60,7 +60,11 @@ def users_list():
     query = User.query.order_by(User.created_at.desc())
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
 
-    return render_template('admin/users/list.html', pagination=pagination)
+    # 当前页用户的学习统计（一次批量查询）
+    from app.services.user_stats import get_learning_stats_batch
+    stats = get_learning_stats_batch([user.id for user in pagination.items])
+
+    return render_template('admin/users/list.html', pagination=pagination, stats=stats)
 
 
 @bp.route('/users/<int:user_id>/toggle-active', methods=['POST'])
@@ -73,6 +77,8 @@ def toggle_user_active(user_id):
         return redirect(url_for('admin.users_list'))
 
     user.is_active = not user.is_active
+    if not user.is_active:
+        user.revoke_tokens()  # 已签发的令牌在写操作上立即失效
     db.session.commit()
 
     status = '激活' if user.is_active else '禁用'
@@ -256,7 +262,7 @@ def comments_list():
 def approve_comment(comment_id):
     """批准评论"""
     comment = Comment.query.get_or_404(comment_id)
-    comment.is_approved = True
+    comment.approve()
     db.session.commit()
     flash('评论已批准', 'success')
     return redirect(url_for('admin.comments_list'))
@@ -271,6 +277,62 @@ def delete_comment(comment_id):
     return redirect(url_for('admin.comments_list'))
 
 
+@bp.route('/comments/bulk', methods=['POST'])
+@multiple_commits_allowed
+def bulk_moderate_comments():
+    """
+    批量审核评论
+
+    请求体: {"action": "approve|delete|restore",
+             "ids": [...] 或 "filter": {"user_id", "story_id", "module_id",
+                                        "since", "until", "pattern"}}
+    """
+    from app.services.moderation import build_comment_filter, bulk_moderate
+
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    filters = data.get('filter') or {}
+
+    try:
+        conditions = build_comment_filter(ids=data.get('ids'), **filters)
+        result = bulk_moderate(action, conditions)
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'error': '批量审核参数无效', 'message': str(e)}), 400
+
+    return jsonify(result), 200
+
+
+@bp.route('/comments/antispam-stats')
+def antispam_stats():
+    """评论防刷统计"""
+    from app.services.antispam import get_comment_guard
+    return jsonify(get_comment_guard().get_stats()), 200
+
+
+# ==================== 测验分析 ====================
+@bp.route('/quizzes/<int:quiz_id>/item-analysis')
+def quiz_item_analysis(quiz_id):
+    """测验题目分析：作答次数、正确率、区分度和选项分布（读取预计算统计）"""
+    from app.services.item_analysis import get_item_analysis
+
+    quiz = Quiz.query.get_or_404(quiz_id)
+    return jsonify({
+        'quiz_id': quiz.id,
+        'title': quiz.title,
+        'items': get_item_analysis(quiz)
+    }), 200
+
+
+# ==================== 积分统计 ====================
+@bp.route('/points/sources')
+def points_sources():
+    """按来源统计积分发放"""
+    from app.models import PointsLedger
+    days = request.args.get('days', type=int)
+    return jsonify({'days': days, 'sources': PointsLedger.source_stats(days)}), 200
+
+
 # ==================== 数据分析 ====================
 @bp.route('/analytics')
 def analytics():
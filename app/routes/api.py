@@ -2,17 +2,45 @@
 API路由 - RESTful API接口
 """
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from app import db
 from app.models import (User, Story, LearningModule, Character, Comment,
                        Rating, UserProgress, UserActivity, ContentView)
-from app.utils.decorators import validate_pagination, json_required
-from app.utils.helpers import paginate
+from app.utils.decorators import validate_pagination, json_required, jwt_claims_required, jwt_required_custom
+from app.services.tokens import jwt_user_id
+from app.utils.helpers import paginate, keyset_order, keyset_paginate
 from datetime import datetime, timedelta
 
 bp = Blueprint('api', __name__)
 
 
+def list_response(query, order_by, page, per_page, serialize):
+    """
+    列表分页响应
+
+    请求带 cursor 参数（首页可传空值）时使用键集分页，翻页代价与页数无关；
+    否则沿用页码分页。总数通过 include_total 控制，页码分页默认统计，
+    游标分页默认不统计。
+    """
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total')
+
+    try:
+        if cursor is not None:
+            with_total = (include_total or 'false').lower() == 'true'
+            result = keyset_paginate(query, order_by, cursor=cursor,
+                                     per_page=per_page, with_total=with_total)
+        else:
+            with_total = (include_total or 'true').lower() == 'true'
+            query = query.order_by(*keyset_order(order_by))
+            result = paginate(query, page, per_page, with_total=with_total)
+    except ValueError as e:
+        return jsonify({'error': '无效的分页参数', 'message': str(e)}), 400
+
+    result['items'] = [serialize(item) for item in result['items']]
+    return jsonify(result), 200
+
+
 # ==================== 故事API ====================
 @bp.route('/stories', methods=['GET'])
 @validate_pagination
@@ -29,12 +57,8 @@ def get_stories(page, per_page):
     if featured:
         query = query.filter_by(is_featured=True)
 
-    query = query.order_by(Story.created_at.desc())
-
-    result = paginate(query, page, per_page)
-    result['items'] = [story.to_dict(language=language) for story in result['items']]
-
-    return jsonify(result), 200
+    return list_response(query, [(Story.created_at, True), (Story.id, True)], page, per_page,
+                         lambda story: story.to_dict(language=language))
 
 
 @bp.route('/stories/<int:story_id>', methods=['GET'])
@@ -60,12 +84,138 @@ def get_story_comments(story_id, page, per_page):
         is_deleted=False,
         is_approved=True,
         parent_id=None
-    ).order_by(Comment.created_at.desc())
+    )
 
-    result = paginate(query, page, per_page)
-    result['items'] = [comment.to_dict() for comment in result['items']]
+    return list_response(query, [(Comment.created_at, True), (Comment.id, True)], page, per_page,
+                         lambda comment: comment.to_dict())
 
-    return jsonify(result), 200
+
+def _comment_tree_response(story_id=None, module_id=None):
+    """按游标返回评论树"""
+    from app.services.comments import load_comment_tree
+    try:
+        depth = min(max(int(request.args.get('depth', 2)), 0), 5)
+        limit = min(max(int(request.args.get('limit', 20)), 1), 50)
+        tree = load_comment_tree(story_id=story_id, module_id=module_id, depth=depth,
+                                 cursor=request.args.get('cursor'), limit=limit)
+    except ValueError as e:
+        return jsonify({'error': '无效的分页参数', 'message': str(e)}), 400
+    return jsonify(tree), 200
+
+
+@bp.route('/stories/<int:story_id>/comments/tree', methods=['GET'])
+def get_story_comment_tree(story_id):
+    """获取故事评论树（顶级评论及多层回复，游标分页）"""
+    Story.query.get_or_404(story_id)
+    return _comment_tree_response(story_id=story_id)
+
+
+# ==================== 互动API ====================
+@bp.route('/comments/<int:comment_id>/reactions', methods=['POST'])
+@jwt_required_custom
+def react_to_comment(comment_id, current_user):
+    """点赞或踩评论（每个用户每种互动只计一次）"""
+    from app.services.reactions import get_reaction_buffer
+
+    comment = Comment.query.get_or_404(comment_id)
+    kind = (request.get_json(silent=True) or {}).get('kind', 'like')
+    if kind not in ('like', 'dislike'):
+        return jsonify({'error': '互动类型必须是 like 或 dislike'}), 400
+
+    buffer = get_reaction_buffer()
+    if not buffer.add(current_user.id, 'comment', comment.id, kind):
+        return jsonify({'error': '已经互动过了'}), 409
+
+    db.session.refresh(comment)
+    return jsonify({
+        'message': '互动成功',
+        'like_count': comment.like_count + buffer.pending_count('comment', comment.id, 'like'),
+        'dislike_count': comment.dislike_count + buffer.pending_count('comment', comment.id, 'dislike')
+    }), 200
+
+
+@bp.route('/reactions/mine', methods=['GET'])
+@jwt_claims_required
+def get_my_reactions():
+    """批量查询当前用户对一组对象的互动，用于渲染列表"""
+    from app.services.reactions import get_user_reactions
+
+    target_type = request.args.get('target_type', 'story')
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i][:200]
+    except ValueError:
+        return jsonify({'error': '无效的ID列表'}), 400
+
+    reacted = get_user_reactions(jwt_user_id(), target_type, ids)
+    return jsonify({
+        'target_type': target_type,
+        'reactions': {str(target_id): sorted(kinds) for target_id, kinds in reacted.items()}
+    }), 200
+
+
+# ==================== 排行榜API ====================
+def _leaderboard_entries(rows):
+    """将 (名次, 用户ID, 积分) 行补齐用户信息（一次批量查询）"""
+    users = {u.id: u for u in User.query.filter(User.id.in_([r[1] for r in rows])).all()} if rows else {}
+    return [{
+        'rank': rank,
+        'user_id': user_id,
+        'username': users[user_id].username if user_id in users else None,
+        'nickname': (users[user_id].nickname or users[user_id].username) if user_id in users else None,
+        'points': points
+    } for rank, user_id, points in rows]
+
+
+def _leaderboard_args():
+    window = request.args.get('window', 'all')
+    if window not in ('all', 'weekly'):
+        raise ValueError('window 必须是 all 或 weekly')
+    source = request.args.get('source') or None
+    if source and window != 'all':
+        raise ValueError('分类排行只支持总榜')
+    return window, source
+
+
+@bp.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """排行榜前N名（window=all|weekly，source=积分来源）"""
+    from app.services.leaderboard import get_leaderboard as load_board
+    try:
+        window, source = _leaderboard_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+
+    board = load_board(window, source)
+    return jsonify({
+        'window': window,
+        'source': source,
+        'total': len(board),
+        'items': _leaderboard_entries(board.top(limit))
+    }), 200
+
+
+@bp.route('/leaderboard/me', methods=['GET'])
+@jwt_claims_required
+def get_my_rank():
+    """当前用户的名次及前后相邻的用户"""
+    from app.services.leaderboard import get_leaderboard as load_board
+    try:
+        window, source = _leaderboard_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    radius = min(max(request.args.get('radius', 5, type=int), 0), 25)
+
+    user_id = jwt_user_id()
+    board = load_board(window, source)
+    return jsonify({
+        'window': window,
+        'source': source,
+        'total': len(board),
+        'rank': board.rank(user_id),
+        'points': board.score(user_id),
+        'neighbors': _leaderboard_entries(board.around(user_id, radius))
+    }), 200
 
 
 # ==================== 学习模块API ====================
@@ -84,12 +234,13 @@ def get_modules(page, per_page):
     if difficulty:
         query = query.filter_by(difficulty_level=int(difficulty))
 
-    query = query.order_by(LearningModule.order, LearningModule.created_at.desc())
-
-    result = paginate(query, page, per_page)
-    result['items'] = [module.to_dict(language=language) for module in result['items']]
-
-    return jsonify(result), 200
+    order_by = [
+        (LearningModule.order, False),
+        (LearningModule.created_at, True),
+        (LearningModule.id, True)
+    ]
+    return list_response(query, order_by, page, per_page,
+                         lambda module: module.to_dict(language=language))
 
 
 @bp.route('/modules/<int:module_id>', methods=['GET'])
@@ -104,6 +255,13 @@ def get_module(module_id):
     return jsonify(module.to_dict(include_content=True, language=language)), 200
 
 
+@bp.route('/modules/<int:module_id>/comments/tree', methods=['GET'])
+def get_module_comment_tree(module_id):
+    """获取学习模块评论树（顶级评论及多层回复，游标分页）"""
+    LearningModule.query.get_or_404(module_id)
+    return _comment_tree_response(module_id=module_id)
+
+
 # ==================== 角色API ====================
 @bp.route('/characters', methods=['GET'])
 @validate_pagination
@@ -111,13 +269,10 @@ def get_characters(page, per_page):
     """获取角色列表"""
     language = request.args.get('language', 'zh_CN')
 
-    query = Character.query.filter_by(is_active=True)\
-        .order_by(Character.popularity_score.desc())
+    query = Character.query.filter_by(is_active=True)
 
-    result = paginate(query, page, per_page)
-    result['items'] = [char.to_dict(language=language) for char in result['items']]
-
-    return jsonify(result), 200
+    return list_response(query, [(Character.popularity_score, True), (Character.id, True)],
+                         page, per_page, lambda char: char.to_dict(language=language))
 
 
 @bp.route('/characters/<int:character_id>', methods=['GET'])
@@ -138,13 +293,11 @@ def get_user(user_id):
 
 
 @bp.route('/users/<int:user_id>/progress', methods=['GET'])
-@jwt_required()
+@jwt_claims_required
 def get_user_progress(user_id):
     """获取用户学习进度"""
-    current_user_id = get_jwt_identity()
-
-    # 只能查看自己的进度
-    if current_user_id != user_id:
+    # 只能查看自己的进度（身份在令牌中，比较前不需要查询用户）
+    if jwt_user_id() != user_id:
         return jsonify({'error': '无权访问'}), 403
 
     progress_list = UserProgress.query.filter_by(user_id=user_id).all()
@@ -156,11 +309,21 @@ def get_user_progress(user_id):
 @bp.route('/users/<int:user_id>/stats', methods=['GET'])
 def get_user_stats(user_id):
     """获取用户统计数据"""
-    user = User.query.get_or_404(user_id)
-    stats = user.get_learning_stats()
+    from app.services.user_stats import get_learning_stats
+    stats = get_learning_stats(user_id)
+    if stats is None:
+        return jsonify({'error': '资源未找到'}), 404
     return jsonify(stats), 200
 
 
+@bp.route('/users/<int:user_id>/achievements', methods=['GET'])
+def get_user_achievements(user_id):
+    """获取用户已获得的成就"""
+    from app.services.achievements import get_user_achievements
+    User.query.get_or_404(user_id)
+    return jsonify({'achievements': get_user_achievements(user_id)}), 200
+
+
 # ==================== 搜索API ====================
 @bp.route('/search', methods=['GET'])
 def search():
@@ -203,7 +366,7 @@ def search():
 @jwt_required(optional=True)
 def get_recommendations():
     """获取推荐内容"""
-    current_user_id = get_jwt_identity()
+    current_user_id = jwt_user_id()
     limit = int(request.args.get('limit', 10))
     language = request.args.get('language', 'zh_CN')
 
@@ -212,14 +375,13 @@ def get_recommendations():
         from app.services.recommendation import get_personalized_recommendations
         recommendations = get_personalized_recommendations(current_user_id, limit)
     else:
-        # 未登录用户 - 推荐热门内容
+        # 未登录用户 - 推荐热门内容（读取预计算的热门快照）
+        from app.services.popularity import get_popular_stories, get_popular_modules
         recommendations = {
             'stories': [s.to_dict(language=language)
-                       for s in Story.get_popular_stories(limit=limit)],
+                       for s in get_popular_stories(limit=limit)],
             'modules': [m.to_dict(language=language)
-                       for m in LearningModule.query.filter_by(is_published=True)
-                       .order_by(LearningModule.enrollment_count.desc())
-                       .limit(limit).all()]
+                       for m in get_popular_modules(limit=limit)]
         }
 
     return jsonify(recommendations), 200
@@ -242,20 +404,13 @@ def get_platform_stats():
 
 @bp.route('/stats/trending', methods=['GET'])
 def get_trending():
-    """获取趋势数据"""
-    days = int(request.args.get('days', 7))
+    """获取趋势数据（按增量维护的衰减趋势分数索引读取）"""
+    from app.services import trending
     language = request.args.get('language', 'zh_CN')
+    limit = min(int(request.args.get('limit', 10)), 50)
 
-    # 获取热门内容
-    popular_stories = ContentView.get_popular_content('story', limit=10, days=days)
-    popular_modules = ContentView.get_popular_content('module', limit=10, days=days)
-
-    # 获取详细信息
-    story_ids = [item['story_id'] for item in popular_stories]
-    module_ids = [item['module_id'] for item in popular_modules]
-
-    stories = Story.query.filter(Story.id.in_(story_ids)).all()
-    modules = LearningModule.query.filter(LearningModule.id.in_(module_ids)).all()
+    stories = trending.get_top(Story, limit=limit)
+    modules = trending.get_top(LearningModule, limit=limit)
 
     return jsonify({
         'trending_stories': [s.to_dict(language=language) for s in stories],
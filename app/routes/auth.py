@@ -3,9 +3,12 @@
 """
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session
 from flask_login import login_user, logout_user, current_user, login_required
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt
 from app import db
 from app.models import User, UserActivity
+from app.services.tokens import create_tokens, token_claims, token_version_matches, revoke_token
+from app.services.activity_log import queue_activity
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 import re
 
@@ -53,15 +56,11 @@ def register():
             errors.append('用户名不能为空')
         elif not is_valid_username(username):
             errors.append('用户名格式无效（3-20个字符，只能包含字母、数字、下划线）')
-        elif User.query.filter_by(username=username).first():
-            errors.append('用户名已存在')
 
         if not email:
             errors.append('邮箱不能为空')
         elif not is_valid_email(email):
             errors.append('邮箱格式无效')
-        elif User.query.filter_by(email=email).first():
-            errors.append('邮箱已被注册')
 
         if not password:
             errors.append('密码不能为空')
@@ -77,7 +76,7 @@ def register():
                 flash(error, 'danger')
             return render_template('auth/register.html')
 
-        # 创建用户
+        # 创建用户：用户名和邮箱的唯一性由唯一约束保证，不预先查询
         try:
             user = User.create_user(
                 username=username,
@@ -85,23 +84,23 @@ def register():
                 password=password,
                 nickname=username
             )
+            db.session.flush()
+
+            # 响应内容在提交前生成，提交后不必重新加载用户
+            if request.is_json:
+                user_data = user.to_dict()
+                access_token, refresh_token = create_tokens(user)
+            user_id = user.id
             db.session.commit()
 
-            # 记录活动
-            UserActivity.log_activity(
-                user_id=user.id,
-                activity_type='register',
-                details={'username': username},
-                request=request
-            )
+            # 记录活动（批量写入）
+            queue_activity(user_id, 'register', {'username': username}, request=request)
 
             if request.is_json:
                 # API响应
-                access_token = create_access_token(identity=user.id)
-                refresh_token = create_refresh_token(identity=user.id)
                 return jsonify({
                     'message': '注册成功',
-                    'user': user.to_dict(),
+                    'user': user_data,
                     'access_token': access_token,
                     'refresh_token': refresh_token
                 }), 201
@@ -110,6 +109,13 @@ def register():
                 flash('注册成功！请登录', 'success')
                 return redirect(url_for('auth.login'))
 
+        except IntegrityError as e:
+            db.session.rollback()
+            error = '邮箱已被注册' if 'email' in str(e.orig).lower() else '用户名已存在'
+            if request.is_json:
+                return jsonify({'error': [error]}), 400
+            flash(error, 'danger')
+            return render_template('auth/register.html')
         except Exception as e:
             db.session.rollback()
             if request.is_json:
@@ -151,7 +157,17 @@ def login():
             (User.username == username_or_email) | (User.email == username_or_email)
         ).first()
 
-        if not user or not user.check_password(password):
+        # 在有界线程池中校验密码，繁忙时快速失败而不是排队
+        from app.services.passwords import verify_password, VerifierBusy
+        try:
+            password_ok = verify_password(user, password)
+        except VerifierBusy:
+            if request.is_json:
+                return jsonify({'error': '登录人数过多，请稍后重试'}), 503, {'Retry-After': '1'}
+            flash('登录人数过多，请稍后重试', 'warning')
+            return render_template('auth/login.html'), 503, {'Retry-After': '1'}
+
+        if not password_ok:
             if request.is_json:
                 return jsonify({'error': '用户名或密码错误'}), 401
             flash('用户名或密码错误', 'danger')
@@ -163,34 +179,39 @@ def login():
             flash('账户已被禁用，请联系管理员', 'danger')
             return render_template('auth/login.html')
 
-        # 登录成功
-        user.update_last_login()
+        # 登录成功：登录时间和（哈希方法或代价变更时的）新哈希在一条 UPDATE 中提交
+        if user.password_needs_rehash():
+            user.set_password(password)
+        user.update_last_login(commit=False)
+
+        # 响应内容和登录状态在提交前生成，提交后不必重新加载用户
+        if request.is_json:
+            user_data = user.to_dict(include_email=True)
+            access_token, refresh_token = create_tokens(user)
+        else:
+            login_user(user, remember=remember)
+            welcome = f'欢迎回来，{user.nickname or user.username}！'
+        user_id = user.id
+        db.session.commit()
 
-        # 记录活动
-        UserActivity.log_activity(
-            user_id=user.id,
-            activity_type='login',
-            details={'method': 'web' if not request.is_json else 'api'},
-            request=request
-        )
+        # 记录活动（批量写入）
+        queue_activity(user_id, 'login', {'method': 'web' if not request.is_json else 'api'},
+                       request=request)
 
         if request.is_json:
             # API响应 - 返回JWT令牌
-            access_token = create_access_token(identity=user.id)
-            refresh_token = create_refresh_token(identity=user.id)
             return jsonify({
                 'message': '登录成功',
-                'user': user.to_dict(include_email=True),
+                'user': user_data,
                 'access_token': access_token,
                 'refresh_token': refresh_token
             }), 200
         else:
             # 网页响应 - 使用Flask-Login
-            login_user(user, remember=remember)
             next_page = request.args.get('next')
             if next_page and next_page.startswith('/'):
                 return redirect(next_page)
-            flash(f'欢迎回来，{user.nickname or user.username}！', 'success')
+            flash(welcome, 'success')
             return redirect(url_for('main.index'))
 
     return render_template('auth/login.html')
@@ -200,12 +221,12 @@ def login():
 @login_required
 def logout():
     """用户登出"""
-    # 记录活动
-    UserActivity.log_activity(
-        user_id=current_user.id,
-        activity_type='logout',
-        request=request
-    )
+    # 写入尚在缓冲区中的学习进度
+    from app.services.heartbeats import flush_user_heartbeats
+    flush_user_heartbeats(current_user.id)
+
+    # 记录活动（批量写入）
+    queue_activity(current_user.id, 'logout', request=request)
 
     logout_user()
     flash('您已成功登出', 'info')
@@ -274,8 +295,9 @@ def change_password():
             flash('两次输入的新密码不一致', 'danger')
             return render_template('auth/change_password.html')
 
-        # 更新密码
+        # 更新密码，已签发的令牌随之失效
         current_user.set_password(new_password)
+        current_user.revoke_tokens()
         try:
             db.session.commit()
             flash('密码修改成功', 'success')
@@ -291,18 +313,43 @@ def change_password():
 @bp.route('/api/refresh', methods=['POST'])
 @jwt_required(refresh=True)
 def refresh():
-    """刷新访问令牌"""
-    current_user_id = get_jwt_identity()
-    new_access_token = create_access_token(identity=current_user_id)
+    """刷新访问令牌（按用户当前状态重新签发声明）"""
+    from app.services.user_cache import get_jwt_user
+    user = get_jwt_user()
+    if not user or not user.is_active or not token_version_matches(user, get_jwt()):
+        return jsonify({'error': '令牌已失效，请重新登录'}), 401
+    new_access_token = create_access_token(identity=str(user.id), additional_claims=token_claims(user))
     return jsonify({'access_token': new_access_token}), 200
 
 
+@bp.route('/api/logout', methods=['POST'])
+@jwt_required(verify_type=False)
+def api_logout():
+    """登出（API）：吊销当前令牌，访问令牌和刷新令牌需分别调用"""
+    payload = get_jwt()
+    user_id = int(payload['sub'])
+
+    from app.services.heartbeats import flush_user_heartbeats
+    flush_user_heartbeats(user_id)
+
+    revoke_token(payload)
+    UserActivity.log_activity(
+        user_id=user_id,
+        activity_type='logout',
+        details={'method': 'api', 'token_type': payload.get('type')},
+        request=request,
+        commit=False
+    )
+    db.session.commit()
+    return jsonify({'message': '已登出'}), 200
+
+
 @bp.route('/api/me')
 @jwt_required()
 def api_get_current_user():
     """获取当前用户信息（API）"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    from app.services.user_cache import get_jwt_user
+    user = get_jwt_user()
     if not user:
         return jsonify({'error': '用户不存在'}), 404
     return jsonify({'user': user.to_dict(include_email=True)}), 200
@@ -4,7 +4,7 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import current_user, login_required
 from app import db
-from app.models import (LearningModule, Quiz, QuizQuestion, QuizAnswer,
+from app.models import (LearningModule, Quiz, QuizQuestion, QuizAttempt,
                        UserProgress, Rating, Comment, UserActivity, ContentView)
 from datetime import datetime
 
@@ -65,23 +65,23 @@ def module_detail(slug):
             module_id=module.id
         )
         db.session.add(progress)
-        module.increment_enrollment()
-        db.session.commit()
+        module.increment_enrollment(commit=False)
 
-    # 记录浏览
+    # 记录浏览和活动，与进度一起在一个事务中提交
     ContentView.log_view(
         module_id=module.id,
         user_id=current_user.id,
-        request=request
+        request=request,
+        commit=False
     )
-
-    # 记录活动
     UserActivity.log_activity(
         user_id=current_user.id,
         activity_type='view_module',
         details={'module_id': module.id, 'module_title': module.title},
-        request=request
+        request=request,
+        commit=False
     )
+    db.session.commit()
 
     # 获取测验
     quizzes = module.quizzes.all()
@@ -110,23 +110,46 @@ def module_detail(slug):
 @bp.route('/<int:module_id>/update-progress', methods=['POST'])
 @login_required
 def update_progress(module_id):
-    """更新学习进度"""
-    module = LearningModule.query.get_or_404(module_id)
+    """
+    更新学习进度（心跳）
+
+    普通心跳只在内存中合并，由缓冲区批量写入；进度达到100时立即完成并提交。
+    请求体: {"progress": 0-100, "time_spent": 本次新增分钟数,
+             "last_position": 位置, "final": 页面关闭时为 true}
+    """
+    from app.services.heartbeats import get_heartbeat_buffer
+
     progress = UserProgress.query.filter_by(
         user_id=current_user.id,
         module_id=module_id
     ).first_or_404()
 
-    data = request.get_json()
-    progress_value = data.get('progress', 0)
-    time_spent = data.get('time_spent', 0)
-    last_position = data.get('last_position', '')
+    data = request.get_json(silent=True) or {}
+    try:
+        progress_value = min(100.0, max(0.0, float(data.get('progress') or 0)))
+        time_spent = max(0, int(data.get('time_spent') or 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': '无效的进度数据'}), 400
+    last_position = data.get('last_position') or None
 
-    progress.update_progress(progress_value)
-    if time_spent:
-        progress.add_time(time_spent)
-    if last_position:
-        progress.last_position = last_position
+    buffer = get_heartbeat_buffer()
+    merged = buffer.add(current_user.id, module_id, progress=progress_value,
+                        minutes=time_spent, last_position=last_position)
+
+    if progress_value >= 100 and not progress.completed:
+        # 完成是状态变化，先写入合并的心跳再立即提交
+        buffer.flush(user_id=current_user.id, module_id=module_id)
+        db.session.refresh(progress)
+        progress.complete()
+    elif data.get('final'):
+        buffer.flush(user_id=current_user.id, module_id=module_id)
+        db.session.refresh(progress)
+    else:
+        # 返回叠加了待写更新的进度视图，不修改会话中的对象
+        result = progress.to_dict()
+        result['progress'] = max(result['progress'] or 0, merged['progress'] or 0)
+        result['time_spent'] = (result['time_spent'] or 0) + merged['minutes']
+        return jsonify({'message': '进度已更新', 'progress': result}), 200
 
     return jsonify({
         'message': '进度已更新',
@@ -145,19 +168,22 @@ def complete_module(module_id):
     ).first_or_404()
 
     if not progress.completed:
-        progress.complete()
+        progress.complete(commit=False)
 
-        # 记录活动
+        # 记录活动（与完成状态一起提交）
         UserActivity.log_activity(
             user_id=current_user.id,
             activity_type='complete_module',
             details={
                 'module_id': module.id,
                 'module_title': module.title,
+                'module_category': module.category,
                 'points_earned': module.points_reward
             },
-            request=request
+            request=request,
+            commit=False
         )
+        db.session.commit()
 
         return jsonify({
             'message': f'恭喜完成学习！获得{module.points_reward}积分',
@@ -191,20 +217,25 @@ def take_quiz(quiz_id):
         flash(f'您已达到最大尝试次数（{quiz.max_attempts}次）', 'danger')
         return redirect(url_for('learning.module_detail', slug=module.slug))
 
-    # 获取问题
-    questions = quiz.questions.all()
+    # 开始（或继续）测验会话，按会话种子打乱题目顺序
+    from app.services.quiz_sessions import start_session, order_questions, time_remaining
+    quiz_session = start_session(current_user.id, quiz)
+    questions = order_questions(quiz_session, quiz.questions.all(), quiz.shuffle_questions)
 
     return render_template('learning/quiz.html',
                          quiz=quiz,
                          module=module,
                          questions=questions,
-                         progress=progress)
+                         progress=progress,
+                         time_remaining=time_remaining(quiz_session))
 
 
 @bp.route('/quiz/<int:quiz_id>/submit', methods=['POST'])
 @login_required
 def submit_quiz(quiz_id):
     """提交测验答案"""
+    from app.services.quiz_sessions import finish_session, started_at, SESSION_ERRORS
+
     quiz = Quiz.query.get_or_404(quiz_id)
     module = quiz.module
 
@@ -213,47 +244,43 @@ def submit_quiz(quiz_id):
         module_id=module.id
     ).first_or_404()
 
+    # 检查会话和时间限制，超时的提交不评分、不写入
+    quiz_session, error = finish_session(current_user.id, quiz)
+    if error:
+        return jsonify({'error': SESSION_ERRORS[error], 'reason': error}), 403
+
     # 增加尝试次数
     progress.quiz_attempts += 1
 
     data = request.get_json()
     answers = data.get('answers', {})  # {question_id: user_answer}
 
-    # 评分
-    total_points = 0
-    earned_points = 0
-    results = []
-
-    for question in quiz.questions:
-        question_id = str(question.id)
-        user_answer = answers.get(question_id)
-
-        is_correct = question.check_answer(user_answer)
-        points = question.points if is_correct else 0
-
-        total_points += question.points
-        earned_points += points
-
-        # 记录答案
-        answer_record = QuizAnswer(
-            user_id=current_user.id,
-            quiz_id=quiz_id,
-            question_id=question.id,
-            user_answer=user_answer,
-            is_correct=is_correct,
-            points_earned=points
-        )
-        db.session.add(answer_record)
-
-        results.append({
-            'question_id': question.id,
-            'is_correct': is_correct,
-            'points': points,
-            'explanation': question.explanation
-        })
+    # 使用缓存的答案表一次遍历完成评分
+    from app.services.quiz_grading import grade_submission
+    key, graded = grade_submission(quiz, answers)
+    total_points = graded.total_points
+    earned_points = graded.earned_points
+    score = graded.score
+
+    # 整次提交写入一条记录（逐题对错打包为位图）；有会话时用时由服务端计算
+    time_spent = None if quiz_session else data.get('time_spent')
+    QuizAttempt.record(
+        current_user.id, quiz, key, graded,
+        passed=score >= quiz.passing_score,
+        started_at=started_at(quiz_session),
+        time_spent=int(time_spent) if isinstance(time_spent, (int, float)) else None
+    )
 
-    # 计算分数
-    score = int((earned_points / total_points) * 100) if total_points > 0 else 0
+    # 增量更新题目统计（与提交记录同一事务）
+    from app.services.item_analysis import record_attempt
+    record_attempt(key, graded)
+    results = [{
+        'question_id': question_id,
+        'is_correct': is_correct,
+        'points': points,
+        'explanation': explanation
+    } for question_id, is_correct, points, explanation in zip(
+        key.question_ids, graded.correct, graded.earned, key.explanations)]
 
     # 更新最佳成绩
     if score > progress.best_quiz_score:
@@ -262,21 +289,22 @@ def submit_quiz(quiz_id):
     # 检查是否通过
     if score >= quiz.passing_score:
         progress.quiz_passed = True
-        current_user.add_points(10)  # 通过测验获得积分
+        current_user.add_points(10, source='quiz_pass', reference_id=quiz.id)  # 通过测验获得积分
 
-    db.session.commit()
-
-    # 记录活动
+    # 记录活动（与成绩一起提交）
     UserActivity.log_activity(
         user_id=current_user.id,
         activity_type='quiz_attempt',
         details={
             'quiz_id': quiz.id,
             'score': score,
-            'passed': score >= quiz.passing_score
+            'passed': score >= quiz.passing_score,
+            'attempt': progress.quiz_attempts
         },
-        request=request
+        request=request,
+        commit=False
     )
+    db.session.commit()
 
     return jsonify({
         'score': score,
@@ -306,16 +334,34 @@ def add_comment(module_id):
         flash('评论内容不能为空', 'danger')
         return redirect(url_for('learning.module_detail', slug=module.slug))
 
-    comment = Comment(
+    # 防刷检查：限流和近似重复在内存中拒绝，不产生任何写入
+    from app.services.antispam import check_comment, register_comment, REJECT_MESSAGES
+    rejected = check_comment(current_user.id, content, module_id=module.id)
+    if rejected:
+        if request.is_json:
+            return jsonify({'error': REJECT_MESSAGES[rejected], 'reason': rejected}), 429
+        flash(REJECT_MESSAGES[rejected], 'warning')
+        return redirect(url_for('learning.module_detail', slug=module.slug))
+
+    comment = Comment.create_comment(
         content=content,
         user_id=current_user.id,
         module_id=module_id
     )
-    db.session.add(comment)
-    current_user.add_points(5)
+    current_user.add_points(5, source='comment')
 
     try:
+        # 记录活动（与评论一起提交）
+        db.session.flush()
+        UserActivity.log_activity(
+            user_id=current_user.id,
+            activity_type='submit_comment',
+            details={'module_id': module.id, 'comment_id': comment.id},
+            request=request,
+            commit=False
+        )
         db.session.commit()
+        register_comment(current_user.id, content, module_id=module.id)
         if request.is_json:
             return jsonify({
                 'message': '评论成功',
@@ -373,7 +419,7 @@ def rate_module(module_id):
             module_id=module_id
         )
         db.session.add(rating)
-        current_user.add_points(3)
+        current_user.add_points(3, source='rating', reference_id=module.id)
         message = '评分成功，获得3积分！'
 
     try:
@@ -4,7 +4,7 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for
 from flask_login import current_user
 from app.models import Story, LearningModule, Character, Comment
-from sqlalchemy import func
+from app.services import popularity
 
 bp = Blueprint('main', __name__)
 
@@ -12,31 +12,25 @@ bp = Blueprint('main', __name__)
 @bp.route('/')
 def index():
     """首页"""
+    snapshot = popularity.get_snapshot()
+
     # 获取精选故事
-    featured_stories = Story.get_featured_stories(limit=6)
+    featured_stories = popularity.get_featured_stories(limit=6)
 
     # 获取热门故事
-    popular_stories = Story.get_popular_stories(limit=8)
+    popular_stories = popularity.get_popular_stories(limit=8)
 
     # 获取推荐学习模块
-    recommended_modules = LearningModule.query.filter_by(
-        is_published=True
-    ).order_by(LearningModule.enrollment_count.desc()).limit(6).all()
+    recommended_modules = popularity.get_popular_modules(limit=6)
 
     # 获取最新评论
     recent_comments = Comment.get_recent_comments(limit=5)
 
     # 获取热门角色
-    popular_characters = Character.query.filter_by(is_active=True)\
-        .order_by(Character.popularity_score.desc()).limit(8).all()
+    popular_characters = popularity.get_popular_characters(limit=8)
 
-    # 统计数据
-    stats = {
-        'total_stories': Story.query.filter_by(is_published=True).count(),
-        'total_modules': LearningModule.query.filter_by(is_published=True).count(),
-        'total_characters': Character.query.filter_by(is_active=True).count(),
-        'total_learners': db.session.query(func.count(func.distinct(UserProgress.user_id))).scalar() or 0
-    }
+    # 统计数据（随快照一同预计算）
+    stats = dict(snapshot.counts)
 
     return render_template('index.html',
                          featured_stories=featured_stories,
@@ -147,5 +141,4 @@ def character_detail(character_id):
 
 
 # 引入必要的导入
-from app.models import UserProgress
 from app import db
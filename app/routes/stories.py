@@ -1,7 +1,7 @@
 """
 故事路由 - 处理皮影戏故事相关的页面
 """
-from flask import Blueprint, render_template, request, jsonify, abort
+from flask import Blueprint, render_template, request, jsonify, abort, redirect, url_for, flash
 from flask_login import current_user, login_required
 from app import db
 from app.models import Story, Comment, Rating, ContentView, UserActivity
@@ -58,24 +58,23 @@ def story_detail(slug):
 
     story = Story.query.filter_by(slug=slug, is_published=True).first_or_404()
 
-    # 增加浏览次数
-    story.increment_view()
-
-    # 记录浏览
+    # 浏览次数、浏览记录和用户活动在一个事务中提交
+    story.increment_view(commit=False)
     ContentView.log_view(
         story_id=story.id,
         user_id=current_user.id if current_user.is_authenticated else None,
-        request=request
+        request=request,
+        commit=False
     )
-
-    # 记录用户活动
     if current_user.is_authenticated:
         UserActivity.log_activity(
             user_id=current_user.id,
             activity_type='view_story',
             details={'story_id': story.id, 'story_title': story.title},
-            request=request
+            request=request,
+            commit=False
         )
+    db.session.commit()
 
     # 获取评论
     comments = Comment.get_story_comments(story.id, limit=20)
@@ -106,8 +105,17 @@ def story_detail(slug):
 @login_required
 def like_story(story_id):
     """点赞故事"""
+    from app.services.reactions import get_reaction_buffer
+
     story = Story.query.get_or_404(story_id)
-    story.increment_like()
+    buffer = get_reaction_buffer()
+
+    # 按用户去重，计数写后批量刷新
+    if not buffer.add(current_user.id, 'story', story.id, 'like'):
+        if request.is_json:
+            return jsonify({'error': '已经点过赞了'}), 409
+        flash('已经点过赞了', 'info')
+        return redirect(url_for('stories.story_detail', slug=story.slug))
 
     # 记录活动
     UserActivity.log_activity(
@@ -118,9 +126,10 @@ def like_story(story_id):
     )
 
     if request.is_json:
+        db.session.refresh(story)
         return jsonify({
             'message': '点赞成功',
-            'like_count': story.like_count
+            'like_count': story.like_count + buffer.pending_count('story', story.id, 'like')
         }), 200
     return redirect(url_for('stories.story_detail', slug=story.slug))
 
@@ -166,28 +175,38 @@ def add_comment(story_id):
         flash('评论内容不能为空', 'danger')
         return redirect(url_for('stories.story_detail', slug=story.slug))
 
-    # 创建评论
-    comment = Comment(
+    # 防刷检查：限流和近似重复在内存中拒绝，不产生任何写入
+    from app.services.antispam import check_comment, register_comment, REJECT_MESSAGES
+    rejected = check_comment(current_user.id, content, story_id=story.id)
+    if rejected:
+        if request.is_json:
+            return jsonify({'error': REJECT_MESSAGES[rejected], 'reason': rejected}), 429
+        flash(REJECT_MESSAGES[rejected], 'warning')
+        return redirect(url_for('stories.story_detail', slug=story.slug))
+
+    # 创建评论（同一事务内更新冗余计数）
+    comment = Comment.create_comment(
         content=content,
         user_id=current_user.id,
         story_id=story_id,
         parent_id=parent_id if parent_id else None
     )
-    db.session.add(comment)
 
     # 增加用户积分
-    current_user.add_points(5)
+    current_user.add_points(5, source='comment')
 
     try:
-        db.session.commit()
-
-        # 记录活动
+        # 记录活动（与评论一起提交）
+        db.session.flush()
         UserActivity.log_activity(
             user_id=current_user.id,
             activity_type='submit_comment',
             details={'story_id': story.id, 'comment_id': comment.id},
-            request=request
+            request=request,
+            commit=False
         )
+        db.session.commit()
+        register_comment(current_user.id, content, story_id=story.id)
 
         if request.is_json:
             return jsonify({
@@ -249,19 +268,19 @@ def rate_story(story_id):
         )
         db.session.add(rating)
         # 增加用户积分
-        current_user.add_points(3)
+        current_user.add_points(3, source='rating', reference_id=story.id)
         message = '评分成功，获得3积分！'
 
     try:
-        db.session.commit()
-
-        # 记录活动
+        # 记录活动（与评分一起提交）
         UserActivity.log_activity(
             user_id=current_user.id,
             activity_type='rate_content',
             details={'story_id': story.id, 'score': score},
-            request=request
+            request=request,
+            commit=False
         )
+        db.session.commit()
 
         if request.is_json:
             return jsonify({
@@ -1,7 +1,34 @@
 """
 服务包 - 业务逻辑服务
+
+子模块按需导入：访问 app.services.<模块> 或 from app.services import <模块>
+时才加载对应模块，导入本包不会加载 requests、推荐算法等依赖。
 """
-from app.services.recommendation import *
-from app.services.deepseek import *
+import importlib
+
+__all__ = ['recommendation', 'deepseek', 'popularity', 'trending', 'comments', 'moderation', 'reactions', 'antispam', 'quiz_grading', 'item_analysis', 'quiz_sessions', 'heartbeats', 'leaderboard', 'user_stats', 'achievements', 'user_cache', 'passwords', 'tokens', 'activity_log']
+
+
+# 兼容原先从包中直接导入的服务函数：函数名 -> 所在子模块
+_LEGACY_NAMES = {
+    'get_personalized_recommendations': 'recommendation',
+    'get_user_learning_history': 'recommendation',
+    'get_collaborative_stories': 'recommendation',
+    'get_content_based_stories': 'recommendation',
+    'get_next_modules': 'recommendation',
+    'get_deepseek_recommendations': 'recommendation',
+    'get_default_recommendations': 'recommendation',
+    'deduplicate_and_limit': 'recommendation',
+    'get_trending_content': 'recommendation',
+    'DeepSeekClient': 'deepseek',
+    'get_deepseek_client': 'deepseek',
+}
+
 
-__all__ = ['recommendation', 'deepseek']
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'{__name__}.{name}')
+    if name in _LEGACY_NAMES:
+        module = importlib.import_module(f'{__name__}.{_LEGACY_NAMES[name]}')
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
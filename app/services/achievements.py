@@ -0,0 +1,341 @@
+"""
+成就引擎 - 由用户活动事件增量驱动
+
+每条规则编译为一个计数器：计数型规则在匹配的事件上加一，连续型规则
+按自然日维护连续天数。事件只需更新订阅了该事件类型的少数计数器，
+不回查历史记录。
+
+已提交的活动事件先进入队列，由后台线程批量处理，不占用请求线程：
+一批事件的计数增量先按 (用户, 规则) 合并，同一天的连续型事件只保留一条，
+再用少数几条批量语句在一个事务内原子地累加（value = value + 增量），
+之后在同一事务中读回最新值判断阈值。多个工作进程处理同一用户的事件时
+不会漏计或互相覆盖，跨过阈值的那批更新授予成就。
+
+事件来源是 UserActivity.log_activity：活动记录写入 session.info['activity_events']，
+事务提交后才送入引擎，回滚的活动不会计入。
+"""
+import atexit
+import logging
+import threading
+from collections import OrderedDict, deque, namedtuple
+from datetime import timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, case, event, or_, select, tuple_, update
+
+from app import db
+from app.models import UserAchievement, AchievementCounter
+from app.utils.background import PeriodicTask
+from app.utils.helpers import insert_ignore
+
+logger = logging.getLogger(__name__)
+
+# kind: 'count' 匹配事件计数；'streak' 任意活动的连续天数
+Rule = namedtuple('Rule', ['code', 'name', 'description', 'event', 'threshold', 'kind', 'when'])
+
+
+def _rule(code, name, description, event_type, threshold, kind='count', when=None):
+    return Rule(code, name, description, event_type, threshold, kind, when)
+
+
+ACHIEVEMENT_RULES = [
+    _rule('first_comment', '初次发声', '发表第一条评论', 'submit_comment', 1),
+    _rule('commentator', '热心评论员', '累计发表50条评论', 'submit_comment', 50),
+    _rule('story_explorer', '故事探索者', '阅读20次故事', 'view_story', 20),
+    _rule('first_module', '初窥门径', '完成第一个学习模块', 'complete_module', 1),
+    _rule('craft_apprentice', '制作学徒', '完成5个制作工艺模块', 'complete_module', 5,
+          when=lambda d: d.get('module_category') == '制作工艺'),
+    _rule('quiz_ace', '一次通关', '3次测验首次尝试即通过', 'quiz_attempt', 3,
+          when=lambda d: d.get('passed') and d.get('attempt') == 1),
+    _rule('perfect_score', '满分达人', '测验获得满分', 'quiz_attempt', 1,
+          when=lambda d: d.get('score') == 100),
+    _rule('streak_7', '七日不辍', '连续7天有学习活动', None, 7, kind='streak'),
+]
+
+RULES = {rule.code: rule for rule in ACHIEVEMENT_RULES}
+
+CHUNK_SIZE = 500  # 批量读取和多行插入的每批数量
+
+
+def compile_rules(rules):
+    """按事件类型索引规则，连续型规则订阅全部事件"""
+    by_event = {}
+    streaks = []
+    for rule in rules:
+        if rule.kind == 'streak':
+            streaks.append(rule)
+        else:
+            by_event.setdefault(rule.event, []).append(rule)
+    return by_event, streaks
+
+
+class AchievementEngine:
+    """成就引擎：活动事件排队后由后台线程批量处理，计数器保存在数据库中"""
+
+    def __init__(self, app, rules=None):
+        self.app = app
+        self.by_event, self.streaks = compile_rules(rules or ACHIEVEMENT_RULES)
+        self.flush_interval = app.config.get('ACHIEVEMENT_FLUSH_INTERVAL', 5)
+        self.max_queue = app.config.get('ACHIEVEMENT_QUEUE_MAX', 100000)
+        self.max_streak_days = app.config.get('ACHIEVEMENT_STREAK_CACHE', 50000)
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (用户ID, 规则) -> 已计入的最近日期；数据库中的日期只会前进，据此跳过同一天的事件
+        self._streak_days = OrderedDict()
+        self._flusher = PeriodicTask(app, 'achievement-worker', self.flush_interval, self.flush)
+        self.stats = {'events': 0, 'awards': 0, 'flushes': 0, 'dropped': 0, 'errors': 0}
+
+    def __len__(self):
+        return len(self._queue)
+
+    def start(self):
+        """启动后台批量处理"""
+        self._flusher.start()
+
+    def stop(self):
+        """停止后台批量处理"""
+        self._flusher.stop()
+
+    def after_fork(self):
+        """进程派生后按配置重新启动后台批量处理"""
+        if self.app.config.get('ACHIEVEMENT_BACKGROUND_FLUSH'):
+            self._flusher.after_fork()
+
+    def enqueue(self, events):
+        """
+        活动事件入队（超出容量时丢弃最早的事件）
+
+        没有后台线程时（如测试中）立即处理，处理失败只记录日志。
+        """
+        with self._lock:
+            self._queue.extend(events)
+            overflow = len(self._queue) - self.max_queue
+            for _ in range(max(0, overflow)):
+                self._queue.popleft()
+            if overflow > 0:
+                self.stats['dropped'] += overflow
+        if not self._flusher.running:
+            try:
+                self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"成就事件处理失败: {str(e)}")
+
+    def flush(self):
+        """处理队列中的全部事件，返回新获得的成就 [(用户ID, 代码), ...]"""
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._queue)
+                self._queue.clear()
+            if not events:
+                return []
+            try:
+                awarded = self.process(events)
+            except Exception:
+                with self._lock:
+                    self._queue.extendleft(reversed(events))
+                raise
+            self.stats['flushes'] += 1
+            return awarded
+
+    def process(self, events):
+        """
+        在一个事务内处理一批活动事件 [(用户ID, 类型, 详情, 时间), ...]
+
+        Returns:
+            新获得的成就 [(用户ID, 代码), ...]
+        """
+        deltas = {}  # (user_id, rule) -> (计数增量, 最后一次事件时间)
+        streak_days = {}  # (user_id, rule) -> {日期: 当天最后一次事件时间}
+        for user_id, activity_type, details, when in events:
+            details = details or {}
+            for rule in self.by_event.get(activity_type, ()):
+                if rule.when is None or rule.when(details):
+                    key = (user_id, rule)
+                    deltas[key] = (deltas.get(key, (0, None))[0] + 1, when)
+            for rule in self.streaks:
+                known = self._streak_days.get((user_id, rule.code))
+                if known is None or when.date() > known:
+                    streak_days.setdefault((user_id, rule), {})[when.date()] = when
+        self.stats['events'] += len(events)
+        if not (deltas or streak_days):
+            return []
+
+        awards = {}  # (user_id, code) -> awarded_at
+        with db.engine.begin() as connection:
+            _ensure_counters(connection, [(u, rule.code) for u, rule in [*deltas, *streak_days]])
+
+            if deltas:
+                values = _increment_counters(connection, {
+                    (u, rule.code): delta for (u, rule), (delta, _) in deltas.items()})
+                for (user_id, rule), (delta, when) in deltas.items():
+                    value = values[(user_id, rule.code)]
+                    # 跨过阈值的那次累加只有一次，与其他进程的并发更新无关
+                    if value - delta < rule.threshold <= value:
+                        awards[(user_id, rule.code)] = when
+
+            # 按日期依次推进连续天数（一批事件通常只跨一天）
+            for day in sorted({day for per_day in streak_days.values() for day in per_day}):
+                keys = [key for key, per_day in streak_days.items() if day in per_day]
+                states = _advance_streaks(connection, [(u, rule.code) for u, rule in keys], day)
+                for user_id, rule in keys:
+                    value, last_day = states[(user_id, rule.code)]
+                    if last_day == day and value == rule.threshold:
+                        awards.setdefault((user_id, rule.code), streak_days[(user_id, rule)][day])
+
+            awarded = _insert_awards(connection, [
+                {'user_id': u, 'code': c, 'awarded_at': when} for (u, c), when in awards.items()
+            ]) if awards else []
+
+        # 事务提交后才记住已计入的日期
+        for (user_id, rule), per_day in streak_days.items():
+            self._remember_day((user_id, rule.code), max(per_day))
+        self.stats['awards'] += len(awarded)
+        return awarded
+
+    def _remember_day(self, key, day):
+        with self._lock:
+            known = self._streak_days.get(key)
+            if known is None or day > known:
+                self._streak_days[key] = day
+            self._streak_days.move_to_end(key)
+            while len(self._streak_days) > self.max_streak_days:
+                self._streak_days.popitem(last=False)
+
+    def achievements(self, user_id):
+        """用户已获得的成就代码"""
+        table = UserAchievement.__table__
+        return set(db.session.execute(
+            select(table.c.code).where(table.c.user_id == user_id)
+        ).scalars())
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _read_counters(connection, keys, *columns):
+    """批量读取计数器 {(用户ID, 规则): 行}"""
+    table = AchievementCounter.__table__
+    result = {}
+    for chunk in _chunks(keys):
+        rows = connection.execute(
+            select(table.c.user_id, table.c.rule, *columns)
+            .where(tuple_(table.c.user_id, table.c.rule).in_(chunk))
+        )
+        for row in rows:
+            result[(row[0], row[1])] = tuple(row[2:])
+    return result
+
+
+def _ensure_counters(connection, keys):
+    """插入尚不存在的计数器（一条批量插入，已存在的忽略）"""
+    keys = list(dict.fromkeys(keys))
+    if keys:
+        connection.execute(insert_ignore(AchievementCounter.__table__, connection.dialect.name), [
+            {'user_id': u, 'rule': r, 'value': 0, 'last_day': None} for u, r in keys
+        ])
+
+
+def _counter_key_filter():
+    table = AchievementCounter.__table__
+    return (table.c.user_id == bindparam('b_user_id'), table.c.rule == bindparam('b_rule'))
+
+
+def _increment_counters(connection, deltas):
+    """
+    批量原子累加计数器，返回累加后的值 {(用户ID, 规则): 值}
+
+    更新持有行锁直到事务结束，同一事务内读回的就是本次累加后的值。
+    """
+    table = AchievementCounter.__table__
+    connection.execute(
+        update(table).where(*_counter_key_filter()).values(value=table.c.value + bindparam('b_delta')),
+        [{'b_user_id': u, 'b_rule': r, 'b_delta': d} for (u, r), d in deltas.items()]
+    )
+    return {key: row[0] for key, row in _read_counters(connection, list(deltas), table.c.value).items()}
+
+
+def _advance_streaks(connection, keys, day):
+    """
+    按活动日期批量推进连续天数，返回 {(用户ID, 规则): (值, 最近日期)}
+
+    前一天有活动时加一，中断后从1开始；数据库中已计入同一天或更晚日期的
+    计数器不变。条件写在 UPDATE 中，以数据库中的最近日期为准。
+    """
+    table = AchievementCounter.__table__
+    connection.execute(
+        update(table).where(
+            *_counter_key_filter(),
+            or_(table.c.last_day.is_(None), table.c.last_day < bindparam('b_day'))
+        ).values(
+            value=case((table.c.last_day == bindparam('b_yesterday'), table.c.value + 1), else_=1),
+            last_day=bindparam('b_day')
+        ),
+        [{'b_user_id': u, 'b_rule': r, 'b_day': day, 'b_yesterday': day - timedelta(days=1)}
+         for u, r in keys]
+    )
+    return _read_counters(connection, keys, table.c.value, table.c.last_day)
+
+
+def _insert_awards(connection, rows):
+    """插入成就（忽略已获得的），返回真正新增的 [(用户ID, 代码), ...]"""
+    table = UserAchievement.__table__
+    stmt = insert_ignore(table, connection.dialect.name)
+    if connection.dialect.insert_returning:
+        # 多行 INSERT ... RETURNING：冲突被忽略的行不会返回
+        return [tuple(row) for chunk in _chunks(rows)
+                for row in connection.execute(stmt.values(chunk).returning(table.c.user_id, table.c.code))]
+    return [(row['user_id'], row['code']) for row in rows if connection.execute(stmt, row).rowcount]
+
+
+def dispatch_activities(events):
+    """把已持久化的活动事件 [(用户ID, 类型, 详情, 时间), ...] 送入成就引擎队列"""
+    if not events or not has_app_context():
+        return
+    engine = current_app.extensions.get('achievements')
+    if engine is not None:
+        engine.enqueue(events)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _dispatch_committed_activities(session):
+    dispatch_activities(session.info.pop('activity_events', None))
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_rolled_back_activities(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('activity_events', None)
+
+
+def init_achievements(app):
+    """注册成就引擎，按配置启动后台批量处理，进程退出时处理剩余事件"""
+    engine = AchievementEngine(app)
+    app.extensions['achievements'] = engine
+    if app.config.get('ACHIEVEMENT_BACKGROUND_FLUSH'):
+        engine.start()
+
+    def flush_on_exit():
+        try:
+            with app.app_context():
+                engine.flush()
+        except Exception as e:
+            logger.error(f"退出时处理成就事件失败: {str(e)}")
+
+    atexit.register(flush_on_exit)
+    return engine
+
+
+def get_achievement_engine():
+    """获取当前应用的成就引擎"""
+    return current_app.extensions['achievements']
+
+
+def get_user_achievements(user_id):
+    """用户已获得的成就详情列表"""
+    codes = get_achievement_engine().achievements(user_id)
+    return [{'code': rule.code, 'name': rule.name, 'description': rule.description}
+            for rule in ACHIEVEMENT_RULES if rule.code in codes]
@@ -0,0 +1,155 @@
+"""
+活动日志批量写入 - 登录、登出等不需要与业务数据同事务的活动
+
+活动记录先进入内存缓冲区，达到数量阈值或由后台线程按时间间隔用一次
+多行 INSERT 写入，写入成功后再送入成就引擎。写入失败时记录保留在缓冲区
+中，不影响已经成功的登录或注册请求；此后由后台线程重试，add() 不再在请求中
+重试（未启动后台线程时按写入间隔重试）。缓冲区有容量上限，数据库长时间不可用
+时丢弃最早的记录并计入 stats['dropped']。需要与业务数据一起提交的活动仍使用
+UserActivity.log_activity(commit=False)。
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.models import UserActivity
+from app.utils.background import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """活动日志缓冲区"""
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_size = app.config.get('ACTIVITY_FLUSH_SIZE', 200)
+        self.flush_interval = app.config.get('ACTIVITY_FLUSH_INTERVAL', 5)
+        self.max_rows = app.config.get('ACTIVITY_BUFFER_MAX', 10000)
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._failing = False
+        self._flusher = PeriodicTask(app, 'activity-flusher', self.flush_interval, self.flush)
+        self.stats = {'activities': 0, 'flushed_rows': 0, 'flushes': 0, 'errors': 0, 'dropped': 0}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def start(self):
+        """启动后台定时写入"""
+        self._flusher.start()
+
+    def stop(self):
+        """停止后台定时写入"""
+        self._flusher.stop()
+
+    def after_fork(self):
+        """进程派生后按配置重新启动后台定时写入"""
+        if self.app.config.get('ACTIVITY_BACKGROUND_FLUSH'):
+            self._flusher.after_fork()
+
+    def add(self, row):
+        """加入一条活动记录，达到阈值时写入（写入失败只记录日志）"""
+        with self._lock:
+            self._rows.append(row)
+            self.stats['activities'] += 1
+            self._trim()
+            if self._failing:
+                # 上次写入失败：由后台线程重试，不在请求中反复尝试
+                should_flush = not self._flusher.running and \
+                    time.monotonic() - self._last_flush >= self.flush_interval
+            else:
+                should_flush = len(self._rows) >= self.flush_size or \
+                    time.monotonic() - self._last_flush >= self.flush_interval
+        if should_flush:
+            try:
+                self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"活动日志写入失败，保留 {len(self._rows)} 条待下次写入: {str(e)}")
+
+    def _restore(self, rows):
+        """写入失败时把取出的记录放回缓冲区（排在新记录之前）"""
+        with self._lock:
+            self._rows = rows + self._rows
+            self._failing = True
+            self._trim()
+
+    def _trim(self):
+        """超出容量时丢弃最早的记录（调用方持有锁）"""
+        overflow = len(self._rows) - self.max_rows
+        if overflow > 0:
+            del self._rows[:overflow]
+            self.stats['dropped'] += overflow
+            logger.warning(f"活动日志缓冲区已满，丢弃最早的 {overflow} 条记录")
+
+    def flush(self):
+        """批量写入待写活动，返回写入条数"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                self._last_flush = time.monotonic()
+            if not rows:
+                return 0
+
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(UserActivity.__table__.insert(), rows)
+            except Exception:
+                self._restore(rows)
+                raise
+            self._failing = False
+
+            from app.services.achievements import dispatch_activities
+            dispatch_activities([(row['user_id'], row['activity_type'], row['details'], row['created_at'])
+                                 for row in rows])
+
+            self.stats['flushed_rows'] += len(rows)
+            self.stats['flushes'] += 1
+            return len(rows)
+
+
+def init_activity_log(app):
+    """注册活动日志缓冲区，按配置启动后台定时写入，进程退出时写入剩余数据"""
+    buffer = ActivityBuffer(app)
+    app.extensions['activity_log'] = buffer
+    if app.config.get('ACTIVITY_BACKGROUND_FLUSH'):
+        buffer.start()
+
+    def flush_on_exit():
+        try:
+            with app.app_context():
+                buffer.flush()
+        except Exception as e:
+            logger.error(f"退出时写入活动日志失败: {str(e)}")
+
+    atexit.register(flush_on_exit)
+    return buffer
+
+
+def get_activity_buffer():
+    """获取当前应用的活动日志缓冲区"""
+    return current_app.extensions['activity_log']
+
+
+def queue_activity(user_id, activity_type, details=None, request=None):
+    """记录活动（批量写入，不占用调用方的事务）"""
+    row = {
+        'user_id': user_id,
+        'activity_type': activity_type,
+        'details': details or {},
+        'ip_address': None,
+        'user_agent': None,
+        'device_type': None,
+        'created_at': datetime.utcnow()
+    }
+    if request:
+        row.update(UserActivity.request_fields(request))
+    get_activity_buffer().add(row)
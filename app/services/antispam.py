@@ -0,0 +1,232 @@
+"""
+评论防刷 - 基于SimHash的近似重复检测和按用户的滑动窗口限流
+
+近期评论的64位SimHash指纹按故事/模块和按用户分别保存在内存索引中。
+指纹被切成4段16位，汉明距离不超过3的两个指纹至少有一段完全相同，
+因此查重只需查4个桶，再对少量候选计算汉明距离，无需扫描评论表。
+
+检查（check）与登记（register）分开：评论提交成功后才登记指纹和提交时间，
+写入失败的评论不会使用户的重试被当成重复。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app
+
+FINGERPRINT_BITS = 64
+BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def _normalize(text):
+    """去掉空白和标点并转小写，使只改动标点、空格的评论得到相同指纹"""
+    return ''.join(ch for ch in text.lower() if ch.isalnum())
+
+
+def simhash(text, shingle_size=3):
+    """计算文本的64位SimHash（字符n-gram特征，中英文通用）"""
+    text = _normalize(text)
+    if len(text) <= shingle_size:
+        shingles = [text]
+    else:
+        shingles = [text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)]
+
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    """两个指纹的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex:
+    """单个范围内最近N条评论的指纹索引"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = deque()
+        self._bands = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def _band_keys(fingerprint):
+        return [(fingerprint >> (i * BAND_BITS)) & BAND_MASK for i in range(BANDS)]
+
+    def find(self, fingerprint, max_distance):
+        """查找汉明距离不超过 max_distance 的已有指纹，没有则返回 None"""
+        seen = set()
+        for band, key in zip(self._bands, self._band_keys(fingerprint)):
+            for candidate in band.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if hamming_distance(candidate, fingerprint) <= max_distance:
+                    return candidate
+        return None
+
+    def add(self, fingerprint):
+        """加入指纹，超出容量时淘汰最旧的一条"""
+        self._items.append(fingerprint)
+        for band, key in zip(self._bands, self._band_keys(fingerprint)):
+            band.setdefault(key, []).append(fingerprint)
+        if len(self._items) > self.capacity:
+            self._remove(self._items.popleft())
+
+    def _remove(self, fingerprint):
+        for band, key in zip(self._bands, self._band_keys(fingerprint)):
+            bucket = band.get(key)
+            if bucket:
+                bucket.remove(fingerprint)
+                if not bucket:
+                    del band[key]
+
+
+class CommentGuard:
+    """
+    评论防刷检查器
+
+    - 每个用户在 COMMENT_RATE_WINDOW 秒内最多提交 COMMENT_RATE_LIMIT 条评论；
+    - 同一用户最近的评论中存在近似重复时拒绝；
+    - 同一故事/模块下其他用户的评论只在内容不短于 ANTISPAM_MIN_SCOPE_LENGTH
+      个字符（去掉空白和标点后）时参与查重，"谢谢分享"之类的常见短回复不会被拒绝。
+    被拒绝的提交不会产生评论插入、计数更新、积分和活动记录。
+    """
+
+    def __init__(self, app):
+        self.enabled = app.config.get('ANTISPAM_ENABLED', True)
+        self.max_distance = app.config.get('ANTISPAM_SIMHASH_DISTANCE', 3)
+        self.min_scope_length = app.config.get('ANTISPAM_MIN_SCOPE_LENGTH', 10)
+        self.per_scope = app.config.get('ANTISPAM_RECENT_PER_SCOPE', 200)
+        self.max_scopes = app.config.get('ANTISPAM_MAX_SCOPES', 10000)
+        self.rate_limit = app.config.get('COMMENT_RATE_LIMIT', 5)
+        self.rate_window = app.config.get('COMMENT_RATE_WINDOW', 60)
+        self._indexes = OrderedDict()
+        self._submissions = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'checked': 0, 'accepted': 0, 'rate_limited': 0, 'duplicates': 0}
+
+    def _index(self, scope):
+        """获取范围索引（按LRU限制范围总数）"""
+        index = self._indexes.get(scope)
+        if index is None:
+            index = self._indexes[scope] = SimHashIndex(self.per_scope)
+            if len(self._indexes) > self.max_scopes:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(scope)
+        return index
+
+    def _rate_limited(self, user_id, now):
+        window = self._submissions.get(user_id)
+        if window is None:
+            window = self._submissions[user_id] = deque()
+            if len(self._submissions) > self.max_scopes:
+                self._submissions.popitem(last=False)
+        else:
+            self._submissions.move_to_end(user_id)
+        while window and now - window[0] >= self.rate_window:
+            window.popleft()
+        return len(window) >= self.rate_limit
+
+    def _scopes(self, user_id, content, story_id, module_id):
+        """评论参与查重的范围：用户范围始终参与，故事/模块范围只对足够长的内容生效"""
+        scopes = [('user', user_id)]
+        if len(_normalize(content)) >= self.min_scope_length:
+            if story_id is not None:
+                scopes.append(('story', story_id))
+            if module_id is not None:
+                scopes.append(('module', module_id))
+        return scopes
+
+    def check(self, user_id, content, story_id=None, module_id=None, now=None):
+        """
+        检查一条评论提交（不登记，提交成功后调用 register）
+
+        Returns:
+            None 表示允许提交；'rate_limited' 或 'duplicate' 表示拒绝原因
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic() if now is None else now
+        fingerprint = simhash(content)
+        scopes = self._scopes(user_id, content, story_id, module_id)
+
+        with self._lock:
+            self.stats['checked'] += 1
+            if self._rate_limited(user_id, now):
+                self.stats['rate_limited'] += 1
+                return 'rate_limited'
+
+            for scope in scopes:
+                index = self._indexes.get(scope)
+                if index is not None and index.find(fingerprint, self.max_distance) is not None:
+                    self.stats['duplicates'] += 1
+                    return 'duplicate'
+            return None
+
+    def register(self, user_id, content, story_id=None, module_id=None, now=None):
+        """登记已成功提交的评论：计入限流窗口并加入各范围的指纹索引"""
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        fingerprint = simhash(content)
+        scopes = self._scopes(user_id, content, story_id, module_id)
+
+        with self._lock:
+            self._rate_limited(user_id, now)  # 确保窗口存在并清理过期的提交时间
+            self._submissions[user_id].append(now)
+            for scope in scopes:
+                self._index(scope).add(fingerprint)
+            self.stats['accepted'] += 1
+
+    def get_stats(self):
+        """统计信息：拒绝数即节省的评论写入次数"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['writes_avoided'] = stats['rate_limited'] + stats['duplicates']
+            stats['indexed_scopes'] = len(self._indexes)
+            stats['indexed_fingerprints'] = sum(len(i) for i in self._indexes.values())
+        return stats
+
+
+REJECT_MESSAGES = {
+    'rate_limited': '评论过于频繁，请稍后再试',
+    'duplicate': '请勿重复发表相同或相似的评论'
+}
+
+
+def init_antispam(app):
+    """注册评论防刷检查器"""
+    guard = CommentGuard(app)
+    app.extensions['antispam'] = guard
+    return guard
+
+
+def get_comment_guard():
+    """获取当前应用的评论防刷检查器"""
+    return current_app.extensions['antispam']
+
+
+def check_comment(user_id, content, story_id=None, module_id=None):
+    """检查评论提交，返回拒绝原因或 None"""
+    return get_comment_guard().check(user_id, content, story_id=story_id, module_id=module_id)
+
+
+def register_comment(user_id, content, story_id=None, module_id=None):
+    """评论提交成功后登记，供后续的限流和查重使用"""
+    get_comment_guard().register(user_id, content, story_id=story_id, module_id=module_id)
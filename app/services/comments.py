@@ -0,0 +1,105 @@
+"""
+评论树加载 - 一次递归查询加载顶级评论及多层回复
+"""
+from sqlalchemy import and_, literal, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models import Comment, User
+from app.utils.helpers import decode_cursor, encode_cursor, keyset_filter, keyset_order
+
+
+# 顶级评论的排序键：置顶优先，然后按时间倒序，ID保证唯一
+THREAD_ORDER = [
+    (Comment.is_pinned, True),
+    (Comment.created_at, True),
+    (Comment.id, True)
+]
+
+
+def _visible(model):
+    """评论可见条件：未删除且已审核"""
+    return and_(model.is_deleted == False, model.is_approved == True)
+
+
+def load_comment_tree(story_id=None, module_id=None, depth=2, cursor=None, limit=20):
+    """
+    加载评论树
+
+    顶级评论按 (is_pinned, created_at, id) 降序并使用游标分页；
+    每页的顶级评论和 depth 层回复由一条递归CTE查询取出，
+    作者信息用一次批量查询补齐，回复数读取冗余计数列。
+
+    Args:
+        story_id: 故事ID
+        module_id: 学习模块ID
+        depth: 加载的回复层数（0表示只加载顶级评论）
+        cursor: 上一页返回的 next_cursor
+        limit: 每页顶级评论数量
+
+    Returns:
+        {'items': [...], 'next_cursor': str或None, 'has_next': bool}
+    """
+    # 顶级评论页（多取一条用于判断是否还有下一页）
+    top = select(Comment.id).where(
+        Comment.parent_id.is_(None),
+        _visible(Comment)
+    )
+    if story_id is not None:
+        top = top.where(Comment.story_id == story_id)
+    if module_id is not None:
+        top = top.where(Comment.module_id == module_id)
+    if cursor:
+        top = top.where(keyset_filter(THREAD_ORDER, decode_cursor(cursor, len(THREAD_ORDER))))
+    top = top.order_by(*keyset_order(THREAD_ORDER)).limit(limit + 1)
+
+    # 递归CTE：从本页顶级评论向下展开 depth 层回复
+    tree = select(Comment.id, literal(0).label('depth'))\
+        .where(Comment.id.in_(top.subquery().select()))\
+        .cte('comment_tree', recursive=True)
+    child = aliased(Comment)
+    tree = tree.union_all(
+        select(child.id, tree.c.depth + 1)
+        .join(tree, child.parent_id == tree.c.id)
+        .where(tree.c.depth < depth, _visible(child))
+    )
+
+    rows = db.session.query(Comment, tree.c.depth)\
+        .join(tree, Comment.id == tree.c.id)\
+        .order_by(Comment.created_at, Comment.id).all()
+
+    comments = [row[0] for row in rows]
+    if not comments:
+        return {'items': [], 'next_cursor': None, 'has_next': False}
+
+    # 批量加载作者
+    author_ids = {c.user_id for c in comments}
+    authors = {u.id: u for u in User.query.filter(User.id.in_(author_ids)).all()}
+
+    # 组装树结构（回复按时间正序挂到父评论下）
+    nodes = {}
+    for comment in comments:
+        node = comment.to_dict(author=authors.get(comment.user_id))
+        node['replies'] = []
+        nodes[comment.id] = node
+
+    top_level = []
+    for comment in comments:
+        if comment.parent_id is None:
+            top_level.append(comment)
+        elif comment.parent_id in nodes:
+            nodes[comment.parent_id]['replies'].append(nodes[comment.id])
+
+    # 与 keyset_order 一致：is_pinned 为空的评论排在最后
+    top_level.sort(key=lambda c: (c.is_pinned is not None, bool(c.is_pinned), c.created_at, c.id),
+                   reverse=True)
+    has_next = len(top_level) > limit
+    page = top_level[:limit]
+    last = page[-1]
+
+    return {
+        'items': [nodes[c.id] for c in page],
+        'next_cursor': encode_cursor([last.is_pinned, last.created_at, last.id])
+                       if has_next else None,
+        'has_next': has_next
+    }
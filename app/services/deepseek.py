@@ -1,7 +1,6 @@
 """
 DeepSeek API集成 - 智能推荐和内容分析
 """
-import requests
 from flask import current_app
 import logging
 
@@ -28,6 +27,9 @@ class DeepSeekClient:
             'Content-Type': 'application/json'
         }
 
+        # requests 只在实际调用 API 时导入，不拖慢应用启动
+        import requests
+
         try:
             if method == 'POST':
                 response = requests.post(url, json=data, headers=headers, timeout=self.timeout)
@@ -0,0 +1,193 @@
+"""
+学习心跳合并 - 在内存中按 (用户, 模块) 合并进度、时长和位置，批量写入
+
+心跳的各项更新可交换：进度取最大值、时长累加、位置取最新，
+因此合并后一次 UPDATE 与逐条写入的结果相同。完成模块仍走即时提交。
+达到数量阈值时即时写入，后台线程按时间间隔写入空闲进程中的心跳；
+写入失败时更新合并回缓冲区，等待下次写入。
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, case, func, update
+
+from app import db
+from app.models import UserProgress
+from app.utils.background import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatBuffer:
+    """学习心跳缓冲区"""
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_size = app.config.get('HEARTBEAT_FLUSH_SIZE', 500)
+        self.flush_interval = app.config.get('HEARTBEAT_FLUSH_INTERVAL', 30)
+        self._entries = {}  # (user_id, module_id) -> 合并后的更新
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = PeriodicTask(app, 'heartbeat-flusher', self.flush_interval, self.flush)
+        self.stats = {'heartbeats': 0, 'flushed_rows': 0, 'flushes': 0, 'errors': 0}
+
+    def start(self):
+        """启动后台定时写入"""
+        self._flusher.start()
+
+    def stop(self):
+        """停止后台定时写入"""
+        self._flusher.stop()
+
+    def after_fork(self):
+        """进程派生后按配置重新启动后台定时写入"""
+        if self.app.config.get('HEARTBEAT_BACKGROUND_FLUSH'):
+            self._flusher.after_fork()
+
+    def add(self, user_id, module_id, progress=None, minutes=0, last_position=None):
+        """合并一次心跳，返回该键当前待写的合并结果"""
+        with self._lock:
+            entry = self._merge((user_id, module_id), {
+                'progress': progress, 'minutes': minutes,
+                'last_position': last_position, 'last_accessed': datetime.utcnow()
+            })
+            self.stats['heartbeats'] += 1
+            merged = dict(entry)
+            should_flush = len(self._entries) >= self.flush_size or \
+                time.monotonic() - self._last_flush >= self.flush_interval
+
+        if should_flush:
+            try:
+                self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"学习进度写入失败，保留待下次写入: {str(e)}")
+        return merged
+
+    def _merge(self, key, update):
+        """把一次更新合并到键的待写条目（需持有锁）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = {
+                'progress': None, 'minutes': 0, 'last_position': None, 'last_accessed': None
+            }
+        if update['progress'] is not None:
+            entry['progress'] = update['progress'] if entry['progress'] is None else \
+                max(entry['progress'], update['progress'])
+        entry['minutes'] += update['minutes']
+        if update['last_position']:
+            entry['last_position'] = update['last_position']
+        if entry['last_accessed'] is None or update['last_accessed'] > entry['last_accessed']:
+            entry['last_accessed'] = update['last_accessed']
+        return entry
+
+    def _restore(self, entries):
+        """写入失败时把取出的更新合并回缓冲区（之后的心跳位置更新优先）"""
+        with self._lock:
+            newer, self._entries = self._entries, {}
+            for source in (entries, newer):
+                for key, entry in source.items():
+                    self._merge(key, entry)
+
+    def pending(self, user_id, module_id):
+        """尚未写入的合并更新，没有则返回 None"""
+        entry = self._entries.get((user_id, module_id))
+        return dict(entry) if entry else None
+
+    def flush(self, user_id=None, module_id=None):
+        """
+        批量写入待写更新
+
+        Args:
+            user_id: 只写入该用户的更新（登出时使用）
+            module_id: 与 user_id 一起指定时只写入单个键
+
+        Returns:
+            写入的键数量
+        """
+        with self._flush_lock:
+            with self._lock:
+                if user_id is None:
+                    entries, self._entries = self._entries, {}
+                    self._last_flush = time.monotonic()
+                else:
+                    keys = [k for k in self._entries
+                            if k[0] == user_id and (module_id is None or k[1] == module_id)]
+                    entries = {k: self._entries.pop(k) for k in keys}
+            if not entries:
+                return 0
+
+            table = UserProgress.__table__
+            progress = bindparam('b_progress', type_=db.Float)
+            stmt = update(table).where(
+                table.c.user_id == bindparam('b_user_id'),
+                table.c.module_id == bindparam('b_module_id')
+            ).values(
+                progress=case(
+                    (progress.is_(None), table.c.progress),
+                    (table.c.progress < progress, progress),
+                    else_=table.c.progress
+                ),
+                time_spent=func.coalesce(table.c.time_spent, 0) + bindparam('b_minutes'),
+                last_position=func.coalesce(bindparam('b_last_position', type_=db.String), table.c.last_position),
+                last_accessed=bindparam('b_last_accessed')
+            )
+            params = [{
+                'b_user_id': key[0],
+                'b_module_id': key[1],
+                'b_progress': entry['progress'],
+                'b_minutes': entry['minutes'],
+                'b_last_position': entry['last_position'],
+                'b_last_accessed': entry['last_accessed']
+            } for key, entry in entries.items()]
+
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(stmt, params)
+            except Exception:
+                self._restore(entries)
+                raise
+
+            from app.services.user_stats import invalidate_learning_stats
+            invalidate_learning_stats(*{key[0] for key in entries})
+
+            self.stats['flushed_rows'] += len(params)
+            self.stats['flushes'] += 1
+            return len(params)
+
+
+def init_heartbeats(app):
+    """注册学习心跳缓冲区，按配置启动后台定时写入，进程退出时写入剩余数据"""
+    buffer = HeartbeatBuffer(app)
+    app.extensions['heartbeats'] = buffer
+    if app.config.get('HEARTBEAT_BACKGROUND_FLUSH'):
+        buffer.start()
+
+    def flush_on_exit():
+        try:
+            with app.app_context():
+                buffer.flush()
+        except Exception as e:
+            logger.error(f"退出时写入学习进度失败: {str(e)}")
+
+    atexit.register(flush_on_exit)
+    return buffer
+
+
+def get_heartbeat_buffer():
+    """获取当前应用的学习心跳缓冲区"""
+    return current_app.extensions['heartbeats']
+
+
+def flush_user_heartbeats(user_id):
+    """
+    写入某个用户在本进程中的全部待写心跳（登出或会话结束时）
+
+    其他工作进程中的心跳由各自的后台线程在 HEARTBEAT_FLUSH_INTERVAL 秒内写入。
+    """
+    return get_heartbeat_buffer().flush(user_id=user_id)
@@ -0,0 +1,304 @@
+"""
+积分排行榜 - 基于积分分桶的树状数组，排名查询 O(log n)
+
+积分映射到固定数量的桶：绝对值小于 LINEAR_BUCKETS 时每个积分一个桶，
+更大的积分按数量级分桶（每个2的幂区间再细分 SUB_BUCKETS 个），负分
+对称地排在所有非负分之前。树状数组记录每个桶的人数，桶内成员按
+(积分降序, 用户ID升序) 保存为有序列表，因此每个用户的名次唯一：
+名次 = 更高桶的人数 + 桶内排在前面的人数 + 1。桶的数量与积分大小无关。
+
+User.add_points 把积分变动登记在 session.info['points_changes'] 中，
+事务提交后增量应用、回滚时丢弃；各进程的榜单由后台线程定期从数据库
+重建以收敛误差，请求线程只在首次使用时构建。
+"""
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+
+from app import db
+from app.utils.background import PeriodicTask
+
+# 积分分桶：|积分| < LINEAR_BUCKETS 时每分一个桶，之后每个2的幂区间 SUB_BUCKETS 个桶
+LINEAR_BUCKETS = 1024
+SUB_BITS = 6
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_MAGNITUDE = (1 << 64) - 1
+_FIRST_SHIFT = LINEAR_BUCKETS.bit_length() - SUB_BITS - 1
+
+
+def _magnitude_bucket(magnitude):
+    """非负积分的桶号（单调不减）"""
+    if magnitude < LINEAR_BUCKETS:
+        return magnitude
+    magnitude = min(magnitude, MAX_MAGNITUDE)
+    shift = magnitude.bit_length() - SUB_BITS - 1
+    return LINEAR_BUCKETS + (shift - _FIRST_SHIFT) * SUB_BUCKETS + (magnitude >> shift) - SUB_BUCKETS
+
+
+# 单侧（非负或负分）的桶数
+SIDE_BUCKETS = _magnitude_bucket(MAX_MAGNITUDE) + 1
+
+
+def score_bucket(score):
+    """积分对应的桶号：负分在前、非负分在后，与积分大小顺序一致"""
+    score = int(score)
+    if score < 0:
+        return SIDE_BUCKETS - 1 - _magnitude_bucket(-score)
+    return SIDE_BUCKETS + _magnitude_bucket(score)
+
+
+class FenwickTree:
+    """树状数组：单点增减、前缀和、按累计值定位，均为 O(log n)"""
+
+    def __init__(self, size):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        i = index + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        """位置 0..index 的和（index < 0 时为 0）"""
+        i = min(index, self.size - 1) + 1
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k):
+        """最小的位置 p，使 prefix(p) >= k（k 从1开始）"""
+        pos = 0
+        step = 1 << (self.size.bit_length() - 1) if self.size else 0
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self._tree[nxt] < k:
+                pos = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return pos
+
+
+class Leaderboard:
+    """单个排行榜"""
+
+    def __init__(self, scores=None):
+        scores = scores or {}
+        self._lock = threading.Lock()
+        self._scores = {}
+        self._buckets = {}  # 桶号 -> [(−积分, 用户ID), ...] 有序
+        self._tree = FenwickTree(2 * SIDE_BUCKETS)
+        for user_id, score in scores.items():
+            self._insert(user_id, score)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def _insert(self, user_id, score):
+        bucket = score_bucket(score)
+        self._scores[user_id] = score
+        bisect.insort(self._buckets.setdefault(bucket, []), (-score, user_id))
+        self._tree.add(bucket, 1)
+
+    def _remove(self, user_id):
+        score = self._scores.pop(user_id)
+        bucket = score_bucket(score)
+        members = self._buckets[bucket]
+        del members[bisect.bisect_left(members, (-score, user_id))]
+        if not members:
+            del self._buckets[bucket]
+        self._tree.add(bucket, -1)
+
+    def set(self, user_id, score):
+        """设置用户积分"""
+        with self._lock:
+            if user_id in self._scores:
+                self._remove(user_id)
+            self._insert(user_id, score)
+
+    def add(self, user_id, delta):
+        """增加用户积分"""
+        with self._lock:
+            score = self._scores.get(user_id, 0)
+            if user_id in self._scores:
+                self._remove(user_id)
+            self._insert(user_id, score + delta)
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def _rank(self, user_id):
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        bucket = score_bucket(score)
+        higher = len(self._scores) - self._tree.prefix(bucket)
+        return higher + bisect.bisect_left(self._buckets[bucket], (-score, user_id)) + 1
+
+    def _user_at(self, rank):
+        total = len(self._scores)
+        k = total - rank + 1  # 按积分升序的位置
+        bucket = self._tree.find(k)
+        below = self._tree.prefix(bucket - 1)
+        members = self._buckets[bucket]
+        return members[len(members) - 1 - (k - below - 1)][1]
+
+    def rank(self, user_id):
+        """用户名次（从1开始），不在榜上返回 None"""
+        with self._lock:
+            return self._rank(user_id)
+
+    def top(self, limit=10):
+        """前N名 [(名次, 用户ID, 积分), ...]"""
+        with self._lock:
+            count = min(limit, len(self._scores))
+            return [(r, uid, self._scores[uid]) for r, uid in
+                    ((r, self._user_at(r)) for r in range(1, count + 1))]
+
+    def around(self, user_id, radius=5):
+        """用户前后各 radius 名 [(名次, 用户ID, 积分), ...]"""
+        with self._lock:
+            rank = self._rank(user_id)
+            if rank is None:
+                return []
+            first = max(1, rank - radius)
+            last = min(len(self._scores), rank + radius)
+            result = []
+            for r in range(first, last + 1):
+                uid = self._user_at(r)
+                result.append((r, uid, self._scores[uid]))
+            return result
+
+
+def week_start(now=None):
+    """本周一零点（UTC）"""
+    now = now or datetime.utcnow()
+    monday = now - timedelta(days=now.weekday())
+    return datetime(monday.year, monday.month, monday.day)
+
+
+class LeaderboardRegistry:
+    """
+    排行榜集合：总榜、周榜和按积分来源的分类榜
+
+    首次使用时从数据库构建，之后由后台线程每隔 LEADERBOARD_REBUILD_INTERVAL
+    重建（包括跨周），请求线程不等待重建；未启动后台线程时，读取方在榜单
+    过期或跨周后同步重建。两次重建之间由提交后的积分变动增量维护。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.rebuild_interval = app.config.get('LEADERBOARD_REBUILD_INTERVAL', 300)
+        self._boards = None
+        self._week = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuilder = PeriodicTask(app, 'leaderboard-rebuilder', self.rebuild_interval, self.rebuild)
+
+    def start(self):
+        """启动后台定时重建"""
+        self._rebuilder.start()
+
+    def stop(self):
+        """停止后台定时重建"""
+        self._rebuilder.stop()
+
+    def after_fork(self):
+        """进程派生后按配置重新启动后台定时重建"""
+        if self.app.config.get('LEADERBOARD_BACKGROUND_REBUILD'):
+            self._rebuilder.after_fork()
+
+    def rebuild(self):
+        """从数据库重建全部排行榜"""
+        from app.models import User, PointsLedger
+
+        overall = dict(db.session.query(User.id, User.points).filter(User.is_active == True).all())
+
+        by_source = {}
+        for source, user_id, total in db.session.query(
+                PointsLedger.source, PointsLedger.user_id, func.sum(PointsLedger.points))\
+                .group_by(PointsLedger.source, PointsLedger.user_id).all():
+            by_source.setdefault(source, {})[user_id] = int(total or 0)
+
+        week = week_start()
+        weekly = {user_id: int(total or 0) for user_id, total in db.session.query(
+            PointsLedger.user_id, func.sum(PointsLedger.points)
+        ).filter(PointsLedger.created_at >= week).group_by(PointsLedger.user_id).all()}
+
+        boards = {('all', None): Leaderboard({k: v or 0 for k, v in overall.items()}),
+                  ('weekly', None): Leaderboard(weekly)}
+        for source, scores in by_source.items():
+            boards[('all', source)] = Leaderboard(scores)
+
+        with self._lock:
+            self._boards = boards
+            self._week = week
+            self._built_at = time.monotonic()
+        return boards
+
+    def board(self, window='all', source=None):
+        """获取排行榜（window: 'all' 或 'weekly'；source: 积分来源，仅总榜支持）"""
+        boards = self._boards
+        if boards is None or (not self._rebuilder.running and (
+                self._week != week_start() or
+                time.monotonic() - self._built_at >= self.rebuild_interval)):
+            boards = self.rebuild()
+        board = boards.get((window, source))
+        return board if board is not None else Leaderboard()
+
+    def apply(self, changes):
+        """应用已提交的积分变动 [(用户ID, 积分, 来源, 时间), ...]"""
+        boards = self._boards
+        if boards is None:
+            return
+        week = self._week
+        for user_id, points, source, created_at in changes:
+            boards[('all', None)].add(user_id, points)
+            if created_at >= week:
+                boards[('weekly', None)].add(user_id, points)
+            board = boards.get(('all', source))
+            if board is None:
+                with self._lock:
+                    board = boards.setdefault(('all', source), Leaderboard())
+            board.add(user_id, points)
+
+    def invalidate(self):
+        """下次读取时从数据库重建"""
+        self._boards = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_committed_changes(session):
+    changes = session.info.pop('points_changes', None)
+    if changes and has_app_context():
+        registry = current_app.extensions.get('leaderboard')
+        if registry is not None:
+            registry.apply(changes)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_rolled_back_changes(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('points_changes', None)
+
+
+def init_leaderboard(app):
+    """注册排行榜（首次使用时从数据库构建），按配置启动后台定时重建"""
+    registry = LeaderboardRegistry(app)
+    app.extensions['leaderboard'] = registry
+    if app.config.get('LEADERBOARD_BACKGROUND_REBUILD'):
+        registry.start()
+    return registry
+
+
+def get_leaderboard(window='all', source=None):
+    """获取当前应用的排行榜"""
+    return current_app.extensions['leaderboard'].board(window, source)
+
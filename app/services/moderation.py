@@ -0,0 +1,140 @@
+"""
+评论批量审核 - 按ID列表或过滤条件分块执行集合式更新
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, select, update
+
+from app import db
+from app.models import Comment, Story, LearningModule
+
+# 动作定义：要写入的字段、需要变更的行、以及其中可见性发生变化的行和方向
+BULK_ACTIONS = {
+    'approve': {
+        'values': {'is_approved': True},
+        'pending': Comment.is_approved == False,
+        'visibility': (Comment.is_deleted == False, 1)
+    },
+    'delete': {
+        'values': {'is_deleted': True},
+        'pending': Comment.is_deleted == False,
+        'visibility': (Comment.is_approved == True, -1)
+    },
+    'restore': {
+        'values': {'is_deleted': False},
+        'pending': Comment.is_deleted == True,
+        'visibility': (Comment.is_approved == True, 1)
+    }
+}
+
+# 冗余计数目标：(表, 计数列名, 评论上的外键)
+COUNTER_TARGETS = [
+    (Story.__table__, 'comment_count', Comment.story_id),
+    (LearningModule.__table__, 'comment_count', Comment.module_id),
+    (Comment.__table__, 'reply_count', Comment.parent_id)
+]
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def build_comment_filter(ids=None, user_id=None, story_id=None, module_id=None,
+                         since=None, until=None, pattern=None):
+    """
+    构造评论过滤条件
+
+    Raises:
+        ValueError: 未提供任何条件或时间格式无效
+    """
+    conditions = []
+    if ids:
+        conditions.append(Comment.id.in_([int(i) for i in ids]))
+    if user_id is not None:
+        conditions.append(Comment.user_id == int(user_id))
+    if story_id is not None:
+        conditions.append(Comment.story_id == int(story_id))
+    if module_id is not None:
+        conditions.append(Comment.module_id == int(module_id))
+    if since:
+        conditions.append(Comment.created_at >= _parse_time(since))
+    if until:
+        conditions.append(Comment.created_at < _parse_time(until))
+    if pattern:
+        # 按字面匹配，% 和 _ 不作为通配符
+        conditions.append(Comment.content.contains(pattern, autoescape=True))
+
+    if not conditions:
+        raise ValueError('必须提供评论ID列表或至少一个过滤条件')
+    return conditions
+
+
+def _apply_counter_deltas(chunk_ids, visible_condition, direction):
+    """按目标分组统计可见性变化的评论数，一次 executemany 调整冗余计数"""
+    for table, counter, foreign_key in COUNTER_TARGETS:
+        rows = db.session.query(foreign_key, func.count(Comment.id)).filter(
+            Comment.id.in_(chunk_ids),
+            foreign_key.isnot(None),
+            visible_condition
+        ).group_by(foreign_key).all()
+        if not rows:
+            continue
+
+        column = table.c[counter]
+        stmt = update(table).where(table.c.id == bindparam('target_id'))\
+            .values({counter: column + bindparam('delta')})
+        db.session.execute(stmt, [
+            {'target_id': target_id, 'delta': direction * count}
+            for target_id, count in rows
+        ])
+
+
+def bulk_moderate(action, conditions, chunk_size=None):
+    """
+    批量审核评论
+
+    每个分块在一个事务内完成状态更新和冗余计数调整，
+    只处理状态确实需要变化的评论。
+
+    Args:
+        action: 'approve'、'delete' 或 'restore'
+        conditions: build_comment_filter 返回的条件列表
+        chunk_size: 每个事务处理的评论数
+
+    Returns:
+        {'action': ..., 'affected': 更新的评论数, 'chunks': 分块数}
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f'不支持的审核动作: {action}')
+    spec = BULK_ACTIONS[action]
+    visibility_condition, direction = spec['visibility']
+    chunk_size = chunk_size or current_app.config.get('MODERATION_CHUNK_SIZE', 500)
+
+    affected = 0
+    chunks = 0
+    last_id = 0
+    while True:
+        chunk_ids = db.session.execute(
+            select(Comment.id)
+            .where(and_(*conditions), spec['pending'], Comment.id > last_id)
+            .order_by(Comment.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not chunk_ids:
+            break
+
+        # 先按旧状态统计计数变化，再更新评论状态
+        _apply_counter_deltas(chunk_ids, visibility_condition, direction)
+        result = db.session.execute(
+            update(Comment.__table__)
+            .where(Comment.__table__.c.id.in_(chunk_ids))
+            .values(updated_at=datetime.utcnow(), **spec['values'])
+        )
+        db.session.commit()
+
+        affected += result.rowcount
+        chunks += 1
+        last_id = chunk_ids[-1]
+
+    return {'action': action, 'affected': affected, 'chunks': chunks}
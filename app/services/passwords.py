@@ -0,0 +1,99 @@
+"""
+密码校验 - 在有界线程池中执行哈希计算
+
+PBKDF2/scrypt 的计算在 hashlib 中释放 GIL，放入线程池后可以并行利用多核；
+池的工作线程数和排队上限都有界，登录高峰时超出上限的请求立即失败（503），
+不在工作进程中无限排队拖慢其他请求。两个上限都是每个工作进程的：线程数按进程
+分到的CPU计算，排队上限小于进程的请求线程数（见 config.py），否则请求线程
+先于排队上限耗尽，503永远不会触发。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app
+from werkzeug.security import check_password_hash
+
+
+class VerifierBusy(Exception):
+    """密码校验繁忙（排队已满或等待超时）"""
+
+
+class PasswordVerifier:
+    """有界的密码校验线程池"""
+
+    def __init__(self, max_workers, max_pending, timeout=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {'verified': 0, 'rejected': 0, 'timeouts': 0}
+
+    def _get_executor(self):
+        # 首次使用时才创建线程，预加载后 fork 出的工作进程各自拥有线程池
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='password-verify')
+        return self._executor
+
+    def verify(self, password_hash, password):
+        """
+        校验密码
+
+        Raises:
+            VerifierBusy: 排队已满或等待超时
+        """
+        if not self._slots.acquire(blocking=False):
+            self.stats['rejected'] += 1
+            raise VerifierBusy()
+        try:
+            future = self._get_executor().submit(check_password_hash, password_hash, password)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.stats['timeouts'] += 1
+            raise VerifierBusy()
+        self.stats['verified'] += 1
+        return result
+
+    def shutdown(self):
+        """停止线程池（已提交的校验会完成）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def init_passwords(app):
+    """注册密码校验线程池"""
+    verifier = PasswordVerifier(
+        max_workers=app.config.get('PASSWORD_VERIFY_WORKERS', 1),
+        max_pending=app.config.get('PASSWORD_VERIFY_MAX_PENDING', 3),
+        timeout=app.config.get('PASSWORD_VERIFY_TIMEOUT', 5)
+    )
+    app.extensions['password_verifier'] = verifier
+    return verifier
+
+
+def get_password_verifier():
+    """获取当前应用的密码校验线程池"""
+    return current_app.extensions['password_verifier']
+
+
+def verify_password(user, password):
+    """
+    在线程池中校验用户密码，用户不存在时返回 False
+
+    Raises:
+        VerifierBusy: 校验繁忙，调用方应返回503
+    """
+    if user is None or not user.password_hash:
+        return False
+    return get_password_verifier().verify(user.password_hash, password)
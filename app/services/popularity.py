@@ -0,0 +1,228 @@
+"""
+热门内容快照 - 后台预计算全局及分类热门榜单和趋势分数
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from types import MappingProxyType
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.services import trending
+
+logger = logging.getLogger(__name__)
+
+
+# 不可变快照：所有榜单都是ID元组，按分类的榜单用只读映射包装。
+# 发布新快照只是一次引用赋值，请求处理读取时无需加锁。
+PopularitySnapshot = namedtuple('PopularitySnapshot', [
+    'generated_at',
+    'featured_stories',
+    'popular_stories',
+    'popular_stories_by_category',
+    'popular_modules',
+    'popular_modules_by_category',
+    'popular_characters',
+    'popular_characters_by_type',
+    'trending_stories',
+    'trending_modules',
+    'counts'
+])
+
+
+def _top_n(rows, limit):
+    """将 (id, 分组, 分数) 行整理为全局和分组的前N名"""
+    overall = tuple(r[0] for r in rows[:limit])
+    grouped = {}
+    for item_id, group, _ in rows:
+        if group is None:
+            continue
+        bucket = grouped.setdefault(group, [])
+        if len(bucket) < limit:
+            bucket.append(item_id)
+    return overall, MappingProxyType({k: tuple(v) for k, v in grouped.items()})
+
+
+def build_snapshot(limit):
+    """从数据库构建一份新的热门内容快照"""
+    from app.models import Story, LearningModule, Character, UserProgress
+
+    story_rows = db.session.query(Story.id, Story.category, Story.view_count)\
+        .filter(Story.is_published == True)\
+        .order_by(Story.view_count.desc(), Story.id).all()
+    popular_stories, stories_by_category = _top_n(story_rows, limit)
+
+    module_rows = db.session.query(LearningModule.id, LearningModule.category,
+                                   LearningModule.enrollment_count)\
+        .filter(LearningModule.is_published == True)\
+        .order_by(LearningModule.enrollment_count.desc(), LearningModule.id).all()
+    popular_modules, modules_by_category = _top_n(module_rows, limit)
+
+    character_rows = db.session.query(Character.id, Character.character_type,
+                                      Character.popularity_score)\
+        .filter(Character.is_active == True)\
+        .order_by(Character.popularity_score.desc(), Character.id).all()
+    popular_characters, characters_by_type = _top_n(character_rows, limit)
+
+    featured_stories = tuple(r[0] for r in db.session.query(Story.id).filter(
+        Story.is_published == True,
+        Story.is_featured == True
+    ).order_by(Story.created_at.desc()).limit(limit).all())
+
+    # 趋势分数由浏览事件增量维护，这里只按索引读取前N名
+    trending_stories = trending.get_top_scores(Story, limit)
+    trending_modules = trending.get_top_scores(LearningModule, limit)
+
+    counts = MappingProxyType({
+        'total_stories': len(story_rows),
+        'total_modules': len(module_rows),
+        'total_characters': len(character_rows),
+        'total_learners': db.session.query(
+            func.count(func.distinct(UserProgress.user_id))
+        ).scalar() or 0
+    })
+
+    return PopularitySnapshot(
+        generated_at=datetime.utcnow(),
+        featured_stories=featured_stories,
+        popular_stories=popular_stories,
+        popular_stories_by_category=stories_by_category,
+        popular_modules=popular_modules,
+        popular_modules_by_category=modules_by_category,
+        popular_characters=popular_characters,
+        popular_characters_by_type=characters_by_type,
+        trending_stories=tuple(trending_stories),
+        trending_modules=tuple(trending_modules),
+        counts=counts
+    )
+
+
+class PopularityCache:
+    """
+    热门内容快照缓存
+
+    后台线程按固定间隔重建快照；未启动后台线程时，
+    读取方在快照过期后同步重建一次。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.limit = app.config.get('POPULARITY_TOP_N', 50)
+        self.interval = app.config.get('POPULARITY_REFRESH_INTERVAL', 300)
+        self.snapshot = None
+        self._refreshed_at = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def refresh(self):
+        """重建并发布新快照"""
+        snapshot = build_snapshot(self.limit)
+        self.snapshot = snapshot
+        self._refreshed_at = time.monotonic()
+        return snapshot
+
+    def get(self):
+        """获取当前快照"""
+        snapshot = self.snapshot
+        if snapshot is None or (self._thread is None and
+                                time.monotonic() - self._refreshed_at >= self.interval):
+            snapshot = self.refresh()
+        return snapshot
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='popularity-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self._stop.set()
+        self._thread = None
+
+    def after_fork(self):
+        """进程派生后调用：父进程的刷新线程不会被复制，按配置重新启动"""
+        self._thread = None
+        self._stop = threading.Event()
+        if self.app.config.get('POPULARITY_BACKGROUND_REFRESH'):
+            self.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"热门内容快照刷新失败: {str(e)}")
+                finally:
+                    db.session.remove()
+            self._stop.wait(self.interval)
+
+
+def init_popularity(app):
+    """注册热门内容快照缓存，并按配置启动后台刷新"""
+    cache = PopularityCache(app)
+    app.extensions['popularity'] = cache
+    if app.config.get('POPULARITY_BACKGROUND_REFRESH'):
+        cache.start()
+    return cache
+
+
+def get_snapshot():
+    """获取当前应用的热门内容快照"""
+    return current_app.extensions['popularity'].get()
+
+
+def load_ordered(model, ids):
+    """按ID列表顺序加载对象（主键查询，无需排序）"""
+    ids = list(ids)
+    if not ids:
+        return []
+    objects = {obj.id: obj for obj in model.query.filter(model.id.in_(ids)).all()}
+    return [objects[i] for i in ids if i in objects]
+
+
+def get_popular_stories(limit=10, category=None):
+    """获取热门故事"""
+    from app.models import Story
+    snapshot = get_snapshot()
+    if category:
+        ids = snapshot.popular_stories_by_category.get(category, ())
+    else:
+        ids = snapshot.popular_stories
+    return load_ordered(Story, ids[:limit])
+
+
+def get_featured_stories(limit=5):
+    """获取精选故事"""
+    from app.models import Story
+    return load_ordered(Story, get_snapshot().featured_stories[:limit])
+
+
+def get_popular_modules(limit=10, category=None):
+    """获取热门学习模块"""
+    from app.models import LearningModule
+    snapshot = get_snapshot()
+    if category:
+        ids = snapshot.popular_modules_by_category.get(category, ())
+    else:
+        ids = snapshot.popular_modules
+    return load_ordered(LearningModule, ids[:limit])
+
+
+def get_popular_characters(limit=10, character_type=None):
+    """获取热门角色"""
+    from app.models import Character
+    snapshot = get_snapshot()
+    if character_type:
+        ids = snapshot.popular_characters_by_type.get(character_type, ())
+    else:
+        ids = snapshot.popular_characters
+    return load_ordered(Character, ids[:limit])
+
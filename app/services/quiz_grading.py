@@ -0,0 +1,150 @@
+"""
+测验评分 - 按版本缓存预编译的答案表，一次遍历完成评分
+"""
+import threading
+from collections import namedtuple
+
+from flask import current_app
+
+from app import db
+
+# 预编译的答案表：各字段是按题目顺序排列的元组
+AnswerKey = namedtuple('AnswerKey', [
+    'quiz_id',
+    'version',
+    'question_ids',
+    'answers',
+    'points',
+    'explanations',
+    'total_points'
+])
+
+# 评分结果：correct 与 AnswerKey.question_ids 一一对应
+GradeResult = namedtuple('GradeResult', [
+    'user_answers',
+    'correct',
+    'earned',
+    'earned_points',
+    'total_points',
+    'score'
+])
+
+
+def normalize_answer(value):
+    """
+    规范化答案：列表转为 frozenset（多选题不计顺序），其他值原样比较
+
+    与 QuizQuestion.check_answer 的结果一致，字符串不去空白、区分大小写。
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(normalize_answer(v) for v in value)
+    return value
+
+
+def build_answer_key(quiz_id, version):
+    """从数据库加载题目并编译答案表（一次查询）"""
+    from app.models import QuizQuestion
+
+    rows = db.session.query(
+        QuizQuestion.id,
+        QuizQuestion.correct_answer,
+        QuizQuestion.points,
+        QuizQuestion.explanation
+    ).filter(QuizQuestion.quiz_id == quiz_id)\
+        .order_by(QuizQuestion.order, QuizQuestion.id).all()
+
+    points = tuple(row.points or 0 for row in rows)
+    return AnswerKey(
+        quiz_id=quiz_id,
+        version=version,
+        question_ids=tuple(row.id for row in rows),
+        answers=tuple(normalize_answer(row.correct_answer) for row in rows),
+        points=points,
+        explanations=tuple(row.explanation for row in rows),
+        total_points=sum(points)
+    )
+
+
+class AnswerKeyCache:
+    """
+    答案表缓存
+
+    以测验ID为键保存编译好的答案表，读取时与 Quiz.version 比较，
+    题目被编辑后版本号变化（包括其他进程的修改），下一次评分自动重建。
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'builds': 0}
+
+    def get(self, quiz):
+        """获取测验当前版本的答案表"""
+        key = self._keys.get(quiz.id)
+        if key is not None and key.version == quiz.version:
+            self.stats['hits'] += 1
+            return key
+
+        key = build_answer_key(quiz.id, quiz.version)
+        with self._lock:
+            self._keys[quiz.id] = key
+            self.stats['builds'] += 1
+        return key
+
+    def invalidate(self, quiz_id=None):
+        """丢弃指定测验（或全部）的本地缓存"""
+        with self._lock:
+            if quiz_id is None:
+                self._keys.clear()
+            else:
+                self._keys.pop(quiz_id, None)
+
+
+def _match(expected, given):
+    if given is None:
+        return False
+    if isinstance(expected, frozenset) and not isinstance(given, frozenset):
+        given = frozenset([given])
+    try:
+        return given == expected
+    except TypeError:
+        return False
+
+
+def grade(key, answers):
+    """
+    按答案表评分
+
+    Args:
+        key: AnswerKey
+        answers: {question_id(字符串或整数): 用户答案}
+
+    Returns:
+        GradeResult
+    """
+    answers = {str(k): v for k, v in (answers or {}).items()}
+    user_answers = [answers.get(str(qid)) for qid in key.question_ids]
+    correct = [_match(expected, normalize_answer(given))
+               for expected, given in zip(key.answers, user_answers)]
+    earned = [p if ok else 0 for p, ok in zip(key.points, correct)]
+    earned_points = sum(earned)
+    score = int((earned_points / key.total_points) * 100) if key.total_points > 0 else 0
+    return GradeResult(user_answers, correct, earned, earned_points, key.total_points, score)
+
+
+def init_quiz_grading(app):
+    """注册答案表缓存"""
+    cache = AnswerKeyCache()
+    app.extensions['quiz_answer_keys'] = cache
+    return cache
+
+
+def get_answer_key(quiz):
+    """获取测验的答案表"""
+    return current_app.extensions['quiz_answer_keys'].get(quiz)
+
+
+def grade_submission(quiz, answers):
+    """使用缓存的答案表为一次提交评分"""
+    key = get_answer_key(quiz)
+    return key, grade(key, answers)
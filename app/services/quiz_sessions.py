@@ -0,0 +1,113 @@
+"""
+测验会话 - 记录开始时间和随机种子，强制时间限制并可重现地打乱题目顺序
+
+会话保存在TTL存储中而不是数据库：开始和提交都不产生写入，过期的会话
+由存储自动清理。默认使用进程内的 TTLCache；多工作进程部署时配置
+QUIZ_SESSION_STORE = 'redis'，会话保存在 REDIS_URL 上由各进程共享。
+题目顺序由种子确定性地生成，无需保存；超时的提交在评分和任何写入之前被拒绝。
+"""
+import random
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+
+from app.utils.cache import TTLCache, RedisTTLStore
+
+# started_at、deadline 为 Unix 时间戳（秒），各进程一致
+QuizSession = namedtuple('QuizSession', ['user_id', 'quiz_id', 'seed', 'started_at', 'deadline'])
+
+SESSION_ERRORS = {
+    'no_session': '请先开始测验',
+    'time_limit_exceeded': '已超过测验时间限制'
+}
+
+
+def init_quiz_sessions(app):
+    """按配置注册测验会话存储"""
+    ttl = app.config.get('QUIZ_SESSION_TTL', 7200)
+    if app.config.get('QUIZ_SESSION_STORE', 'memory') == 'redis':
+        store = RedisTTLStore(app.config['REDIS_URL'], prefix='quiz_session', default_ttl=ttl)
+    else:
+        store = TTLCache(
+            default_ttl=ttl,
+            max_size=app.config.get('QUIZ_SESSION_MAX', 100000),
+            sweep_interval=app.config.get('QUIZ_SESSION_SWEEP_INTERVAL', 60)
+        )
+    app.extensions['quiz_sessions'] = store
+    return store
+
+
+def _store():
+    return current_app.extensions['quiz_sessions']
+
+
+def _session(value):
+    # Redis 存储读回的是列表
+    if value is None or isinstance(value, QuizSession):
+        return value
+    return QuizSession(*value)
+
+
+def start_session(user_id, quiz, now=None):
+    """
+    开始（或继续）测验会话
+
+    已有未过期的会话时原样返回，刷新页面不会重置计时和题目顺序；
+    并发的开始请求由存储的写入判重保证只有一个会话生效。
+    """
+    now = time.time() if now is None else now
+    grace = current_app.config.get('QUIZ_TIME_GRACE', 30)
+    deadline = now + quiz.time_limit * 60 if quiz.time_limit else None
+    session = QuizSession(
+        user_id=user_id,
+        quiz_id=quiz.id,
+        seed=random.getrandbits(32),
+        started_at=now,
+        deadline=deadline
+    )
+    ttl = deadline - now + grace if deadline else None
+    return _session(_store().add((user_id, quiz.id), session, ttl=ttl))
+
+
+def order_questions(session, questions, shuffle=True):
+    """按会话种子确定性地打乱题目顺序"""
+    questions = list(questions)
+    if shuffle and session is not None:
+        random.Random(session.seed).shuffle(questions)
+    return questions
+
+
+def time_remaining(session, now=None):
+    """剩余秒数，无时间限制时返回 None"""
+    if session is None or session.deadline is None:
+        return None
+    now = time.time() if now is None else now
+    return max(0, int(session.deadline - now))
+
+
+def finish_session(user_id, quiz, now=None):
+    """
+    结束测验会话并检查时间限制
+
+    会话被原子地取出，并发的重复提交中只有一个能取得会话。
+
+    Returns:
+        (会话或None, 错误码或None)。有时间限制的测验必须有会话；
+        没有时间限制的测验允许没有会话的提交。
+    """
+    session = _session(_store().pop((user_id, quiz.id)))
+    if session is None:
+        return None, ('no_session' if quiz.time_limit else None)
+
+    now = time.time() if now is None else now
+    grace = current_app.config.get('QUIZ_TIME_GRACE', 30)
+    if session.deadline is not None and now > session.deadline + grace:
+        return session, 'time_limit_exceeded'
+    return session, None
+
+
+def started_at(session):
+    """会话开始时间（UTC datetime）"""
+    return datetime.utcfromtimestamp(session.started_at) if session else None
@@ -0,0 +1,242 @@
+"""
+互动服务 - 按用户去重的点赞/踩，计数写后批量刷新
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, update
+
+from app import db
+from app.models import Story, Comment, Reaction
+from app.utils.background import PeriodicTask
+from app.utils.helpers import insert_ignore
+
+logger = logging.getLogger(__name__)
+
+# 多行 INSERT 每条语句的最大行数（控制绑定参数数量）
+INSERT_CHUNK_SIZE = 500
+
+# 支持的互动及其对应的计数列
+REACTION_COUNTERS = {
+    ('story', 'like'): (Story.__table__, 'like_count'),
+    ('comment', 'like'): (Comment.__table__, 'like_count'),
+    ('comment', 'dislike'): (Comment.__table__, 'dislike_count')
+}
+
+
+def _insert_ignore(connection):
+    """构造忽略唯一约束冲突的互动插入语句"""
+    return insert_ignore(Reaction.__table__, connection.dialect.name)
+
+
+def _insert_new(connection, rows):
+    """插入互动记录（忽略重复），返回真正新增的 (target_type, target_id, kind) 列表"""
+    table = Reaction.__table__
+    stmt = _insert_ignore(connection)
+    if connection.dialect.insert_returning:
+        # 多行 INSERT ... RETURNING：冲突被忽略的行不会返回
+        inserted = []
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            result = connection.execute(
+                stmt.values(rows[start:start + INSERT_CHUNK_SIZE])
+                .returning(table.c.target_type, table.c.target_id, table.c.kind)
+            )
+            inserted.extend(tuple(row) for row in result)
+        return inserted
+
+    # 不支持 RETURNING 的数据库逐行插入，按影响行数判断是否新增
+    return [(row['target_type'], row['target_id'], row['kind'])
+            for row in rows if connection.execute(stmt, row).rowcount]
+
+
+class ReactionBuffer:
+    """
+    互动缓冲区
+
+    - 最近互动集合（有界LRU）在内存中拒绝重复互动，不访问数据库；
+    - 新互动先进入待写队列，达到数量阈值或由后台线程按时间间隔在独立
+      事务中批量写入，数据库唯一索引兜底跨进程的重复，只为真正新增的
+      记录累加计数；写入失败时待写互动放回队列，请求中触发的写入失败
+      只记录日志，由后台线程或下次写入重试。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_size = app.config.get('REACTION_FLUSH_SIZE', 100)
+        self.flush_interval = app.config.get('REACTION_FLUSH_INTERVAL', 5)
+        self.recent_size = app.config.get('REACTION_RECENT_SIZE', 100000)
+        self._recent = OrderedDict()
+        self._pending = OrderedDict()  # key -> created_at
+        self._pending_counts = {}  # (target_type, target_id, kind) -> 数量
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = PeriodicTask(app, 'reaction-flusher', self.flush_interval, self.flush)
+        self.stats = {'accepted': 0, 'duplicates': 0, 'flushed': 0, 'flushes': 0, 'errors': 0}
+
+    def start(self):
+        """启动后台定时写入"""
+        self._flusher.start()
+
+    def stop(self):
+        """停止后台定时写入"""
+        self._flusher.stop()
+
+    def after_fork(self):
+        """进程派生后按配置重新启动后台定时写入"""
+        if self.app.config.get('REACTION_BACKGROUND_FLUSH'):
+            self._flusher.after_fork()
+
+    def add(self, user_id, target_type, target_id, kind):
+        """
+        记录一次互动
+
+        Returns:
+            True 表示已接受，False 表示重复互动被拒绝
+        """
+        if (target_type, kind) not in REACTION_COUNTERS:
+            raise ValueError(f'不支持的互动类型: {target_type}/{kind}')
+
+        key = (user_id, target_type, target_id, kind)
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                self.stats['duplicates'] += 1
+                return False
+            self._recent[key] = True
+            if len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+
+            self._pending[key] = datetime.utcnow()
+            self._count_pending(key)
+            self.stats['accepted'] += 1
+            should_flush = len(self._pending) >= self.flush_size or \
+                time.monotonic() - self._last_flush >= self.flush_interval
+
+        if should_flush:
+            try:
+                self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"互动写入失败，保留 {len(self._pending)} 条待下次写入: {str(e)}")
+        return True
+
+    def _count_pending(self, key):
+        counter_key = key[1:]
+        self._pending_counts[counter_key] = self._pending_counts.get(counter_key, 0) + 1
+
+    def _restore(self, pending):
+        """写入失败时把取出的互动放回队列（排在新互动之前）"""
+        with self._lock:
+            for key in self._pending:
+                pending.setdefault(key, self._pending[key])
+            self._pending = pending
+            self._pending_counts = {}
+            for key in pending:
+                self._count_pending(key)
+
+    def pending_count(self, target_type, target_id, kind):
+        """尚未写入数据库的互动数量"""
+        return self._pending_counts.get((target_type, target_id, kind), 0)
+
+    def flush(self):
+        """将待写互动批量写入数据库并累加计数，返回新增的记录数"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, OrderedDict()
+                self._pending_counts = {}
+                self._last_flush = time.monotonic()
+            if not pending:
+                return 0
+
+            rows = [{'user_id': user_id, 'target_type': target_type, 'target_id': target_id,
+                     'kind': kind, 'created_at': created_at}
+                    for (user_id, target_type, target_id, kind), created_at in pending.items()]
+            deltas = {}
+            try:
+                with db.engine.begin() as connection:
+                    for target_type, target_id, kind in _insert_new(connection, rows):
+                        per_target = deltas.setdefault((target_type, kind), {})
+                        per_target[target_id] = per_target.get(target_id, 0) + 1
+
+                    for (target_type, kind), per_target in deltas.items():
+                        table, counter = REACTION_COUNTERS[(target_type, kind)]
+                        connection.execute(
+                            update(table).where(table.c.id == bindparam('target_id'))
+                            .values({counter: table.c[counter] + bindparam('delta')}),
+                            [{'target_id': t, 'delta': d} for t, d in per_target.items()]
+                        )
+            except Exception:
+                self._restore(pending)
+                raise
+
+            inserted = sum(sum(v.values()) for v in deltas.values())
+            self.stats['flushed'] += inserted
+            self.stats['flushes'] += 1
+            return inserted
+
+    def reacted(self, user_id, target_type, target_ids):
+        """
+        批量查询用户是否互动过这些对象
+
+        Returns:
+            {target_id: {kind, ...}}，未互动的对象不出现在结果中
+        """
+        target_ids = list(target_ids)
+        result = {}
+        if not target_ids:
+            return result
+
+        rows = db.session.query(Reaction.target_id, Reaction.kind).filter(
+            Reaction.user_id == user_id,
+            Reaction.target_type == target_type,
+            Reaction.target_id.in_(target_ids)
+        ).all()
+        for target_id, kind in rows:
+            result.setdefault(target_id, set()).add(kind)
+
+        kinds = [kind for (t, kind) in REACTION_COUNTERS if t == target_type]
+        pending = self._pending
+        for target_id in target_ids:
+            for kind in kinds:
+                if (user_id, target_type, target_id, kind) in pending:
+                    result.setdefault(target_id, set()).add(kind)
+        return result
+
+
+def init_reactions(app):
+    """注册互动缓冲区，按配置启动后台定时写入，进程退出时刷新剩余数据"""
+    buffer = ReactionBuffer(app)
+    app.extensions['reactions'] = buffer
+    if app.config.get('REACTION_BACKGROUND_FLUSH'):
+        buffer.start()
+
+    def flush_on_exit():
+        try:
+            with app.app_context():
+                buffer.flush()
+        except Exception as e:
+            logger.error(f"退出时刷新互动数据失败: {str(e)}")
+
+    atexit.register(flush_on_exit)
+    return buffer
+
+
+def get_reaction_buffer():
+    """获取当前应用的互动缓冲区"""
+    return current_app.extensions['reactions']
+
+
+def react(user_id, target_type, target_id, kind='like'):
+    """记录一次互动，重复时返回 False"""
+    return get_reaction_buffer().add(user_id, target_type, target_id, kind)
+
+
+def get_user_reactions(user_id, target_type, target_ids):
+    """批量查询用户对一组对象的互动"""
+    return get_reaction_buffer().reacted(user_id, target_type, target_ids)
@@ -4,7 +4,9 @@
 from app.models import (User, Story, LearningModule, UserProgress,
                        UserActivity, ContentView, Rating)
 from app.services.deepseek import get_deepseek_client
-from sqlalchemy import func, desc
+from app.services import popularity, trending
+from sqlalchemy import func, desc, exists, select
+from sqlalchemy.orm import aliased
 from datetime import datetime, timedelta
 import logging
 
@@ -101,34 +103,34 @@ def get_collaborative_stories(user_id, limit=5):
 
     找到相似用户喜欢的故事
     """
-    # 获取用户评分较高的故事
-    user_liked_stories = Rating.query.filter_by(user_id=user_id)\
-        .filter(Rating.score >= 4)\
-        .filter(Rating.story_id.isnot(None))\
-        .all()
-
-    if not user_liked_stories:
-        return []
-
-    liked_story_ids = [r.story_id for r in user_liked_stories]
+    # 用户评分较高的故事（子查询，不在Python中物化ID列表）
+    liked_story_ids = select(Rating.story_id).where(
+        Rating.user_id == user_id,
+        Rating.score >= 4,
+        Rating.story_id.isnot(None)
+    )
 
-    # 找到也喜欢这些故事的其他用户
-    similar_users = Rating.query.filter(
+    # 也喜欢这些故事的其他用户
+    similar_user_ids = select(Rating.user_id).where(
         Rating.story_id.in_(liked_story_ids),
         Rating.user_id != user_id,
         Rating.score >= 4
-    ).with_entities(Rating.user_id).distinct().all()
-
-    similar_user_ids = [u[0] for u in similar_users]
+    )
 
-    if not similar_user_ids:
-        return []
+    # 用户自己已喜欢的故事（相关反连接）。外层查询已连接 Rating，
+    # 子查询使用别名，只与外层的 Story 关联
+    own_rating = aliased(Rating)
+    already_liked = exists().where(
+        own_rating.user_id == user_id,
+        own_rating.story_id == Story.id,
+        own_rating.score >= 4
+    )
 
     # 获取这些用户喜欢的其他故事
     recommended = Story.query.join(Rating).filter(
         Rating.user_id.in_(similar_user_ids),
         Rating.score >= 4,
-        Story.id.notin_(liked_story_ids),
+        ~already_liked,
         Story.is_published == True
     ).group_by(Story.id)\
      .order_by(func.count(Rating.id).desc())\
@@ -157,13 +159,17 @@ def get_content_based_stories(user_id, limit=5):
 
     preferred_categories = [c[0] for c in viewed_categories]
 
-    # 获取用户已浏览的故事ID
-    viewed_story_ids = [v.story_id for v in ContentView.query.filter_by(user_id=user_id).all()]
+    # 用户已浏览过的故事：使用相关 NOT EXISTS 反连接，
+    # 避免物化浏览历史构造超长的 NOT IN 参数列表
+    already_viewed = exists().where(
+        ContentView.user_id == user_id,
+        ContentView.story_id == Story.id
+    )
 
     # 推荐相同分类的热门故事
     recommended = Story.query.filter(
         Story.category.in_(preferred_categories),
-        Story.id.notin_(viewed_story_ids) if viewed_story_ids else True,
+        ~already_viewed,
         Story.is_published == True
     ).order_by(Story.view_count.desc())\
      .limit(limit).all()
@@ -178,13 +184,18 @@ def get_next_modules(user_id, limit=10):
     基于用户当前等级和已完成模块
     """
     user = User.query.get(user_id)
-    completed_module_ids = [p.module_id for p in
-                           UserProgress.query.filter_by(user_id=user_id, completed=True).all()]
+
+    # 已完成的模块（相关反连接）
+    already_completed = exists().where(
+        UserProgress.user_id == user_id,
+        UserProgress.module_id == LearningModule.id,
+        UserProgress.completed == True
+    )
 
     # 推荐适合用户等级且未完成的模块
     recommended = LearningModule.query.filter(
         LearningModule.difficulty_level <= user.level + 1,
-        LearningModule.id.notin_(completed_module_ids) if completed_module_ids else True,
+        ~already_completed,
         LearningModule.is_published == True
     ).order_by(
         LearningModule.difficulty_level,
@@ -227,13 +238,10 @@ def get_default_recommendations(limit=10):
     """
     默认推荐（新用户或无足够历史数据）
     """
-    # 推荐精选和热门内容
-    featured_stories = Story.get_featured_stories(limit=5)
-    popular_stories = Story.get_popular_stories(limit=5)
-
-    popular_modules = LearningModule.query.filter_by(is_published=True)\
-        .order_by(LearningModule.enrollment_count.desc())\
-        .limit(limit).all()
+    # 推荐精选和热门内容（读取预计算的热门快照）
+    featured_stories = popularity.get_featured_stories(limit=5)
+    popular_stories = popularity.get_popular_stories(limit=5)
+    popular_modules = popularity.get_popular_modules(limit=limit)
 
     return {
         'stories': [s.to_dict() for s in featured_stories + popular_stories][:limit],
@@ -258,14 +266,15 @@ def deduplicate_and_limit(items, limit):
 
 
 def get_trending_content(days=7, limit=10):
-    """获取趋势内容"""
-    start_date = datetime.utcnow() - timedelta(days=days)
-
-    # 使用ContentView统计
-    trending_stories = ContentView.get_popular_content('story', limit=limit, days=days)
-    trending_modules = ContentView.get_popular_content('module', limit=limit, days=days)
+    """
+    获取趋势内容
 
+    趋势分数随浏览事件增量维护（见 app.services.trending），这里只按索引
+    读取前N名；days 参数仅为兼容保留，衰减速度由 TRENDING_HALF_LIFE_HOURS 决定。
+    """
     return {
-        'stories': trending_stories,
-        'modules': trending_modules
+        'stories': [{'story_id': story_id, 'score': round(score, 4)}
+                    for story_id, score in trending.get_top_scores(Story, limit)],
+        'modules': [{'module_id': module_id, 'score': round(score, 4)}
+                    for module_id, score in trending.get_top_scores(LearningModule, limit)]
     }
@@ -0,0 +1,157 @@
+"""
+JWT令牌 - 签名声明快速校验与吊销列表
+
+令牌携带 act（是否激活）、adm（是否管理员）、ver（令牌版本）声明。只读接口
+直接信任签名后的声明，不查询数据库；写操作再与用户快照中的 token_version
+比对，禁用账户或修改密码后旧令牌在写操作上立即失效。
+
+吊销的 jti 写入 revoked_tokens 表，各进程在内存中维护一个布隆过滤器：
+未命中即可确定未吊销，命中时才查询数据库确认。过滤器定期增量加载其他
+进程新增的吊销记录，并周期性全量重建以剔除已过期的记录。
+"""
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity
+from sqlalchemy import func
+
+from app import db, jwt
+from app.models import RevokedToken
+from app.utils.bloom import BloomFilter
+
+
+def token_claims(user):
+    """写入令牌的用户声明"""
+    return {
+        'act': bool(user.is_active),
+        'adm': bool(user.is_admin),
+        'ver': user.token_version or 0
+    }
+
+
+def create_tokens(user):
+    """签发访问令牌和刷新令牌，返回 (access_token, refresh_token)"""
+    identity = str(user.id)
+    claims = token_claims(user)
+    return (create_access_token(identity=identity, additional_claims=claims),
+            create_refresh_token(identity=identity, additional_claims=claims))
+
+
+def jwt_user_id():
+    """当前令牌中的用户ID（整数），未携带令牌时返回 None"""
+    identity = get_jwt_identity()
+    return int(identity) if identity is not None else None
+
+
+def token_version_matches(user, claims):
+    """令牌版本与用户当前版本一致（版本在禁用账户、修改密码时递增）"""
+    return claims.get('ver', 0) == (user.token_version or 0)
+
+
+class RevocationList:
+    """已吊销令牌的布隆过滤器，命中时再精确查询数据库"""
+
+    def __init__(self, app):
+        self.refresh_interval = app.config.get('JWT_REVOCATION_REFRESH_INTERVAL', 30)
+        self.rebuild_interval = app.config.get('JWT_REVOCATION_REBUILD_INTERVAL', 3600)
+        self.capacity = app.config.get('JWT_REVOCATION_BLOOM_CAPACITY', 100000)
+        self.error_rate = app.config.get('JWT_REVOCATION_BLOOM_ERROR_RATE', 0.001)
+        self._bloom = None
+        self._last_id = 0
+        self._built_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'checks': 0, 'positives': 0, 'revoked': 0}
+
+    def rebuild(self):
+        """从数据库全量构建（只包含未过期的记录）"""
+        last_id = db.session.query(func.max(RevokedToken.id)).scalar() or 0
+        jtis = [jti for (jti,) in db.session.query(RevokedToken.jti).filter(
+            RevokedToken.id <= last_id,
+            RevokedToken.expires_at >= datetime.utcnow()
+        ).all()]
+        bloom = BloomFilter(max(self.capacity, len(jtis) * 2), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+
+        now = time.monotonic()
+        with self._lock:
+            self._bloom = bloom
+            self._last_id = last_id
+            self._built_at = self._refreshed_at = now
+        return bloom
+
+    def refresh(self):
+        """增量加载其他进程新增的吊销记录"""
+        rows = db.session.query(RevokedToken.id, RevokedToken.jti)\
+            .filter(RevokedToken.id > self._last_id).order_by(RevokedToken.id).all()
+        with self._lock:
+            for row_id, jti in rows:
+                self._bloom.add(jti)
+                self._last_id = max(self._last_id, row_id)
+            self._refreshed_at = time.monotonic()
+        if self._bloom.saturated:
+            self.rebuild()
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self._bloom is None or now - self._built_at >= self.rebuild_interval:
+            self.rebuild()
+        elif now - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+
+    def add(self, jti):
+        """本进程吊销的令牌立即加入过滤器"""
+        self._maybe_refresh()
+        with self._lock:
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti):
+        """令牌是否已吊销（过滤器未命中时不查询数据库）"""
+        self._maybe_refresh()
+        self.stats['checks'] += 1
+        if jti not in self._bloom:
+            return False
+        self.stats['positives'] += 1
+        revoked = db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None
+        if revoked:
+            self.stats['revoked'] += 1
+        return revoked
+
+
+@jwt.user_identity_loader
+def _user_identity(identity):
+    # JWT 规范要求 sub 为字符串
+    return str(identity)
+
+
+@jwt.token_in_blocklist_loader
+def _token_revoked(jwt_header, jwt_payload):
+    return get_revocation_list().is_revoked(jwt_payload['jti'])
+
+
+def init_tokens(app):
+    """注册令牌吊销列表（首次校验令牌时从数据库构建）"""
+    revocations = RevocationList(app)
+    app.extensions['token_revocations'] = revocations
+    return revocations
+
+
+def get_revocation_list():
+    """获取当前应用的令牌吊销列表"""
+    return current_app.extensions['token_revocations']
+
+
+def revoke_token(payload):
+    """吊销已解码的令牌（不提交）"""
+    token = RevokedToken(
+        jti=payload['jti'],
+        user_id=int(payload['sub']) if payload.get('sub') is not None else None,
+        token_type=payload.get('type', 'access'),
+        expires_at=datetime.utcfromtimestamp(payload['exp'])
+    )
+    db.session.add(token)
+    get_revocation_list().add(token.jti)
+    return token
@@ -0,0 +1,158 @@
+"""
+趋势分数 - 指数时间衰减的增量维护
+
+每条浏览按 score = score·e^(−λΔt) + 1 更新。为了让所有内容的分数可以
+直接在索引上比较，数据库中保存的是以固定纪元为基准的对数值：
+
+    trending_score = ln( Σ e^(λ·(t_i − t0)) )
+
+所有内容随时间按同一比例衰减，因此该值的大小顺序就是当前趋势分数的
+顺序；新增一次浏览只需一次 logaddexp，且不会随时间溢出。
+当前分数可由 e^(trending_score − λ·(now − t0)) 还原。
+
+logaddexp 在一条 UPDATE 语句中由数据库计算，多个进程同时记录浏览时
+不会互相覆盖。
+"""
+import math
+import sqlite3
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, event, func
+
+from app import db
+
+# 对数分数的固定基准时间
+TRENDING_EPOCH = datetime(2024, 1, 1)
+
+
+def decay_rate(half_life_hours=None):
+    """衰减系数 λ（每秒）"""
+    if half_life_hours is None:
+        half_life_hours = current_app.config.get('TRENDING_HALF_LIFE_HOURS', 24)
+    return math.log(2) / (half_life_hours * 3600)
+
+
+def _log_add(a, b):
+    """数值稳定的 ln(e^a + e^b)"""
+    if a is None:
+        return b
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _log_add_expression(column, value):
+    """ln(e^column + e^value) 的SQL表达式（exp 的参数始终不大于0）"""
+    return case(
+        (column.is_(None), value),
+        (column >= value, column + func.ln(1 + func.exp(value - column))),
+        else_=value + func.ln(1 + func.exp(column - value))
+    )
+
+
+def record_view(content, now=None, weight=1.0):
+    """
+    为内容增加一次浏览的趋势分数（O(1)，原子更新，不提交）
+
+    Args:
+        content: 带有 trending_score 字段的 Story 或 LearningModule
+        now: 浏览时间
+        weight: 本次浏览的权重
+    """
+    now = now or datetime.utcnow()
+    exponent = decay_rate() * (now - TRENDING_EPOCH).total_seconds() + math.log(weight)
+    model = type(content)
+    db.session.query(model).filter(model.id == content.id).update(
+        {model.trending_score: _log_add_expression(model.trending_score, exponent)},
+        synchronize_session=False
+    )
+    # 内存中的旧值作废，下次访问时读取数据库计算的结果
+    db.session.expire(content, ['trending_score'])
+
+
+def _register_math_functions(dbapi_connection, connection_record):
+    """未编译数学函数的 SQLite 上注册 exp()/ln()"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    try:
+        dbapi_connection.execute('SELECT ln(1), exp(0)')
+    except sqlite3.OperationalError:
+        dbapi_connection.create_function('ln', 1, math.log, deterministic=True)
+        dbapi_connection.create_function('exp', 1, math.exp, deterministic=True)
+
+
+def init_trending(app):
+    """确保数据库连接支持趋势分数更新所需的数学函数"""
+    with app.app_context():
+        event.listen(db.engine, 'connect', _register_math_functions)
+
+
+def current_score(trending_score, now=None, half_life_hours=None):
+    """将对数分数还原为当前时刻的衰减分数"""
+    if trending_score is None:
+        return 0.0
+    now = now or datetime.utcnow()
+    exponent = decay_rate(half_life_hours) * (now - TRENDING_EPOCH).total_seconds()
+    return math.exp(trending_score - exponent)
+
+
+def get_top(model, limit=10):
+    """按趋势分数索引读取前N个已发布内容"""
+    return model.query.filter(
+        model.is_published == True,
+        model.trending_score.isnot(None)
+    ).order_by(model.trending_score.desc()).limit(limit).all()
+
+
+def get_top_scores(model, limit=10, now=None):
+    """读取前N个内容的ID及当前衰减分数"""
+    rows = db.session.query(model.id, model.trending_score).filter(
+        model.is_published == True,
+        model.trending_score.isnot(None)
+    ).order_by(model.trending_score.desc()).limit(limit).all()
+    now = now or datetime.utcnow()
+    return [(content_id, current_score(score, now)) for content_id, score in rows]
+
+
+def rebuild_trending_scores(model, column, days=None, now=None):
+    """
+    从浏览记录重建趋势分数（修改半衰期后使用）
+
+    Args:
+        model: Story 或 LearningModule
+        column: ContentView 上对应的外键列
+        days: 回溯的天数
+
+    Returns:
+        更新的内容数量
+    """
+    from app.models import ContentView
+
+    if days is None:
+        days = current_app.config.get('TRENDING_WINDOW_DAYS', 7)
+    now = now or datetime.utcnow()
+    rate = decay_rate()
+
+    # 按天聚合后计算，避免依赖数据库的 exp()/ln() 函数
+    day = func.date(ContentView.created_at)
+    rows = db.session.query(column, day, func.count(ContentView.id)).filter(
+        column.isnot(None),
+        ContentView.created_at >= now - timedelta(days=days)
+    ).group_by(column, day).all()
+
+    scores = {}
+    for content_id, view_day, count in rows:
+        if isinstance(view_day, str):
+            view_day = datetime.strptime(view_day, '%Y-%m-%d')
+        # 以当天中午作为该批浏览的代表时间
+        midday = min(now, datetime(view_day.year, view_day.month, view_day.day, 12))
+        exponent = rate * (midday - TRENDING_EPOCH).total_seconds() + math.log(count)
+        scores[content_id] = _log_add(scores.get(content_id), exponent)
+
+    model.query.update({model.trending_score: None}, synchronize_session=False)
+    for content_id, score in scores.items():
+        model.query.filter_by(id=content_id).update(
+            {model.trending_score: score}, synchronize_session=False
+        )
+    db.session.commit()
+    return len(scores)
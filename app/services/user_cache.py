@@ -0,0 +1,173 @@
+"""
+用户快照缓存 - 认证请求不再逐个查询用户表
+
+Flask-Login 和 JWT 校验只需要用户ID、状态、权限、等级、语言和令牌版本等少量字段，
+这些字段以快照形式在进程内短时缓存。资料修改、禁用和积分变动在提交后
+使对应快照失效；其余属性和方法在首次访问时才加载 ORM 对象。
+"""
+from flask import current_app, g, has_app_context
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, select
+
+from app import db
+from app.models import User
+from app.utils.cache import TTLCache
+
+SNAPSHOT_FIELDS = ('id', 'username', 'nickname', 'is_active', 'is_admin',
+                   'level', 'points', 'language', 'token_version')
+
+
+class UserSnapshot:
+    """
+    当前用户的只读快照（用作 current_user）
+
+    快照字段直接返回缓存值；访问其他属性、调用方法或赋值时加载 ORM 对象，
+    之后所有属性都以 ORM 对象为准，因此同一请求内的修改立即可见。
+    """
+    __slots__ = ('_data', '_user')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_user', None)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self._data["username"]}>'
+
+    def __eq__(self, other):
+        if isinstance(other, (UserSnapshot, User)):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self._data['id'])
+
+    @property
+    def is_active(self):
+        if self._user is not None:
+            return self._user.is_active
+        return self._data['is_active']
+
+    def get_id(self):
+        return str(self._data['id'])
+
+    def get_user(self):
+        """加载对应的 ORM 对象（每个请求至多一次查询）"""
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self._data['id']))
+        return self._user
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._user is None and name in self._data:
+            return self._data[name]
+        return getattr(self.get_user(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_user(), name, value)
+
+
+def init_user_cache(app):
+    """注册用户快照缓存"""
+    cache = TTLCache(
+        default_ttl=app.config.get('USER_CACHE_TTL', 60),
+        max_size=app.config.get('USER_CACHE_SIZE', 50000)
+    )
+    app.extensions['user_cache'] = cache
+    return cache
+
+
+def _cache():
+    if has_app_context():
+        return current_app.extensions.get('user_cache')
+    return None
+
+
+def _load_snapshot_data(user_id):
+    columns = [getattr(User, field) for field in SNAPSHOT_FIELDS]
+    row = db.session.execute(select(*columns).where(User.id == user_id)).first()
+    return dict(zip(SNAPSHOT_FIELDS, row)) if row is not None else None
+
+
+def get_user_snapshot(user_id):
+    """
+    获取用户快照，用户不存在时返回 None
+
+    同一请求内重复调用返回同一个对象；跨请求命中缓存时不查询数据库。
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    snapshots = g.setdefault('user_snapshots', {})
+    snapshot = snapshots.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    cache = _cache()
+    data = cache.get(user_id) if cache is not None else None
+    if data is None:
+        data = _load_snapshot_data(user_id)
+        if data is None:
+            return None
+        if cache is not None:
+            cache.set(user_id, data)
+
+    snapshot = snapshots[user_id] = UserSnapshot(data)
+    return snapshot
+
+
+def get_jwt_user():
+    """JWT 身份对应的用户快照（需在 JWT 校验之后调用）"""
+    return get_user_snapshot(get_jwt_identity())
+
+
+def invalidate_user(*user_ids):
+    """使指定用户的快照失效（包括当前上下文中已取得的快照）"""
+    cache = _cache()
+    if cache is None:
+        return
+    snapshots = g.get('user_snapshots', {})
+    for user_id in user_ids:
+        cache.delete(user_id)
+        snapshots.pop(user_id, None)
+
+
+def mark_user_dirty(session, user_id):
+    """立即失效，并在提交后再失效一次，避免并发请求缓存未提交前的旧值"""
+    invalidate_user(user_id)
+    session.info.setdefault('users_dirty', set()).add(user_id)
+
+
+@event.listens_for(User, 'after_update')
+def _mark_updated(mapper, connection, target):
+    """只有快照字段变化时才失效（如登录时间的更新不影响快照）"""
+    state = db.inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in SNAPSHOT_FIELDS):
+        mark_user_dirty(db.session, target.id)
+
+
+@event.listens_for(User, 'after_delete')
+def _mark_deleted(mapper, connection, target):
+    mark_user_dirty(db.session, target.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    dirty = session.info.pop('users_dirty', None)
+    if dirty:
+        invalidate_user(*dirty)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_dirty(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('users_dirty', None)
@@ -0,0 +1,131 @@
+"""
+用户学习统计 - 单条聚合查询加按用户缓存
+
+统计由一条带标量子查询的 SELECT 计算（支持批量），结果按用户缓存；
+进度、评论和评分发生变化时使对应用户的缓存失效。
+
+失效只作用于缓存所在的存储：
+- 进程内缓存（默认）只有发生变化的进程立即失效，其他工作进程最多读到
+  LEARNING_STATS_TTL 秒（默认5秒）前的统计；
+- LEARNING_STATS_STORE = 'redis' 时缓存按用户保存在 REDIS_URL 上，失效对
+  所有进程立即生效，只剩下失效与并发读取之间的短暂竞争（提交后会再失效一次）。
+"""
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+
+from app import db
+from app.models import User, UserProgress, Comment, Rating
+from app.utils.cache import TTLCache, RedisTTLStore
+
+
+def _stats_query(user_ids):
+    """一次查询计算多个用户的统计"""
+    def scalar(column, model, *conditions):
+        return select(column).where(model.user_id == User.id, *conditions)\
+            .correlate(User).scalar_subquery()
+
+    return select(
+        User.id,
+        scalar(func.count(UserProgress.id), UserProgress, UserProgress.completed == True),
+        scalar(func.avg(UserProgress.progress), UserProgress),
+        scalar(func.count(Comment.id), Comment),
+        scalar(func.count(Rating.id), Rating)
+    ).where(User.id.in_(user_ids))
+
+
+def compute_learning_stats(user_ids):
+    """从数据库计算统计，返回 {用户ID: 统计}（不存在的用户不出现）"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    return {
+        user_id: {
+            'completed_modules': completed or 0,
+            'average_progress': round(average or 0, 2),
+            'total_comments': comments or 0,
+            'total_ratings': ratings or 0
+        }
+        for user_id, completed, average, comments, ratings in
+        db.session.execute(_stats_query(user_ids)).all()
+    }
+
+
+def init_user_stats(app):
+    """按配置注册学习统计缓存"""
+    if app.config.get('LEARNING_STATS_STORE', 'memory') == 'redis':
+        cache = RedisTTLStore(app.config['REDIS_URL'], prefix='learning_stats',
+                              default_ttl=app.config.get('LEARNING_STATS_SHARED_TTL', 300))
+    else:
+        cache = TTLCache(
+            default_ttl=app.config.get('LEARNING_STATS_TTL', 5),
+            max_size=app.config.get('LEARNING_STATS_CACHE_SIZE', 50000)
+        )
+    app.extensions['learning_stats'] = cache
+    return cache
+
+
+def _cache():
+    if has_app_context():
+        return current_app.extensions.get('learning_stats')
+    return None
+
+
+def get_learning_stats_batch(user_ids):
+    """批量获取学习统计：命中缓存的直接返回，其余用一次查询补齐"""
+    cache = _cache()
+    result = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        stats = cache.get(user_id) if cache is not None else None
+        if stats is None:
+            missing.append(user_id)
+        else:
+            result[user_id] = stats
+    if missing:
+        computed = compute_learning_stats(missing)
+        if cache is not None:
+            for user_id, stats in computed.items():
+                cache.set(user_id, stats)
+        result.update(computed)
+    return result
+
+
+def get_learning_stats(user_id):
+    """获取单个用户的学习统计，用户不存在时返回 None"""
+    stats = get_learning_stats_batch([user_id]).get(user_id)
+    return dict(stats) if stats is not None else None
+
+
+def invalidate_learning_stats(*user_ids):
+    """使指定用户的统计缓存失效"""
+    cache = _cache()
+    if cache is None:
+        return
+    for user_id in user_ids:
+        cache.delete(user_id)
+
+
+def _mark_dirty(mapper, connection, target):
+    """行变更时立即失效，并在提交后再失效一次，避免并发读取缓存未提交前的旧值"""
+    if target.user_id is None:
+        return
+    invalidate_learning_stats(target.user_id)
+    db.session.info.setdefault('stats_dirty', set()).add(target.user_id)
+
+
+for _model in (UserProgress, Comment, Rating):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _mark_dirty)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    dirty = session.info.pop('stats_dirty', None)
+    if dirty:
+        invalidate_learning_stats(*dirty)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_dirty(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('stats_dirty', None)
@@ -4,4 +4,4 @@
 from app.utils.helpers import *
 from app.utils.decorators import *
 
-__all__ = ['helpers', 'decorators', 'init_data']
+__all__ = ['helpers', 'decorators', 'cache', 'bloom', 'background', 'init_data', 'prefork']
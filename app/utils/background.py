@@ -0,0 +1,60 @@
+"""
+后台周期任务 - 在守护线程中按固定间隔执行（如写后缓冲区的定时写入）
+"""
+import logging
+import threading
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """
+    按固定间隔在应用上下文中执行 func 的守护线程
+
+    线程不会随 fork 复制：预派生部署的主进程在派生前调用 stop()，
+    工作进程派生后调用 after_fork() 重新启动。
+    """
+
+    def __init__(self, app, name, interval, func):
+        self.app = app
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+        self._thread = None
+
+    def after_fork(self):
+        """进程派生后重新启动"""
+        self._thread = None
+        self._stop = threading.Event()
+        self.start()
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.func()
+                except Exception as e:
+                    logger.error(f"后台任务 {self.name} 执行失败: {str(e)}")
+                finally:
+                    db.session.remove()
@@ -0,0 +1,44 @@
+"""
+布隆过滤器 - 判断元素"一定不在"集合中
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    固定容量的布隆过滤器
+
+    按预期元素数和误判率计算位数与哈希函数个数；位置由一次 blake2b 摘要
+    拆出的两个64位整数做双重哈希得到。只会误判存在，不会漏判。
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def saturated(self):
+        """元素数超过设计容量，误判率已高于预期"""
+        return self.count > self.capacity
@@ -0,0 +1,174 @@
+"""
+缓存 - 带过期时间的键值存储（进程内或 Redis）
+"""
+import heapq
+import json
+import math
+import threading
+import time
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    线程安全的TTL缓存
+
+    过期条目在读取时判定失效；另外按 sweep_interval 在写入时顺带清理，
+    清理借助按过期时间排序的小顶堆，只处理已到期的条目，
+    因此无人读取的条目也不会无限累积。
+    """
+
+    def __init__(self, default_ttl=300, max_size=None, sweep_interval=60, clock=time.monotonic):
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._data = {}  # key -> (value, expires_at)
+        self._expiry = []  # [(expires_at, seq, key)]
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        """读取未过期的值"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= self._clock():
+            with self._lock:
+                if self._data.get(key) is entry:
+                    del self._data[key]
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        """写入值，ttl 为秒数（默认 default_ttl）"""
+        now = self._clock()
+        with self._lock:
+            self._set(key, value, ttl, now)
+
+    def add(self, key, value, ttl=None):
+        """键不存在（或已过期）时写入，返回键上当前的值"""
+        now = self._clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            self._set(key, value, ttl, now)
+        return value
+
+    def _set(self, key, value, ttl, now):
+        expires_at = now + (self.default_ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._seq += 1
+        heapq.heappush(self._expiry, (expires_at, self._seq, key))
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+        if self.max_size and len(self._data) > self.max_size:
+            self._evict()
+
+    def pop(self, key, default=None):
+        """取出并删除未过期的值"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or entry[1] <= self._clock():
+            return default
+        return entry[0]
+
+    def delete(self, key):
+        """删除键"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._expiry.clear()
+
+    def sweep(self):
+        """立即清理所有已过期条目，返回清理数量"""
+        with self._lock:
+            return self._sweep(self._clock())
+
+    def _sweep(self, now):
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self._expiry)
+            entry = self._data.get(key)
+            # 键被重新写入过时堆中的旧记录不再对应当前条目
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+                removed += 1
+        # 覆盖写入留下的陈旧堆记录过多时重建堆
+        if len(self._expiry) > 2 * len(self._data) + 64:
+            self._expiry = [(entry[1], i, key) for i, (key, entry) in enumerate(self._data.items())]
+            heapq.heapify(self._expiry)
+            self._seq = len(self._expiry)
+        self._last_sweep = now
+        return removed
+
+    def _evict(self):
+        """超出容量时按过期时间从早到晚淘汰"""
+        while self._expiry and len(self._data) > self.max_size:
+            expires_at, _, key = heapq.heappop(self._expiry)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+
+
+class RedisTTLStore:
+    """
+    Redis 上的TTL存储，接口与 TTLCache 的 get/set/add/pop/delete 相同
+
+    多个工作进程共享同一份数据，过期由 Redis 按键的TTL自动删除。
+    值以JSON保存（元组读回为列表）。需要安装 redis 包。
+    """
+
+    def __init__(self, url, prefix, default_ttl=300):
+        import redis
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self._redis = redis.Redis.from_url(url)
+
+    def _key(self, key):
+        parts = key if isinstance(key, tuple) else (key,)
+        return ':'.join([self.prefix, *map(str, parts)])
+
+    def _ttl(self, ttl):
+        return max(1, math.ceil(self.default_ttl if ttl is None else ttl))
+
+    @staticmethod
+    def _load(raw, default):
+        return default if raw is None else json.loads(raw)
+
+    def get(self, key, default=None):
+        """读取未过期的值"""
+        return self._load(self._redis.get(self._key(key)), default)
+
+    def set(self, key, value, ttl=None):
+        """写入值，ttl 为秒数（默认 default_ttl）"""
+        self._redis.set(self._key(key), json.dumps(value), ex=self._ttl(ttl))
+
+    def add(self, key, value, ttl=None):
+        """键不存在时写入（SET NX），返回键上当前的值"""
+        if self._redis.set(self._key(key), json.dumps(value), ex=self._ttl(ttl), nx=True):
+            return value
+        # 读取前键恰好过期时按写入的值返回
+        return self.get(key, value)
+
+    def pop(self, key, default=None):
+        """原子地取出并删除值（GETDEL，需要 Redis 6.2+）"""
+        return self._load(self._redis.getdel(self._key(key)), default)
+
+    def delete(self, key):
+        """删除键"""
+        self._redis.delete(self._key(key))
@@ -2,10 +2,9 @@
 装饰器 - 自定义装饰器函数
 """
 from functools import wraps
-from flask import jsonify, request, abort
+from flask import jsonify, request, abort, g
 from flask_login import current_user
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-from app.models import User
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
 
 
 def admin_required(f):
@@ -18,6 +17,19 @@ def admin_required(f):
     return decorated_function
 
 
+def multiple_commits_allowed(f):
+    """
+    允许请求提交多次事务（不受 STRICT_SINGLE_COMMIT 检查）
+
+    只用于有意分块提交的路由，如批量审核按块提交以缩短锁持有时间。
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.multiple_commits_allowed = request._get_current_object()
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 def json_required(f):
     """要求JSON格式的请求"""
     @wraps(f)
@@ -29,20 +41,38 @@ def json_required(f):
 
 
 def jwt_required_custom(f):
-    """自定义JWT验证装饰器（用于API）"""
+    """
+    写操作API的JWT验证装饰器
+
+    查询用户快照并比对令牌版本：禁用账户或修改密码后，旧令牌立即失效。
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        from app.services.user_cache import get_jwt_user
+        from app.services.tokens import token_version_matches
         try:
             verify_jwt_in_request()
-            current_user_id = get_jwt_identity()
-            user = User.query.get(current_user_id)
-            if not user or not user.is_active:
-                return jsonify({'error': '用户不存在或已被禁用'}), 401
-            # 将用户对象添加到kwargs中
-            kwargs['current_user'] = user
-            return f(*args, **kwargs)
+            user = get_jwt_user()
         except Exception as e:
             return jsonify({'error': '认证失败', 'message': str(e)}), 401
+        if not user or not user.is_active:
+            return jsonify({'error': '用户不存在或已被禁用'}), 401
+        if not token_version_matches(user, get_jwt()):
+            return jsonify({'error': '令牌已失效，请重新登录'}), 401
+        # 将用户对象添加到kwargs中
+        kwargs['current_user'] = user
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def jwt_claims_required(f):
+    """只读API的JWT验证装饰器：信任令牌中的签名声明，不查询用户"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        verify_jwt_in_request()
+        if not get_jwt().get('act', True):
+            return jsonify({'error': '用户已被禁用'}), 401
+        return f(*args, **kwargs)
     return decorated_function
 
 
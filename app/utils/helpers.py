@@ -1,10 +1,13 @@
 """
 辅助函数 - 通用工具函数
 """
+import base64
+import json
 import os
 import re
 from datetime import datetime, timedelta
 from flask import current_app
+from sqlalchemy import and_, false, insert, literal, or_
 from werkzeug.utils import secure_filename
 
 
@@ -79,8 +82,25 @@ def time_ago(dt):
         return f"{years}年前"
 
 
-def paginate(query, page, per_page):
-    """分页辅助函数"""
+def paginate(query, page, per_page, with_total=True):
+    """
+    分页辅助函数
+
+    with_total=False 时跳过 COUNT(*)，通过多取一条判断是否有下一页，
+    total 和 pages 返回 None。
+    """
+    if not with_total:
+        items = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+        return {
+            'items': items[:per_page],
+            'total': None,
+            'page': page,
+            'per_page': per_page,
+            'pages': None,
+            'has_next': len(items) > per_page,
+            'has_prev': page > 1
+        }
+
     pagination = query.paginate(
         page=page,
         per_page=per_page,
@@ -97,6 +117,139 @@ def paginate(query, page, per_page):
     }
 
 
+def insert_ignore(table, dialect):
+    """构造忽略唯一约束冲突的插入语句（dialect 为数据库方言名）"""
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return insert(table).prefix_with('IGNORE')
+    return insert(table)
+
+
+def _cursor_default(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f'无法编码到游标的值: {value!r}')
+
+
+def _cursor_hook(obj):
+    if '$dt' in obj:
+        return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+def encode_cursor(values):
+    """将排序键的值编码为不透明游标"""
+    raw = json.dumps(list(values), default=_cursor_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size=None):
+    """解码游标，格式无效时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded), object_hook=_cursor_hook)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+    if not isinstance(values, list) or (size is not None and len(values) != size):
+        raise ValueError(f'无效的游标: {cursor}')
+    return values
+
+
+def _nullable(column):
+    """排序列是否可能为空（无法判断的表达式按可空处理）"""
+    return getattr(column, 'nullable', True)
+
+
+def keyset_order(order_by):
+    """
+    键集分页的 ORDER BY 子句
+
+    可空列的 NULL 无论升降序都排在最后，与 keyset_filter 的条件一致。
+    """
+    clauses = []
+    for column, descending in order_by:
+        clause = column.desc() if descending else column.asc()
+        clauses.append(clause.nulls_last() if _nullable(column) else clause)
+    return clauses
+
+
+def _keyset_equal(column, value):
+    return column.is_(None) if value is None else column == literal(value)
+
+
+def _keyset_after(column, descending, value):
+    """单列上位于游标值之后的条件（NULL 排在最后）"""
+    if value is None:
+        # 游标已在 NULL 段中，本列上没有更靠后的值
+        return false()
+    value = literal(value)
+    step = column < value if descending else column > value
+    return or_(step, column.is_(None)) if _nullable(column) else step
+
+
+def keyset_filter(order_by, values):
+    """
+    构造"位于游标之后"的键集条件
+
+    Args:
+        order_by: [(列, 是否降序), ...]，最后一列必须唯一（通常为主键）
+        values: 游标中各排序列的值
+
+    Returns:
+        (c1 > v1) OR (c1 = v1 AND c2 > v2) OR ...（降序列使用 <，
+        可空列的 NULL 视为排在最后，见 keyset_order）
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(order_by):
+        step = _keyset_after(column, descending, values[i])
+        equal = [_keyset_equal(order_by[j][0], values[j]) for j in range(i)]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, order_by, cursor=None, per_page=20, with_total=False):
+    """
+    键集（游标）分页
+
+    按排序列的值定位下一页，翻页代价与页码无关；
+    默认不执行 COUNT(*)，需要总数时传 with_total=True。
+
+    Args:
+        query: 已过滤但未排序的查询
+        order_by: [(列, 是否降序), ...]，最后一列必须唯一
+        cursor: 上一页返回的 next_cursor
+        per_page: 每页数量
+        with_total: 是否统计总数
+    """
+    total = query.order_by(None).count() if with_total else None
+
+    if cursor:
+        query = query.filter(keyset_filter(order_by, decode_cursor(cursor, len(order_by))))
+    query = query.order_by(*keyset_order(order_by))
+
+    items = query.limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+
+    next_cursor = None
+    if has_next:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, col.key) for col, _ in order_by)
+
+    return {
+        'items': items,
+        'total': total,
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'has_next': has_next
+    }
+
+
 def save_uploaded_file(file, folder='uploads'):
     """保存上传的文件"""
     if not file or not allowed_file(file.filename):
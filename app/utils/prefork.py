@@ -0,0 +1,133 @@
+"""
+预派生部署 - 主进程预热、派生后重置和内存统计
+
+配合 gunicorn 的 preload_app 使用：主进程加载应用后预热只读数据（服务模块、
+热门内容快照、测验答案表、模板），随后 gc.freeze() 把这些对象移出垃圾回收
+的跟踪范围，避免回收器写对象头导致写时复制页被复制，派生出的工作进程
+因此共享这部分内存。
+"""
+import gc
+import importlib
+import logging
+import os
+import time
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# 带后台线程的扩展：主进程派生前停止，工作进程派生后重新启动
+BACKGROUND_EXTENSIONS = ('popularity', 'reactions', 'leaderboard', 'activity_log', 'heartbeats',
+                         'achievements')
+
+# /proc/<pid>/smaps_rollup 中关心的字段（单位 kB）
+MEMORY_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def warmup(app):
+    """在主进程中预热只读数据，返回各步骤耗时（秒）"""
+    timings = {}
+
+    def step(name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            logger.warning(f"预热 {name} 失败: {str(e)}")
+        timings[name] = time.perf_counter() - start
+
+    def import_services():
+        import app.services as services
+        for module_name in services.__all__:
+            importlib.import_module(f'app.services.{module_name}')
+
+    def load_templates():
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+
+    def load_answer_keys():
+        from app.models import Quiz
+        cache = app.extensions['quiz_answer_keys']
+        for quiz in Quiz.query.all():
+            cache.get(quiz)
+
+    # 主进程不运行后台线程：fork 时其他线程持有的锁会被复制成永远不释放的状态
+    for name in BACKGROUND_EXTENSIONS:
+        app.extensions[name].stop()
+    popularity = app.extensions['popularity']
+
+    with app.app_context():
+        step('services', import_services)
+        step('templates', load_templates)
+        step('popularity', popularity.refresh)
+        step('answer_keys', load_answer_keys)
+        db.session.remove()
+        # 主进程不保留数据库连接，避免派生后多个进程共用同一连接
+        db.engine.dispose()
+
+    gc.collect()
+    gc.freeze()
+    logger.info('预热完成: ' + ', '.join(f'{k}={v * 1000:.1f}ms' for k, v in timings.items()))
+    return timings
+
+
+def after_fork(app):
+    """工作进程派生后重置进程相关的状态"""
+    with app.app_context():
+        # 连接池中的连接属于主进程，只丢弃引用，不关闭
+        db.engine.dispose(close=False)
+    # 线程不会随 fork 复制，按配置重新启动后台刷新和定时写入
+    for name in BACKGROUND_EXTENSIONS:
+        app.extensions[name].after_fork()
+
+
+def flush_buffers(app):
+    """写入各写后缓冲区中的剩余数据（工作进程退出时）"""
+    with app.app_context():
+        for name in ('reactions', 'heartbeats', 'activity_log', 'achievements'):
+            buffer = app.extensions.get(name)
+            if buffer is None:
+                continue
+            try:
+                buffer.flush()
+            except Exception as e:
+                logger.error(f"写入 {name} 缓冲区失败: {str(e)}")
+
+
+def memory_usage(pid):
+    """进程的内存统计 {字段: kB}，无法读取时返回 None（仅 Linux）"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    usage = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].rstrip(':') in MEMORY_FIELDS:
+            usage[parts[0].rstrip(':')] = int(parts[1])
+    return usage
+
+
+def child_pids(pid):
+    """直接子进程的PID列表（仅 Linux）"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 进程名可能含空格，取最后一个右括号之后的字段
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def memory_report(master_pid):
+    """主进程及其工作进程的内存统计 [(角色, PID, 统计), ...]"""
+    report = [('master', master_pid, memory_usage(master_pid))]
+    report.extend(('worker', pid, memory_usage(pid)) for pid in child_pids(master_pid))
+    return report
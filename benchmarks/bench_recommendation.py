@@ -0,0 +1,102 @@
+"""
+推荐查询基准测试 - 验证"已浏览/已完成"过滤随用户历史增长的延迟
+
+用法:
+    python benchmarks/bench_recommendation.py
+
+对同一用户逐步增加浏览历史和完成记录，分别计时
+get_content_based_stories 和 get_next_modules。使用相关反连接后，
+延迟应基本保持平稳，且不会因参数过多触发 SQLite 的变量数上限。
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.models import User, Story, LearningModule, ContentView, UserProgress  # noqa: E402
+from app.services.recommendation import (get_content_based_stories,  # noqa: E402
+                                         get_next_modules)
+
+CATALOG_SIZE = 2000
+HISTORY_SIZES = [100, 1000, 10000, 50000]
+REPEAT = 20
+
+
+def seed_catalog():
+    """批量插入故事和学习模块"""
+    now = datetime.utcnow()
+    db.session.execute(Story.__table__.insert(), [
+        {
+            'title': f'基准故事{i}', 'slug': f'bench-story-{i}',
+            'description': '基准测试', 'category': f'分类{i % 5}',
+            'view_count': i, 'like_count': 0, 'share_count': 0,
+            'is_published': True, 'is_featured': False, 'created_at': now
+        }
+        for i in range(CATALOG_SIZE)
+    ])
+    db.session.execute(LearningModule.__table__.insert(), [
+        {
+            'title': f'基准模块{i}', 'slug': f'bench-module-{i}',
+            'content': '基准测试', 'difficulty_level': 1 + i % 3,
+            'enrollment_count': i, 'completion_count': 0,
+            'is_published': True, 'created_at': now
+        }
+        for i in range(CATALOG_SIZE)
+    ])
+    db.session.commit()
+
+
+def grow_history(user_id, story_ids, module_ids, start, stop):
+    """为用户追加浏览和完成记录"""
+    now = datetime.utcnow()
+    db.session.execute(ContentView.__table__.insert(), [
+        {'user_id': user_id, 'story_id': story_ids[i % len(story_ids)], 'created_at': now}
+        for i in range(start, stop)
+    ])
+    completed = [
+        {'user_id': user_id, 'module_id': module_ids[i],
+         'progress': 100, 'completed': True, 'started_at': now}
+        for i in range(start, min(stop, len(module_ids)))
+    ]
+    if completed:
+        db.session.execute(UserProgress.__table__.insert(), completed)
+    db.session.commit()
+
+
+def timed(func, *args, **kwargs):
+    """返回多次调用的平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000 / REPEAT
+
+
+def main():
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        seed_catalog()
+
+        user = User.create_user(username='bench', email='bench@example.com',
+                                password='password123')
+        db.session.commit()
+
+        story_ids = [s.id for s in Story.query.with_entities(Story.id).all()]
+        module_ids = [m.id for m in LearningModule.query.with_entities(LearningModule.id).all()]
+
+        print(f"{'history':>10} {'content_based(ms)':>18} {'next_modules(ms)':>17}")
+        previous = 0
+        for size in HISTORY_SIZES:
+            grow_history(user.id, story_ids, module_ids, previous, size)
+            previous = size
+            content_ms = timed(get_content_based_stories, user.id, limit=5)
+            modules_ms = timed(get_next_modules, user.id, limit=10)
+            print(f"{size:>10} {content_ms:>18.2f} {modules_ms:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
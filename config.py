@@ -4,6 +4,11 @@
 import os
 from datetime import timedelta
 
+# 部署形态（与 gunicorn.conf.py 的默认值一致），用于按进程划分CPU和并发相关的上限
+CPU_COUNT = os.cpu_count() or 1
+GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', CPU_COUNT + 1))
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+
 
 class Config:
     """基础配置"""
@@ -39,6 +44,94 @@ class Config:
     # 分页配置
     ITEMS_PER_PAGE = 20
 
+    # 热门内容快照配置
+    POPULARITY_TOP_N = 50  # 每个榜单保留的条目数
+    POPULARITY_REFRESH_INTERVAL = int(os.environ.get('POPULARITY_REFRESH_INTERVAL') or 300)  # 秒
+    POPULARITY_BACKGROUND_REFRESH = True  # 是否启动后台刷新线程
+    TRENDING_WINDOW_DAYS = 7  # 重建趋势分数时回溯的天数
+    TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS') or 24)  # 趋势分数半衰期（小时）
+
+    # 评论批量审核每个事务处理的评论数
+    MODERATION_CHUNK_SIZE = 500
+
+    # 点赞/踩写后缓冲配置
+    REACTION_FLUSH_SIZE = 100  # 待写互动达到该数量时批量写入
+    REACTION_FLUSH_INTERVAL = 5  # 后台线程每隔该秒数写入一次（空闲对象的互动也会按时落库）
+    REACTION_BACKGROUND_FLUSH = True  # 是否启动后台定时写入线程
+    REACTION_RECENT_SIZE = 100000  # 内存中用于去重的最近互动数量
+
+    # 评论防刷配置
+    ANTISPAM_ENABLED = True
+    ANTISPAM_SIMHASH_DISTANCE = 3  # 汉明距离不超过该值视为近似重复（最大3，依赖4段分桶）
+    ANTISPAM_MIN_SCOPE_LENGTH = 10  # 与同一故事/模块下其他用户的评论查重所需的最少字符数（去掉空白和标点）
+    ANTISPAM_RECENT_PER_SCOPE = 200  # 每个故事/模块/用户保留的最近评论指纹数
+    ANTISPAM_MAX_SCOPES = 10000  # 内存中保留的范围总数
+    COMMENT_RATE_LIMIT = 5  # 每个用户在窗口内最多提交的评论数
+    COMMENT_RATE_WINDOW = 60  # 限流窗口（秒）
+
+    # 测验会话配置
+    # memory：进程内TTL缓存；redis：保存在 REDIS_URL 上，多工作进程部署时各进程共享
+    QUIZ_SESSION_STORE = os.environ.get('QUIZ_SESSION_STORE', 'memory')
+    QUIZ_SESSION_TTL = 7200  # 无时间限制的测验会话保留秒数
+    QUIZ_SESSION_MAX = 100000  # 进程内存储最多保留的会话数
+    QUIZ_SESSION_SWEEP_INTERVAL = 60  # 进程内存储清理过期会话的最小间隔（秒）
+    QUIZ_TIME_GRACE = 30  # 提交时间限制的宽限秒数（网络延迟）
+
+    # 学习心跳合并配置
+    HEARTBEAT_FLUSH_SIZE = 500  # 待写的 (用户, 模块) 数达到该值时批量写入
+    HEARTBEAT_FLUSH_INTERVAL = 30  # 后台线程每隔该秒数写入一次（空闲进程的心跳也会按时落库）
+    HEARTBEAT_BACKGROUND_FLUSH = True  # 是否启动后台定时写入线程
+
+    # 排行榜从数据库重建的间隔（秒），期间由积分变动增量维护
+    LEADERBOARD_REBUILD_INTERVAL = 300
+    LEADERBOARD_BACKGROUND_REBUILD = True  # 是否由后台线程重建（请求线程不等待）
+
+    # 用户学习统计缓存
+    # memory：进程内缓存，变化只使本进程的缓存失效，其他进程最多读到 LEARNING_STATS_TTL 秒前的统计；
+    # redis：按用户保存在 REDIS_URL 上，变化时所有进程立即失效
+    LEARNING_STATS_STORE = os.environ.get('LEARNING_STATS_STORE', 'memory')
+    LEARNING_STATS_TTL = 5  # 进程内缓存秒数（即其他进程读到旧统计的最长时间）
+    LEARNING_STATS_SHARED_TTL = 300  # Redis 中的缓存秒数
+    LEARNING_STATS_CACHE_SIZE = 50000  # 进程内最多缓存的用户数
+
+    # 成就引擎配置（活动事件排队后由后台线程批量处理）
+    ACHIEVEMENT_FLUSH_INTERVAL = 5  # 后台线程每隔该秒数处理一次队列
+    ACHIEVEMENT_BACKGROUND_FLUSH = True  # 是否启动后台处理线程（关闭时提交后立即处理）
+    ACHIEVEMENT_QUEUE_MAX = 100000  # 队列容量，超出时丢弃最早的事件
+    ACHIEVEMENT_STREAK_CACHE = 50000  # 记住已计入日期的 (用户, 规则) 数，用于跳过同一天的事件
+
+    # 积分流水启用时间（ISO格式），此前注册的用户对账时写入期初余额；
+    # 未设置时取最早一条流水的时间
+    POINTS_LEDGER_CUTOFF = os.environ.get('POINTS_LEDGER_CUTOFF')
+
+    # 用户快照缓存配置
+    USER_CACHE_TTL = 60  # 快照缓存秒数（修改资料、禁用和积分变动时主动失效）
+    USER_CACHE_SIZE = 50000  # 最多缓存的用户数
+
+    # 密码哈希配置
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'  # 新哈希使用的方法，旧哈希在登录成功时升级
+    # 以下为每个工作进程的上限：校验线程数按本进程分到的CPU计算，避免各进程合计超过核数；
+    # 排队上限小于进程的请求线程数，登录高峰时至少留一个线程处理其他请求，多出的登录直接返回503
+    PASSWORD_VERIFY_WORKERS = max(1, CPU_COUNT // GUNICORN_WORKERS)  # 同时进行密码校验的线程数
+    PASSWORD_VERIFY_MAX_PENDING = max(PASSWORD_VERIFY_WORKERS, GUNICORN_THREADS - 1)  # 校验中和排队中的上限
+    PASSWORD_VERIFY_TIMEOUT = 5  # 等待校验结果的秒数
+
+    # JWT吊销列表配置
+    JWT_REVOCATION_REFRESH_INTERVAL = 30  # 增量加载其他进程吊销记录的间隔（秒）
+    JWT_REVOCATION_REBUILD_INTERVAL = 3600  # 全量重建以剔除过期记录的间隔（秒）
+    JWT_REVOCATION_BLOOM_CAPACITY = 100000  # 布隆过滤器的设计容量
+    JWT_REVOCATION_BLOOM_ERROR_RATE = 0.001  # 布隆过滤器的误判率
+
+    # 活动日志批量写入配置（登录、注册、登出等）
+    ACTIVITY_FLUSH_SIZE = 200  # 待写活动达到该数量时批量写入
+    ACTIVITY_FLUSH_INTERVAL = 5  # 后台线程每隔该秒数写入一次（空闲进程的活动也会按时落库）
+    ACTIVITY_BACKGROUND_FLUSH = True  # 是否启动后台定时写入线程
+    ACTIVITY_BUFFER_MAX = 10000  # 缓冲区容量，写入持续失败时丢弃最早的记录
+
+    # 启动配置：是否在 create_app 中建表并写入初始数据
+    # （每个工作进程和测试都会执行，因此默认关闭，改用 flask init-db）
+    AUTO_CREATE_DB = os.environ.get('AUTO_CREATE_DB', '').lower() in ('1', 'true', 'yes')
+
     # Redis配置（用于缓存和会话）
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
 
@@ -66,12 +159,19 @@ class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_ECHO = True
 
+    # 本地开发启动时自动建表和写入示例数据
+    AUTO_CREATE_DB = True
+
 
 class ProductionConfig(Config):
     """生产环境配置"""
     DEBUG = False
     SQLALCHEMY_ECHO = False
 
+    # 预派生部署有多个工作进程，测验会话和学习统计保存在 Redis 中共享
+    QUIZ_SESSION_STORE = os.environ.get('QUIZ_SESSION_STORE', 'redis')
+    LEARNING_STATS_STORE = os.environ.get('LEARNING_STATS_STORE', 'redis')
+
     # 生产环境必须设置这些环境变量
     @property
     def SECRET_KEY(self):
@@ -87,6 +187,29 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
 
+    # 表结构由测试夹具创建，不写入示例数据
+    AUTO_CREATE_DB = False
+
+    # 同一请求多次提交事务时抛出异常，测试中发现拆成多个事务的路由
+    STRICT_SINGLE_COMMIT = True
+
+    # 测试中每次读取都重建快照，保证数据即时可见
+    POPULARITY_BACKGROUND_REFRESH = False
+    POPULARITY_REFRESH_INTERVAL = 0
+
+    # 测试中显式调用 flush()，不启动后台写入线程
+    REACTION_BACKGROUND_FLUSH = False
+    LEADERBOARD_BACKGROUND_REBUILD = False
+    ACTIVITY_BACKGROUND_FLUSH = False
+    HEARTBEAT_BACKGROUND_FLUSH = False
+    ACHIEVEMENT_BACKGROUND_FLUSH = False
+
+    # 测试中使用低代价的密码哈希
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+    # 活动日志立即写入，测试中即时可见
+    ACTIVITY_FLUSH_SIZE = 1
+
 
 # 配置字典
 config = {
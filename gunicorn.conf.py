@@ -0,0 +1,67 @@
+"""
+Gunicorn配置 - 预加载应用的预派生部署
+
+    gunicorn -c gunicorn.conf.py
+
+主进程加载应用并预热只读数据后再派生工作进程，工作进程通过写时复制共享
+这部分内存。各项参数可用环境变量覆盖。
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+
+# 加载环境变量，未指定时使用生产配置
+load_dotenv()
+os.environ.setdefault('FLASK_ENV', 'production')
+
+# 进程数和线程数在 config.py 中计算，应用按同样的值划分每个进程的上限
+from config import GUNICORN_WORKERS, GUNICORN_THREADS  # noqa: E402
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# 主进程PID写入文件，供 flask memory-report 使用
+pidfile = os.environ.get('GUNICORN_PIDFILE', '/tmp/shadowpuppet-gunicorn.pid')
+
+# 每个核一个工作进程，再多一个覆盖等待I/O的时间；每个进程内用线程处理并发请求。
+# 进程内缓存（热门快照、用户快照、排行榜等）按进程各存一份，因此进程数不宜过多。
+workers = GUNICORN_WORKERS
+threads = GUNICORN_THREADS
+worker_class = 'gthread'
+
+# 在主进程中加载应用，派生前预热
+preload_app = True
+
+# 处理一定数量的请求后回收工作进程，抖动避免所有进程同时重启
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """主进程就绪、派生工作进程之前：预热只读数据"""
+    from app.utils.prefork import warmup, memory_usage
+    logging.basicConfig(level=logging.INFO)
+    warmup(server.app.wsgi())
+    usage = memory_usage(os.getpid())
+    if usage:
+        server.log.info(f"主进程预热后内存: RSS {usage['Rss'] / 1024:.1f} MB")
+
+
+def post_fork(server, worker):
+    """工作进程派生后：丢弃继承的数据库连接，重启后台线程"""
+    from app.utils.prefork import after_fork
+    after_fork(server.app.wsgi())
+
+
+def worker_exit(server, worker):
+    """工作进程退出（包括 max_requests 回收）前写入缓冲区中的数据"""
+    from app.utils.prefork import flush_buffers
+    flush_buffers(server.app.wsgi())
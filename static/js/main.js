@@ -243,18 +243,49 @@ class ProgressTracker {
         this.moduleId = moduleId;
         this.progress = 0;
         this.startTime = Date.now();
+        this.reportedMinutes = 0;
         this.init();
     }
 
     init() {
-        // 定期更新学习时长
+        // 定期发送心跳（服务端合并后批量写入）
         setInterval(() => this.updateTimeSpent(), 60000); // 每分钟更新
 
         // 页面滚动跟踪进度
         window.addEventListener('scroll', () => this.trackScrollProgress());
 
-        // 页面离开时保存进度
-        window.addEventListener('beforeunload', () => this.saveProgress());
+        // 页面关闭时用 sendBeacon 发送最后一次心跳，服务端立即写入
+        window.addEventListener('pagehide', () => this.sendFinalBeacon());
+    }
+
+    // 距上次上报新增的学习分钟数
+    takeNewMinutes() {
+        const total = Math.floor((Date.now() - this.startTime) / 60000);
+        const delta = total - this.reportedMinutes;
+        this.reportedMinutes = total;
+        return delta;
+    }
+
+    progressUrl() {
+        return `/learning/${this.moduleId}/update-progress`;
+    }
+
+    sendFinalBeacon() {
+        const body = JSON.stringify({
+            progress: this.progress,
+            time_spent: this.takeNewMinutes(),
+            final: true
+        });
+        if (navigator.sendBeacon) {
+            navigator.sendBeacon(this.progressUrl(), new Blob([body], { type: 'application/json' }));
+        } else {
+            fetch(this.progressUrl(), {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body,
+                keepalive: true
+            });
+        }
     }
 
     trackScrollProgress() {
@@ -276,19 +307,22 @@ class ProgressTracker {
     }
 
     async updateTimeSpent() {
-        const timeSpent = Math.floor((Date.now() - this.startTime) / 60000); // 分钟
-        await this.saveProgress(timeSpent);
+        await this.saveProgress(this.takeNewMinutes());
     }
 
     async saveProgress(timeSpent = 0) {
         try {
-            await utils.apiRequest(`/modules/${this.moduleId}/update-progress`, {
+            const response = await fetch(this.progressUrl(), {
                 method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     progress: this.progress,
                     time_spent: timeSpent
                 })
             });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
         } catch (error) {
             console.error('保存进度失败:', error);
         }
@@ -73,6 +73,142 @@ class TestUser:
         assert user.points == 200
         assert user.level == 3
 
+    def test_points_ledger(self, app):
+        """测试积分原子累加、流水记录与对账"""
+        from app.models import PointsLedger
+
+        user = User.create_user(username='earner', email='earner@example.com', password='password123')
+        db.session.commit()
+
+        assert user.add_points(120, source='quiz_pass')
+        assert not user.add_points(5, source='comment')
+        db.session.commit()
+        assert (user.points, user.level) == (125, 2)
+        assert PointsLedger.query.filter_by(user_id=user.id).count() == 2
+
+        # 首次对账建立期初基线（新用户的期初金额为0）
+        assert PointsLedger.reconcile() == (1, [])
+
+        # 余额被绕过流水修改后，对账按流水修正
+        User.query.filter_by(id=user.id).update({User.points: 999})
+        openings, mismatches = PointsLedger.reconcile(fix=True)
+        db.session.commit()
+        assert mismatches == [(user.id, 999, 125)]
+        db.session.expire_all()
+        assert User.query.get(user.id).points == 125
+
+        sources = {s['source']: s for s in PointsLedger.source_stats()}
+        assert sources['quiz_pass']['points'] == 120
+        assert sources['comment']['awards'] == 1
+
+    def test_reconcile_keeps_legacy_points(self, app):
+        """测试流水启用前已有积分、启用后又获得积分的老用户不会被清掉旧积分"""
+        from app.models import PointsLedger
+
+        legacy = User.create_user(username='legacy', email='legacy@example.com', password='password123')
+        db.session.commit()
+        # 流水启用前直接写入的余额
+        User.query.filter_by(id=legacy.id).update({User.points: 500, User.level: 6})
+        db.session.commit()
+        legacy.add_points(20, source='comment')
+        db.session.commit()
+
+        openings, mismatches = PointsLedger.reconcile(fix=True)
+        db.session.commit()
+        assert (openings, mismatches) == (1, [])
+        opening = PointsLedger.query.filter_by(user_id=legacy.id, source='opening').one()
+        assert opening.points == 500
+        db.session.expire_all()
+        assert User.query.get(legacy.id).points == 520
+        assert PointsLedger.reconcile() == (0, [])
+
+    def test_reconcile_reports_drift_after_cutoff(self, app):
+        """测试流水启用后注册的用户不写期初记录，余额偏差作为异常报告"""
+        from datetime import datetime, timedelta
+        from app.models import PointsLedger
+
+        legacy = User.create_user(username='legacy', email='legacy@example.com', password='password123',
+                                  created_at=datetime.utcnow() - timedelta(days=30))
+        db.session.commit()
+        legacy.add_points(10, source='comment')
+        db.session.commit()
+        cutoff = PointsLedger.ledger_cutoff()
+
+        newcomer = User.create_user(username='newcomer', email='newcomer@example.com', password='password123',
+                                    created_at=cutoff + timedelta(seconds=1))
+        db.session.commit()
+        newcomer.add_points(20, source='comment')
+        db.session.commit()
+        # 绕过流水修改余额
+        User.query.filter_by(id=newcomer.id).update({User.points: 300})
+        db.session.commit()
+
+        openings, mismatches = PointsLedger.reconcile()
+        assert openings == 1
+        assert mismatches == [(newcomer.id, 300, 20)]
+        assert PointsLedger.query.filter_by(user_id=newcomer.id, source='opening').count() == 0
+
+
+class TestLearningStats:
+    """学习统计测试"""
+
+    def test_cached_stats_invalidation(self, app):
+        """测试学习统计缓存命中以及评论、进度变化后失效"""
+        from app.models import Comment, UserProgress
+        from app.services.user_stats import get_learning_stats, get_learning_stats_batch
+
+        user = User.create_user(username='student', email='student@example.com', password='password123')
+        other = User.create_user(username='other', email='other@example.com', password='password123')
+        module = LearningModule(title='模块', slug='stats-module', description='测试', content='内容')
+        story = Story(title='故事', slug='stats-story', description='测试')
+        db.session.add_all([module, story])
+        db.session.commit()
+        db.session.add(UserProgress(user_id=user.id, module_id=module.id, progress=50))
+        db.session.commit()
+
+        stats = user.get_learning_stats()
+        assert stats == {'completed_modules': 0, 'average_progress': 50.0,
+                         'total_comments': 0, 'total_ratings': 0}
+        assert app.extensions['learning_stats'].get(user.id) is not None
+
+        Comment.create_comment(content='好', user_id=user.id, story_id=story.id)
+        progress = UserProgress.query.filter_by(user_id=user.id).first()
+        progress.completed = True
+        progress.progress = 100
+        db.session.commit()
+        assert get_learning_stats(user.id) == {'completed_modules': 1, 'average_progress': 100.0,
+                                               'total_comments': 1, 'total_ratings': 0}
+
+        batch = get_learning_stats_batch([user.id, other.id, 10 ** 6])
+        assert set(batch) == {user.id, other.id}
+        assert batch[other.id]['completed_modules'] == 0
+
+    def test_stale_stats_bounded_by_ttl(self, app):
+        """测试其他进程的变更不能使本进程缓存失效时，旧统计最多保留 LEARNING_STATS_TTL 秒"""
+        from app.models import UserProgress
+        from app.services.user_stats import get_learning_stats
+        from app.utils.cache import TTLCache
+
+        ttl = app.config['LEARNING_STATS_TTL']
+        assert ttl <= 5
+        now = [0.0]
+        app.extensions['learning_stats'] = TTLCache(default_ttl=ttl, clock=lambda: now[0])
+
+        user = User.create_user(username='student', email='student@example.com', password='password123')
+        module = LearningModule(title='模块', slug='stale-module', description='测试', content='内容')
+        db.session.add(module)
+        db.session.commit()
+        assert get_learning_stats(user.id)['completed_modules'] == 0
+
+        # 模拟另一个工作进程的写入：不经过本进程的ORM事件，缓存不会失效
+        db.session.execute(UserProgress.__table__.insert().values(
+            user_id=user.id, module_id=module.id, progress=100, completed=True))
+        db.session.commit()
+        assert get_learning_stats(user.id)['completed_modules'] == 0
+
+        now[0] += ttl
+        assert get_learning_stats(user.id)['completed_modules'] == 1
+
 
 class TestStory:
     """故事模型测试"""
@@ -116,6 +252,1365 @@ class TestStory:
         assert story.view_count == initial_count + 1
 
 
+class TestRecommendation:
+    """推荐系统测试"""
+
+    def test_content_based_excludes_viewed(self, app):
+        """测试基于内容的推荐排除已浏览故事"""
+        from app.models import ContentView
+        from app.services.recommendation import get_content_based_stories
+
+        user = User.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password123'
+        )
+        viewed = Story(title='已看', slug='viewed', description='测试', category='寓言')
+        fresh = Story(title='未看', slug='fresh', description='测试', category='寓言')
+        db.session.add_all([viewed, fresh])
+        db.session.commit()
+
+        ContentView.log_view(story_id=viewed.id, user_id=user.id)
+
+        ids = [s['id'] for s in get_content_based_stories(user.id, limit=10)]
+        assert fresh.id in ids
+        assert viewed.id not in ids
+
+    def test_personalized_with_history(self, app, monkeypatch):
+        """测试有浏览历史的用户获得协同过滤推荐"""
+        from app.models import ContentView, Rating
+        from app.services import recommendation
+
+        monkeypatch.setattr(recommendation, 'get_deepseek_recommendations', lambda *args, **kwargs: None)
+
+        user = User.create_user(username='reader', email='reader@example.com', password='password123')
+        peer = User.create_user(username='peer', email='peer@example.com', password='password123')
+        stories = [Story(title=f'故事{i}', slug=f'story-{i}', description='测试', category='寓言')
+                   for i in range(4)]
+        db.session.add_all(stories)
+        db.session.commit()
+
+        for story in stories[:3]:
+            ContentView.log_view(story_id=story.id, user_id=user.id)
+        db.session.add_all([
+            Rating(user_id=user.id, story_id=stories[0].id, score=5),
+            Rating(user_id=peer.id, story_id=stories[0].id, score=5),
+            Rating(user_id=peer.id, story_id=stories[3].id, score=4)
+        ])
+        db.session.commit()
+
+        collaborative = [s['id'] for s in recommendation.get_collaborative_stories(user.id)]
+        assert collaborative == [stories[3].id]
+
+        result = recommendation.get_personalized_recommendations(user.id)
+        assert stories[3].id in [s['id'] for s in result['stories']]
+
+
+class TestPopularity:
+    """热门内容快照测试"""
+
+    def test_snapshot_top_n_by_category(self, app):
+        """测试快照的全局和分类热门榜单"""
+        from app.services.popularity import get_snapshot, get_popular_stories
+
+        db.session.add_all([
+            Story(title='甲', slug='a', description='测试', category='神话', view_count=500),
+            Story(title='乙', slug='b', description='测试', category='历史', view_count=10 ** 7),
+            Story(title='丙', slug='c', description='测试', category='神话', view_count=700),
+        ])
+        db.session.commit()
+
+        snapshot = get_snapshot()
+        myth_titles = [s.title for s in get_popular_stories(limit=2, category='神话')]
+        assert myth_titles == ['丙', '甲']
+        assert get_popular_stories(limit=1)[0].title == '乙'
+        with pytest.raises(TypeError):
+            snapshot.popular_stories_by_category['神话'] = ()
+
+
+class TestTrending:
+    """趋势分数测试"""
+
+    def test_decayed_score_and_ranking(self, app):
+        """测试趋势分数的衰减与排序"""
+        from datetime import datetime, timedelta
+        from app.services import trending
+
+        now = datetime.utcnow()
+        old = Story(title='旧', slug='old', description='测试')
+        new = Story(title='新', slug='new', description='测试')
+        db.session.add_all([old, new])
+        db.session.commit()
+
+        # 24小时前的3次浏览衰减为1.5，低于刚发生的2次浏览
+        for _ in range(3):
+            trending.record_view(old, now=now - timedelta(hours=24))
+        for _ in range(2):
+            trending.record_view(new, now=now)
+        db.session.commit()
+
+        assert abs(trending.current_score(old.trending_score, now) - 1.5) < 1e-6
+        assert abs(trending.current_score(new.trending_score, now) - 2.0) < 1e-6
+        assert [s.id for s in trending.get_top(Story, limit=2)] == [new.id, old.id]
+
+    def test_concurrent_views_accumulate(self, app):
+        """测试分数在数据库中累加，不会用进程内的旧值覆盖其他进程的更新"""
+        from datetime import datetime
+        from app.services import trending
+
+        now = datetime.utcnow()
+        story = Story(title='并发', slug='concurrent', description='测试')
+        db.session.add(story)
+        db.session.commit()
+        trending.record_view(story, now=now)
+        db.session.commit()
+        assert story.trending_score is not None
+
+        # 另一个进程记录了一次浏览，本进程中的对象仍是旧值
+        Story.query.filter_by(id=story.id).update(
+            {Story.trending_score: trending._log_add_expression(Story.trending_score, story.trending_score)},
+            synchronize_session=False
+        )
+        trending.record_view(story, now=now)
+        db.session.commit()
+        assert abs(trending.current_score(story.trending_score, now) - 3.0) < 1e-6
+
+
+class TestCommentTree:
+    """评论树测试"""
+
+    def test_tree_with_cursor_pagination(self, app):
+        """测试评论树的多层回复和游标分页"""
+        from datetime import datetime, timedelta
+        from sqlalchemy import event
+        from app.models import Comment
+        from app.services.comments import load_comment_tree
+
+        user = User.create_user(username='talker', email='talker@example.com',
+                                password='password123')
+        story = Story(title='讨论', slug='talk', description='测试')
+        db.session.add(story)
+        db.session.commit()
+
+        base = datetime.utcnow()
+        tops = []
+        for i in range(3):
+            top = Comment.create_comment(content=f'顶级{i}', user_id=user.id, story_id=story.id,
+                                         created_at=base + timedelta(minutes=i))
+            db.session.flush()
+            tops.append(top)
+        reply = Comment.create_comment(content='回复', user_id=user.id, story_id=story.id,
+                                       parent_id=tops[2].id, created_at=base + timedelta(minutes=5))
+        db.session.flush()
+        Comment.create_comment(content='再回复', user_id=user.id, story_id=story.id,
+                               parent_id=reply.id, created_at=base + timedelta(minutes=6))
+        db.session.commit()
+        story_id = story.id
+        db.session.expunge_all()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            page = load_comment_tree(story_id=story_id, depth=2, limit=2)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert len(statements) == 2
+        assert [c['content'] for c in page['items']] == ['顶级2', '顶级1']
+        assert page['items'][0]['reply_count'] == 1
+        assert page['items'][0]['replies'][0]['replies'][0]['content'] == '再回复'
+        assert page['has_next']
+
+        rest = load_comment_tree(story_id=story_id, cursor=page['next_cursor'], limit=2)
+        assert [c['content'] for c in rest['items']] == ['顶级0']
+        assert not rest['has_next']
+
+
+class TestCommentCounters:
+    """评论冗余计数测试"""
+
+    def test_counters_follow_visibility(self, app):
+        """测试创建、删除、审核时冗余计数同步更新"""
+        from app.models import Comment
+
+        user = User.create_user(username='counter', email='counter@example.com',
+                                password='password123')
+        story = Story(title='计数', slug='count', description='测试')
+        db.session.add(story)
+        db.session.commit()
+
+        parent = Comment.create_comment(content='父评论', user_id=user.id, story_id=story.id)
+        db.session.flush()
+        reply = Comment.create_comment(content='回复', user_id=user.id, story_id=story.id,
+                                       parent_id=parent.id)
+        pending = Comment.create_comment(content='待审核', user_id=user.id, story_id=story.id,
+                                         is_approved=False)
+        db.session.commit()
+        assert story.comment_count == 2
+        assert parent.reply_count == 1
+
+        reply.soft_delete()
+        assert story.comment_count == 1
+        assert parent.reply_count == 0
+
+        pending.approve()
+        db.session.commit()
+        assert story.comment_count == 2
+        assert Comment.check_counters() == []
+
+
+class TestModeration:
+    """批量审核测试"""
+
+    def test_bulk_moderation_keeps_counters(self, app):
+        """测试按过滤条件分块批量审核并保持冗余计数一致"""
+        from app.models import Comment
+        from app.services.moderation import build_comment_filter, bulk_moderate
+
+        spammer = User.create_user(username='spammer', email='spam@example.com',
+                                   password='password123')
+        story = Story(title='刷屏', slug='spam', description='测试')
+        db.session.add(story)
+        db.session.commit()
+
+        for i in range(7):
+            Comment.create_comment(content=f'广告{i}', user_id=spammer.id,
+                                   story_id=story.id, is_approved=False)
+        Comment.create_comment(content='正常评论', user_id=spammer.id, story_id=story.id)
+        db.session.commit()
+        assert story.comment_count == 1
+
+        result = bulk_moderate('approve', build_comment_filter(pattern='广告'), chunk_size=3)
+        assert result == {'action': 'approve', 'affected': 7, 'chunks': 3}
+        assert Story.query.get(story.id).comment_count == 8
+
+        result = bulk_moderate('delete', build_comment_filter(user_id=spammer.id), chunk_size=5)
+        assert result['affected'] == 8
+        assert Story.query.get(story.id).comment_count == 0
+        assert Comment.check_counters() == []
+
+        with pytest.raises(ValueError):
+            build_comment_filter()
+
+    def test_pattern_is_literal(self, app):
+        """测试内容匹配按字面处理 % 和 _"""
+        from app.models import Comment
+        from app.services.moderation import build_comment_filter
+
+        user = User.create_user(username='user', email='user@example.com', password='password123')
+        story = Story(title='折扣', slug='discount', description='测试')
+        db.session.add(story)
+        db.session.commit()
+        Comment.create_comment(content='全场50%折扣', user_id=user.id, story_id=story.id)
+        Comment.create_comment(content='全场50元折扣', user_id=user.id, story_id=story.id)
+        Comment.create_comment(content='a_b', user_id=user.id, story_id=story.id)
+        Comment.create_comment(content='axb', user_id=user.id, story_id=story.id)
+        db.session.commit()
+
+        def matches(pattern):
+            return sorted(c.content for c in Comment.query.filter(*build_comment_filter(pattern=pattern)))
+
+        assert matches('50%') == ['全场50%折扣']
+        assert matches('a_b') == ['a_b']
+
+
+class TestReactions:
+    """互动去重与写后计数测试"""
+
+    def test_reactions_dedupe_and_flush(self, app):
+        """测试重复互动被拒绝、批量写入后计数正确"""
+        from app.models import Comment, Reaction
+        from app.services.reactions import get_reaction_buffer
+
+        user = User.create_user(username='fan', email='fan@example.com', password='password123')
+        story = Story(title='点赞', slug='like', description='测试')
+        db.session.add(story)
+        db.session.commit()
+        comment = Comment.create_comment(content='好看', user_id=user.id, story_id=story.id)
+        db.session.commit()
+
+        buffer = get_reaction_buffer()
+        buffer.flush_size = 1000
+        buffer.flush_interval = 3600
+        assert buffer.add(user.id, 'story', story.id, 'like')
+        assert not buffer.add(user.id, 'story', story.id, 'like')
+        assert buffer.add(user.id, 'comment', comment.id, 'dislike')
+        assert buffer.pending_count('story', story.id, 'like') == 1
+        assert buffer.reacted(user.id, 'story', [story.id, story.id + 1]) == {story.id: {'like'}}
+
+        assert buffer.flush() == 2
+        db.session.expire_all()
+        assert Story.query.get(story.id).like_count == 1
+        assert Comment.query.get(comment.id).dislike_count == 1
+        assert Reaction.query.count() == 2
+
+        # 内存去重集合丢失时由唯一约束兜底，计数不重复累加
+        buffer._recent.clear()
+        assert buffer.add(user.id, 'story', story.id, 'like')
+        assert buffer.flush() == 0
+        db.session.expire_all()
+        assert Story.query.get(story.id).like_count == 1
+        assert buffer.reacted(user.id, 'comment', [comment.id]) == {comment.id: {'dislike'}}
+
+    def test_background_flush_and_failure(self, app, monkeypatch):
+        """测试后台线程按间隔写入空闲对象的互动，写入失败时互动留在队列中"""
+        import time
+        from app.services import reactions
+
+        user = User.create_user(username='fan', email='fan@example.com', password='password123')
+        other = User.create_user(username='fan2', email='fan2@example.com', password='password123')
+        story = Story(title='点赞', slug='like', description='测试')
+        db.session.add(story)
+        db.session.commit()
+
+        buffer = reactions.get_reaction_buffer()
+        buffer.flush_size = 1000
+        buffer.flush_interval = 3600
+
+        def broken(connection, rows):
+            raise RuntimeError('database unavailable')
+
+        monkeypatch.setattr(reactions, '_insert_new', broken)
+        buffer.add(user.id, 'story', story.id, 'like')
+        with pytest.raises(RuntimeError):
+            buffer.flush()
+        assert buffer.pending_count('story', story.id, 'like') == 1
+
+        # 请求中触发的写入失败不向调用方抛出，互动留在队列中
+        buffer.flush_size = 1
+        assert buffer.add(other.id, 'story', story.id, 'like')
+        assert buffer.stats['errors'] == 1
+        assert buffer.pending_count('story', story.id, 'like') == 2
+        buffer.flush_size = 1000
+        monkeypatch.undo()
+
+        buffer._flusher.interval = 0.05
+        buffer.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not buffer.stats['flushes'] and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            buffer.stop()
+        db.session.expire_all()
+        assert Story.query.get(story.id).like_count == 2
+
+
+class TestAntispam:
+    """评论防刷测试"""
+
+    def test_near_duplicate_detection(self, app):
+        """测试近似重复评论被拒绝"""
+        from app.services.antispam import simhash, hamming_distance, get_comment_guard
+
+        a = simhash('这个皮影戏故事讲得真好，人物形象非常生动，强烈推荐大家观看！')
+        b = simhash('这个皮影戏故事讲得真好，人物形象非常生动,强烈推荐大家观看!!')
+        c = simhash('唱腔和操纵技巧的结合令人印象深刻，想了解更多历史背景。')
+        assert hamming_distance(a, b) <= 3
+        assert hamming_distance(a, c) > 3
+
+        guard = get_comment_guard()
+        assert guard.check(1, '这个皮影戏故事讲得真好，人物形象非常生动', story_id=1) is None
+        # 未登记（提交失败）的评论不参与查重
+        assert guard.check(2, '这个皮影戏故事讲得真好，人物形象非常生动！', story_id=1) is None
+        guard.register(1, '这个皮影戏故事讲得真好，人物形象非常生动', story_id=1)
+        assert guard.check(2, '这个皮影戏故事讲得真好，人物形象非常生动！', story_id=1) == 'duplicate'
+        assert guard.check(2, '这个皮影戏故事讲得真好，人物形象非常生动！', story_id=2) is None
+        assert guard.get_stats()['writes_avoided'] == 1
+
+    def test_short_replies_only_checked_per_user(self, app):
+        """测试常见短回复不与其他用户的评论查重，同一用户重复发送仍被拒绝"""
+        from app.services.antispam import get_comment_guard
+
+        guard = get_comment_guard()
+        for user_id in range(1, 4):
+            assert guard.check(user_id, '谢谢分享！', story_id=1) is None
+            guard.register(user_id, '谢谢分享！', story_id=1)
+        assert guard.check(1, '谢谢分享', story_id=1) == 'duplicate'
+
+    def test_comment_registered_after_commit(self, app, client, monkeypatch):
+        """测试评论提交失败时不登记指纹，重试不会被当成重复"""
+        User.create_user(username='fan', email='fan@example.com', password='password123')
+        story = Story(title='评论', slug='comment-story', description='测试')
+        db.session.add(story)
+        db.session.commit()
+        story_id = story.id
+        client.post('/auth/login', data={'username': 'fan', 'password': 'password123'})
+        payload = {'content': '这个皮影戏故事讲得真好，人物形象非常生动'}
+
+        def fail():
+            raise RuntimeError('database unavailable')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(db.session, 'commit', fail)
+            response = client.post(f'/stories/{story_id}/comment', json=payload)
+        assert response.status_code == 500
+
+        response = client.post(f'/stories/{story_id}/comment', json=payload)
+        assert response.status_code == 201
+        response = client.post(f'/stories/{story_id}/comment', json=payload)
+        assert response.status_code == 429
+        assert response.get_json()['reason'] == 'duplicate'
+
+    def test_rate_limit(self, app):
+        """测试滑动窗口限流"""
+        from app.services.antispam import get_comment_guard
+
+        guard = get_comment_guard()
+        for i in range(guard.rate_limit):
+            assert guard.check(7, f'第{i}条完全不同的评论内容{i * 7919}', now=100.0 + i) is None
+            guard.register(7, f'第{i}条完全不同的评论内容{i * 7919}', now=100.0 + i)
+        assert guard.check(7, '又一条新的评论', now=100.0 + guard.rate_limit) == 'rate_limited'
+        assert guard.check(7, '又一条新的评论', now=100.0 + guard.rate_window) is None
+
+
+class TestQuizGrading:
+    """测验评分测试"""
+
+    def test_answer_key_cache_and_invalidation(self, app):
+        """测试答案表缓存评分并在题目修改后失效"""
+        from app.models import Quiz, QuizQuestion
+        from app.services.quiz_grading import grade_submission
+
+        module = LearningModule(title='测验', slug='quiz-module', description='测试', content='内容')
+        db.session.add(module)
+        db.session.commit()
+        quiz = Quiz(title='小测', module_id=module.id)
+        db.session.add(quiz)
+        db.session.commit()
+        single = QuizQuestion(quiz_id=quiz.id, question_text='单选', correct_answer='b', points=2, order=1)
+        multi = QuizQuestion(quiz_id=quiz.id, question_text='多选', correct_answer=['a', 'c'], points=3, order=2)
+        db.session.add_all([single, multi])
+        db.session.commit()
+        assert quiz.version == 3
+
+        key, graded = grade_submission(quiz, {str(single.id): 'b', str(multi.id): ['c', 'a']})
+        assert key.question_ids == (single.id, multi.id)
+        assert graded.correct == [True, True]
+        assert graded.score == 100
+
+        # 与逐题比较的结果一致：字符串精确比较，多选不计顺序
+        for answer in ('b', ' B ', 'B', ['b']):
+            _, graded = grade_submission(quiz, {str(single.id): answer})
+            assert graded.correct[0] == single.check_answer(answer)
+
+        again, _ = grade_submission(quiz, {})
+        assert again is key
+
+        multi.correct_answer = ['a']
+        db.session.commit()
+        key, graded = grade_submission(quiz, {str(single.id): 'a', str(multi.id): ['c', 'a']})
+        assert key.version == 4
+        assert graded.correct == [False, False]
+        assert graded.earned_points == 0 and graded.total_points == 5
+
+
+class TestQuizAttempt:
+    """测验提交记录测试"""
+
+    def test_compact_answers(self, app):
+        """测试历史逐题记录合并为位图提交记录并可逐题展开"""
+        from app.models import Quiz, QuizQuestion, QuizAnswer, QuizAttempt
+        from app.models.learning import pack_bits, unpack_bits
+
+        flags = [True, False, True, True, False, False, False, False, True]
+        assert unpack_bits(pack_bits(flags), len(flags)) == flags
+
+        user = User.create_user(username='learner', email='learner@example.com', password='password123')
+        module = LearningModule(title='模块', slug='attempt-module', description='测试', content='内容')
+        db.session.add(module)
+        db.session.commit()
+        quiz = Quiz(title='小测', module_id=module.id, passing_score=50)
+        db.session.add(quiz)
+        db.session.commit()
+        questions = [QuizQuestion(quiz_id=quiz.id, question_text=f'题{i}', correct_answer='a',
+                                  points=1, order=i) for i in range(3)]
+        db.session.add_all(questions)
+        db.session.commit()
+
+        # 两次提交，每次三题
+        for attempt in ([True, False, True], [True, True, True]):
+            for question, ok in zip(questions, attempt):
+                db.session.add(QuizAnswer(user_id=user.id, quiz_id=quiz.id, question_id=question.id,
+                                          user_answer='a' if ok else 'b', is_correct=ok,
+                                          points_earned=1 if ok else 0))
+        db.session.commit()
+
+        assert QuizAttempt.compact_answers() == (2, 6)
+        assert QuizAnswer.query.count() == 0
+        attempts = QuizAttempt.query.order_by(QuizAttempt.id).all()
+        assert [a.score for a in attempts] == [66, 100]
+        assert attempts[0].correct == [True, False, True]
+
+        rows = list(QuizAttempt.iter_answer_rows(quiz_id=quiz.id))
+        assert len(rows) == 6
+        assert [r.user_answer for r in rows[:3]] == ['a', 'b', 'a']
+
+
+class TestItemAnalysis:
+    """题目分析测试"""
+
+    def test_incremental_stats_match_backfill(self, app):
+        """测试增量统计与回填结果一致，区分度与直接计算一致"""
+        import math
+        from app.models import Quiz, QuizQuestion, QuizAttempt
+        from app.services.quiz_grading import grade_submission
+        from app.services.item_analysis import record_attempt, get_item_analysis, backfill
+
+        module = LearningModule(title='模块', slug='item-module', description='测试', content='内容')
+        db.session.add(module)
+        db.session.commit()
+        quiz = Quiz(title='小测', module_id=module.id)
+        db.session.add(quiz)
+        db.session.commit()
+        q1 = QuizQuestion(quiz_id=quiz.id, question_text='易', correct_answer='a', points=1, order=1)
+        q2 = QuizQuestion(quiz_id=quiz.id, question_text='难', correct_answer='b', points=1, order=2)
+        db.session.add_all([q1, q2])
+        db.session.commit()
+
+        submissions = [('a', 'b'), ('a', 'c'), ('a', 'c'), ('d', 'c')]
+        for user_id, (a1, a2) in enumerate(submissions, start=1):
+            key, graded = grade_submission(quiz, {str(q1.id): a1, str(q2.id): a2})
+            QuizAttempt.record(user_id, quiz, key, graded, passed=graded.score >= 60)
+            record_attempt(key, graded)
+        db.session.commit()
+
+        items = get_item_analysis(quiz)
+        assert items[0]['attempts'] == 4
+        assert items[0]['correct_rate'] == 0.75
+        assert items[1]['option_counts'] == {'b': 1, 'c': 3}
+
+        scores = [100, 50, 50, 0]
+        flags = [True, True, True, False]
+        mean = sum(scores) / 4
+        sd = math.sqrt(sum((s - mean) ** 2 for s in scores) / 4)
+        m1 = sum(s for s, f in zip(scores, flags) if f) / 3
+        expected = (m1 - 0) / sd * math.sqrt(0.75 * 0.25)
+        assert abs(items[0]['discrimination'] - expected) < 1e-3
+
+        assert backfill(quiz.id) == 2
+        assert get_item_analysis(quiz) == items
+
+
+class TestQuizSession:
+    """测验会话测试"""
+
+    def test_ttl_cache_sweep(self):
+        """测试TTL缓存过期与惰性清理"""
+        from app.utils.cache import TTLCache
+
+        now = [0.0]
+        cache = TTLCache(default_ttl=10, sweep_interval=5, clock=lambda: now[0])
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=100)
+        assert cache.get('a') == 1
+        now[0] = 11
+        assert cache.get('a') is None
+        cache.set('c', 3)
+        assert len(cache) == 2
+        now[0] = 200
+        cache.set('d', 4)
+        assert len(cache) == 1
+        assert cache.add('d', 5) == 4
+        assert cache.add('e', 6, ttl=1) == 6
+        now[0] = 202
+        assert cache.add('e', 7) == 7
+
+    def test_time_limit_and_seeded_order(self, app):
+        """测试会话种子决定题目顺序、超时提交被拒绝"""
+        from types import SimpleNamespace
+        from app.services.quiz_sessions import start_session, order_questions, finish_session
+
+        quiz = SimpleNamespace(id=1, time_limit=10)
+        session = start_session(5, quiz, now=1000.0)
+        assert start_session(5, quiz, now=1100.0) is session
+
+        questions = list(range(20))
+        order = order_questions(session, questions)
+        assert order == order_questions(session, questions)
+        assert sorted(order) == questions
+
+        assert finish_session(5, quiz, now=1000.0 + 601 + 30)[1] == 'time_limit_exceeded'
+        assert finish_session(5, quiz)[1] == 'no_session'
+
+        other = start_session(6, quiz, now=1000.0)
+        assert finish_session(6, quiz, now=1500.0) == (other, None)
+
+    def test_session_kept_on_404(self, app, client):
+        """测试开始测验不写数据库，进度不存在时提交不会消耗会话"""
+        from sqlalchemy import event
+        from app.models import Quiz, QuizQuestion, UserProgress
+        from app.services.quiz_sessions import start_session
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        module = LearningModule(title='模块', slug='session-module', description='测试', content='内容')
+        db.session.add(module)
+        db.session.commit()
+        quiz = Quiz(title='限时', module_id=module.id, time_limit=10)
+        db.session.add(quiz)
+        db.session.commit()
+        db.session.add(QuizQuestion(quiz_id=quiz.id, question_text='题', correct_answer='a', points=1))
+        db.session.commit()
+        user_id, quiz_id, module_id = user.id, quiz.id, module.id
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            session = start_session(user_id, quiz)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert statements == []
+        store = app.extensions['quiz_sessions']
+
+        app.register_error_handler(404, lambda error: ('', 404))  # 不渲染错误页模板
+        client.post('/auth/login', data={'username': 'testuser', 'password': 'password123'})
+
+        response = client.post(f'/learning/quiz/{quiz_id}/submit', json={'answers': {}})
+        assert response.status_code == 404
+        assert store.get((user_id, quiz_id)) is session
+
+        db.session.add(UserProgress(user_id=user_id, module_id=module_id))
+        db.session.commit()
+        response = client.post(f'/learning/quiz/{quiz_id}/submit', json={'answers': {}})
+        assert response.status_code == 200
+        assert store.get((user_id, quiz_id)) is None
+
+        response = client.post(f'/learning/quiz/{quiz_id}/submit', json={'answers': {}})
+        assert response.get_json()['reason'] == 'no_session'
+
+
+class TestHeartbeats:
+    """学习心跳合并测试"""
+
+    def test_heartbeats_coalesce(self, app):
+        """测试心跳在内存中合并，批量写入结果与逐条写入一致"""
+        from app.models import UserProgress
+        from app.services.heartbeats import get_heartbeat_buffer, flush_user_heartbeats
+
+        user = User.create_user(username='reader', email='reader@example.com', password='password123')
+        module = LearningModule(title='模块', slug='beat-module', description='测试', content='内容')
+        db.session.add(module)
+        db.session.commit()
+        db.session.add(UserProgress(user_id=user.id, module_id=module.id, last_position='p0'))
+        db.session.commit()
+
+        buffer = get_heartbeat_buffer()
+        buffer.flush_interval = 3600
+        buffer.add(user.id, module.id, progress=30, minutes=1, last_position='p1')
+        buffer.add(user.id, module.id, progress=20, minutes=1)
+        merged = buffer.add(user.id, module.id, progress=45, minutes=2)
+        assert merged['progress'] == 45 and merged['minutes'] == 4
+        assert buffer.stats['flushes'] == 0
+
+        assert flush_user_heartbeats(user.id) == 1
+        assert buffer.pending(user.id, module.id) is None
+        db.session.expire_all()
+        progress = UserProgress.query.filter_by(user_id=user.id, module_id=module.id).first()
+        assert progress.progress == 45
+        assert progress.time_spent == 4
+        assert progress.last_position == 'p1'
+
+    def test_failed_flush_kept_for_background_flush(self, app, monkeypatch):
+        """测试写入失败时更新合并回缓冲区，由后台线程按时写入"""
+        import time
+        from app.models import UserProgress
+        from app.services.heartbeats import get_heartbeat_buffer
+
+        user = User.create_user(username='reader', email='reader@example.com', password='password123')
+        module = LearningModule(title='模块', slug='beat-module', description='测试', content='内容')
+        db.session.add(module)
+        db.session.commit()
+        db.session.add(UserProgress(user_id=user.id, module_id=module.id))
+        db.session.commit()
+
+        buffer = get_heartbeat_buffer()
+        buffer.flush_size = 1
+
+        def fail():
+            raise RuntimeError('database unavailable')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(db.engine, 'begin', fail)
+            buffer.add(user.id, module.id, progress=30, minutes=2, last_position='p1')
+        assert buffer.stats['errors'] == 1
+        assert buffer.pending(user.id, module.id)['minutes'] == 2
+
+        buffer.flush_size = 100
+        buffer.add(user.id, module.id, progress=20, minutes=1, last_position='p2')
+        buffer._flusher.interval = 0.05
+        buffer.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not buffer.stats['flushes'] and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            buffer.stop()
+        assert buffer.pending(user.id, module.id) is None
+        db.session.expire_all()
+        progress = UserProgress.query.filter_by(user_id=user.id, module_id=module.id).first()
+        assert (progress.progress, progress.time_spent, progress.last_position) == (30, 3, 'p2')
+
+
+class TestUnitOfWork:
+    """请求提交次数测试"""
+
+    def test_story_detail_commits_once(self, app, client):
+        """测试故事详情页的所有副作用在一次提交中完成"""
+        from flask import g
+        from jinja2 import ChoiceLoader, DictLoader
+        from app.models import ContentView
+
+        app.jinja_env.loader = ChoiceLoader([
+            DictLoader({'stories/detail.html': '{{ story.title }}'}),
+            app.jinja_env.loader
+        ])
+        story = Story(title='单次提交', slug='one-commit', description='测试', is_published=True)
+        db.session.add(story)
+        db.session.commit()
+        story_id = story.id
+
+        with client:
+            response = client.get('/stories/one-commit')
+            assert response.status_code == 200
+            assert g.commit_count == 1
+
+        db.session.expire_all()
+        assert Story.query.get(story_id).view_count == 1
+        assert ContentView.query.filter_by(story_id=story_id).count() == 1
+
+    def test_complete_module_commits_once(self, app, client):
+        """测试完成模块的积分、完成人数和活动记录在一次提交中完成"""
+        from app.models import UserProgress
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        module = LearningModule(title='模块', slug='complete-module', description='测试', content='内容',
+                                points_reward=20)
+        db.session.add(module)
+        db.session.commit()
+        db.session.add(UserProgress(user_id=user.id, module_id=module.id))
+        db.session.commit()
+        user_id, module_id = user.id, module.id
+
+        client.post('/auth/login', data={'username': 'testuser', 'password': 'password123'})
+        response = client.post(f'/learning/{module_id}/complete')
+        assert response.status_code == 200
+        db.session.expire_all()
+        assert db.session.get(LearningModule, module_id).completion_count == 1
+        assert db.session.get(User, user_id).points == 20
+
+    def test_chunked_bulk_moderation_exempt(self, app, client):
+        """测试有意分块提交的批量审核路由不受单次提交检查"""
+        from app.models import Comment
+
+        admin = User.create_user(username='admin', email='admin@example.com', password='password123',
+                                 is_admin=True)
+        story = Story(title='刷屏', slug='bulk-spam', description='测试')
+        db.session.add(story)
+        db.session.commit()
+        for i in range(5):
+            Comment.create_comment(content=f'广告{i}', user_id=admin.id, story_id=story.id, is_approved=False)
+        db.session.commit()
+        app.config['MODERATION_CHUNK_SIZE'] = 2
+
+        client.post('/auth/login', data={'username': 'admin', 'password': 'password123'})
+        response = client.post('/admin/comments/bulk', json={'action': 'approve', 'filter': {'pattern': '广告'}})
+        assert response.get_json() == {'action': 'approve', 'affected': 5, 'chunks': 3}
+
+
+class TestLeaderboard:
+    """排行榜测试"""
+
+    def test_fenwick_ranks(self):
+        """测试树状数组排行与直接排序一致"""
+        import random
+        from app.services.leaderboard import Leaderboard
+
+        rng = random.Random(7)
+        scores = {uid: rng.randint(0, 3000) for uid in range(1, 301)}
+        board = Leaderboard(scores)
+        for _ in range(200):
+            uid = rng.randint(1, 320)
+            delta = rng.randint(0, 500)
+            board.add(uid, delta)
+            scores[uid] = scores.get(uid, 0) + delta
+
+        expected = sorted(scores, key=lambda uid: (-scores[uid], uid))
+        assert [uid for _, uid, _ in board.top(20)] == expected[:20]
+        for uid in (expected[0], expected[150], expected[-1]):
+            assert board.rank(uid) == expected.index(uid) + 1
+        rank = board.rank(expected[100])
+        assert [uid for _, uid, _ in board.around(expected[100], 2)] == expected[rank - 3:rank + 2]
+
+    def test_negative_and_huge_scores(self):
+        """测试负分和极大积分的排名，且树的大小与积分无关"""
+        import random
+        from app.services.leaderboard import Leaderboard, score_bucket
+
+        values = [-10 ** 12, -5000, -3, -1, 0, 1, 1023, 1024, 1500, 4097, 10 ** 9, 10 ** 18, 10 ** 30]
+        assert [score_bucket(v) for v in values] == sorted(score_bucket(v) for v in values)
+
+        rng = random.Random(11)
+        scores = {uid: rng.choice(values) + rng.randint(-2, 2) for uid in range(1, 200)}
+        board = Leaderboard(scores)
+        size = board._tree.size
+        for uid in range(1, 60):
+            delta = rng.choice([-10 ** 15, -7, 3, 10 ** 20])
+            board.add(uid, delta)
+            scores[uid] += delta
+
+        expected = sorted(scores, key=lambda uid: (-scores[uid], uid))
+        assert board._tree.size == size
+        assert [uid for _, uid, _ in board.top(len(scores))] == expected
+        assert [board.rank(uid) for uid in expected] == list(range(1, len(expected) + 1))
+
+    def test_committed_points_update_board(self, app, client):
+        """测试已提交的积分变动增量更新排行榜，回滚的变动被丢弃"""
+        from app.services.leaderboard import get_leaderboard
+
+        alice = User.create_user(username='alice', email='alice@example.com', password='password123')
+        bob = User.create_user(username='bob', email='bob@example.com', password='password123')
+        db.session.commit()
+        board = get_leaderboard()
+
+        alice.add_points(10 ** 6, source='comment')
+        db.session.commit()
+        assert board.rank(alice.id) == 1
+
+        bob.add_points(2 * 10 ** 6, source='quiz_pass')
+        db.session.commit()
+        bob.add_points(10 ** 7, source='quiz_pass')
+        db.session.rollback()
+
+        assert get_leaderboard() is board
+        assert board.rank(bob.id) == 1 and board.score(bob.id) == 2 * 10 ** 6
+        assert get_leaderboard('weekly').rank(alice.id) == 2
+        assert get_leaderboard('all', 'comment').top(1) == [(1, alice.id, 10 ** 6)]
+
+        data = client.get('/api/leaderboard?limit=2').get_json()
+        assert [item['username'] for item in data['items']] == ['bob', 'alice']
+
+    def test_background_rebuild_not_on_request(self, app):
+        """测试后台重建线程运行时，过期的榜单不在请求线程中重建"""
+        from app.services.leaderboard import get_leaderboard
+
+        registry = app.extensions['leaderboard']
+        board = get_leaderboard()
+        registry._built_at = 0.0
+        assert get_leaderboard() is not board  # 未启动后台线程时同步重建
+
+        board = get_leaderboard()
+        registry._rebuilder.interval = 3600
+        registry.start()
+        try:
+            registry._built_at = 0.0
+            assert get_leaderboard() is board
+        finally:
+            registry.stop()
+
+
+class TestAchievements:
+    """成就引擎测试"""
+
+    def test_committed_activity_awards(self, app, client):
+        """测试提交后的活动授予成就，回滚的活动不计入"""
+        from app.models import UserActivity, UserAchievement
+        from app.services.achievements import get_achievement_engine
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+
+        UserActivity.log_activity(user.id, 'submit_comment', {'comment_id': 1}, commit=False)
+        db.session.rollback()
+        assert 'first_comment' not in get_achievement_engine().achievements(user.id)
+
+        UserActivity.log_activity(user.id, 'submit_comment', {'comment_id': 2})
+        assert UserAchievement.query.filter_by(user_id=user.id, code='first_comment').count() == 1
+
+        data = client.get(f'/api/users/{user.id}/achievements').get_json()
+        assert [a['code'] for a in data['achievements']] == ['first_comment']
+
+    def test_counters_and_streak(self, app):
+        """测试计数条件和连续天数"""
+        from datetime import datetime, timedelta
+        from app.models import AchievementCounter
+        from app.services.achievements import get_achievement_engine
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        engine = get_achievement_engine()
+
+        def view(when):
+            return [code for _, code in engine.process([(user.id, 'view_story', {}, when)])]
+
+        start = datetime(2024, 3, 1, 9)
+        for day in range(6):
+            assert 'streak_7' not in view(start + timedelta(days=day))
+        assert view(start + timedelta(days=6, hours=5)) == ['streak_7']
+        assert view(start + timedelta(days=6, hours=6)) == []
+
+        engine.process([(user.id, 'quiz_attempt', {'passed': True, 'attempt': 2, 'score': 100}, start)])
+
+        counters = {c.rule: c for c in AchievementCounter.query.filter_by(user_id=user.id)}
+        assert counters['story_explorer'].value == 8
+        assert counters['streak_7'].value == 7
+        assert counters['perfect_score'].value == 1
+        assert 'quiz_ace' not in counters
+        assert {'streak_7', 'perfect_score'} <= engine.achievements(user.id)
+
+        # 中断一天后连续天数从1开始
+        view(start + timedelta(days=8))
+        db.session.expire_all()
+        assert db.session.get(AchievementCounter, (user.id, 'streak_7')).value == 1
+
+    def test_engines_share_database_counters(self, app):
+        """测试多个引擎实例（工作进程）交替处理同一用户的事件"""
+        from datetime import datetime, timedelta
+        from app.models import AchievementCounter, UserAchievement
+        from app.services.achievements import AchievementEngine
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        workers = [AchievementEngine(app), AchievementEngine(app)]
+
+        def view(worker, when):
+            return [code for _, code in worker.process([(user.id, 'view_story', {}, when)])]
+
+        start = datetime(2024, 3, 1, 9)
+        codes = []
+        for day in range(7):
+            codes += view(workers[day % 2], start + timedelta(days=day))
+            codes += view(workers[(day + 1) % 2], start + timedelta(days=day, hours=1))
+        assert codes.count('streak_7') == 1
+
+        # 两个进程各计7次，合计跨过20次阈值时只授予一次
+        codes = []
+        for i in range(6):
+            codes += view(workers[i % 2], start + timedelta(days=6, hours=2))
+        assert codes == ['story_explorer']
+
+        db.session.expire_all()
+        assert db.session.get(AchievementCounter, (user.id, 'streak_7')).value == 7
+        assert db.session.get(AchievementCounter, (user.id, 'story_explorer')).value == 20
+        assert UserAchievement.query.filter_by(user_id=user.id).count() == 2
+
+    def test_queued_batch_processing(self, app):
+        """测试提交时只入队，后台批量处理时合并计数和同一天的连续型事件"""
+        from datetime import datetime, timedelta
+        from sqlalchemy import event
+        from app.models import AchievementCounter, UserActivity
+        from app.services.achievements import get_achievement_engine
+
+        users = [User.create_user(username=f'user{i}', email=f'user{i}@example.com', password='password123')
+                 for i in range(3)]
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        engine = get_achievement_engine()
+        engine._flusher.interval = 3600
+        engine.start()
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for user_id in user_ids:
+                for _ in range(5):
+                    UserActivity.log_activity(user_id, 'view_story', {})
+            # 请求线程只写活动记录，不处理成就
+            assert not [s for s in statements if 'achievement' in s]
+            assert len(engine) == 15
+
+            statements.clear()
+            engine.stop()
+            now = datetime.utcnow()
+            engine.enqueue([(user_ids[0], 'view_story', {}, now + timedelta(seconds=1))])
+        finally:
+            engine.stop()
+            event.remove(db.engine, 'before_cursor_execute', record)
+        statements = [s.split()[0].upper() for s in statements]
+
+        # 一批16个事件：插入计数器、累加、读回、推进连续天数、读回，各一条语句
+        assert statements == ['INSERT', 'UPDATE', 'SELECT', 'UPDATE', 'SELECT']
+        assert len(engine) == 0
+        db.session.expire_all()
+        assert db.session.get(AchievementCounter, (user_ids[0], 'story_explorer')).value == 6
+        assert db.session.get(AchievementCounter, (user_ids[2], 'streak_7')).value == 1
+
+        # 已计入当天的连续型事件不再访问数据库
+        statements.clear()
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            engine.enqueue([(user_ids[1], 'login', {}, now + timedelta(seconds=2))])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert statements == []
+
+
+class TestUserCache:
+    """用户快照缓存测试"""
+
+    def test_snapshot_cache_and_invalidation(self, app):
+        """测试快照命中时不查询用户表，资料、状态和积分变化后失效"""
+        from sqlalchemy import event
+        from app import load_user
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        user_id = user.id
+        db.session.expunge_all()
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'FROM users' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            with app.test_request_context():
+                snapshot = load_user(str(user_id))
+                assert snapshot.username == 'testuser' and snapshot.is_active
+            with app.test_request_context():
+                snapshot = load_user(str(user_id))
+                assert snapshot.level == 1 and not snapshot.is_admin
+                assert len(statements) == 1
+
+                # 非快照字段加载 ORM 对象，此后以 ORM 对象为准
+                assert snapshot.email == 'test@example.com'
+                snapshot.nickname = '新昵称'
+                assert snapshot.nickname == '新昵称'
+                db.session.commit()
+                assert len(statements) == 2
+            with app.test_request_context():
+                assert load_user(str(user_id)).nickname == '新昵称'
+
+            with app.test_request_context():
+                load_user(str(user_id)).add_points(150, source='comment')
+                db.session.commit()
+            with app.test_request_context():
+                assert load_user(str(user_id)).level == 2
+
+            db.session.get(User, user_id).is_active = False
+            db.session.commit()
+            with app.test_request_context():
+                assert not load_user(str(user_id)).is_active
+                assert load_user('999') is None
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class TestPasswords:
+    """密码哈希策略与校验线程池测试"""
+
+    def test_rehash_on_login(self, app, client):
+        """测试哈希方法变更后登录成功时升级哈希"""
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+        assert not user.password_needs_rehash()
+
+        app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+        assert user.password_needs_rehash()
+
+        response = client.post('/auth/login', json={'username': 'testuser', 'password': 'wrong'})
+        assert response.status_code == 401
+        assert db.session.get(User, user.id).password_hash.startswith('pbkdf2:sha256:1000$')
+
+        response = client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        assert response.status_code == 200
+        db.session.expire_all()
+        user = db.session.get(User, user.id)
+        assert user.password_hash.startswith('pbkdf2:sha256:2000$')
+        assert user.check_password('password123')
+
+    def test_busy_verifier_sheds_load(self, app, client):
+        """测试校验排队已满时直接返回503"""
+        from app.services.passwords import PasswordVerifier, VerifierBusy
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+
+        verifier = PasswordVerifier(max_workers=1, max_pending=1, timeout=5)
+        app.extensions['password_verifier'] = verifier
+        assert verifier.verify(user.password_hash, 'password123')
+
+        verifier._slots.acquire()  # 占满排队上限
+        with pytest.raises(VerifierBusy):
+            verifier.verify('', 'password123')
+        response = client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert verifier.stats['rejected'] == 2
+        verifier.shutdown()
+
+    def test_default_limits_fit_worker(self, app):
+        """测试默认上限按工作进程划分：校验线程合计不超过核数，排队上限小于请求线程数"""
+        import config as config_module
+
+        workers = config_module.GUNICORN_WORKERS
+        threads = config_module.GUNICORN_THREADS
+        verify_workers = app.config['PASSWORD_VERIFY_WORKERS']
+        assert verify_workers == max(1, config_module.CPU_COUNT // workers)
+        assert verify_workers * workers <= max(workers, config_module.CPU_COUNT)
+        if threads > 1:
+            assert app.config['PASSWORD_VERIFY_MAX_PENDING'] < threads
+
+
+class TestTokens:
+    """JWT声明快速校验与吊销测试"""
+
+    def _login(self, client):
+        User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        data = client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'}).get_json()
+        return data['user']['id'], data['access_token'], data['refresh_token']
+
+    def test_bloom_filter(self):
+        """测试布隆过滤器没有漏判且误判率接近设计值"""
+        from app.utils.bloom import BloomFilter
+
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        assert all(f'jti-{i}' in bloom for i in range(1000))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        assert false_positives < 300
+        assert not bloom.saturated
+
+    def test_logout_revokes_token(self, app, client):
+        """测试登出后令牌被吊销，其他进程增量加载后同样拒绝"""
+        from app.models import RevokedToken
+        from app.services.tokens import RevocationList
+
+        user_id, access_token, _ = self._login(client)
+        headers = {'Authorization': f'Bearer {access_token}'}
+        assert client.get(f'/api/users/{user_id}/progress', headers=headers).status_code == 200
+        assert client.get(f'/api/users/{user_id + 1}/progress', headers=headers).status_code == 403
+
+        other_worker = RevocationList(app)
+        other_worker.rebuild()
+
+        assert client.post('/auth/api/logout', headers=headers).status_code == 200
+        assert client.get(f'/api/users/{user_id}/progress', headers=headers).status_code == 401
+        assert RevokedToken.query.filter_by(user_id=user_id).count() == 1
+
+        jti = RevokedToken.query.filter_by(user_id=user_id).one().jti
+        other_worker.refresh()
+        assert other_worker.is_revoked(jti)
+        assert not other_worker.is_revoked('not-revoked')
+        assert other_worker.stats['revoked'] == 1
+
+    def test_token_version_invalidates_refresh(self, app, client):
+        """测试令牌版本递增后刷新令牌失效"""
+        user_id, _, refresh_token = self._login(client)
+        headers = {'Authorization': f'Bearer {refresh_token}'}
+        assert client.post('/auth/api/refresh', headers=headers).status_code == 200
+
+        db.session.get(User, user_id).revoke_tokens()
+        db.session.commit()
+        assert client.post('/auth/api/refresh', headers=headers).status_code == 401
+
+    def test_deactivated_user_cannot_write(self, app, client):
+        """测试禁用账户后旧的访问令牌在写操作上立即失效"""
+        from app.models import Comment
+
+        user_id, access_token, _ = self._login(client)
+        story = Story(title='故事', slug='token-story', description='测试')
+        db.session.add(story)
+        db.session.commit()
+        comment = Comment.create_comment(content='好', user_id=user_id, story_id=story.id)
+        db.session.commit()
+        url = f'/api/comments/{comment.id}/reactions'
+        headers = {'Authorization': f'Bearer {access_token}'}
+
+        assert client.post(url, json={'kind': 'like'}, headers=headers).status_code == 200
+        assert client.post('/api/comments/999999/reactions', headers=headers).status_code == 404
+
+        user = db.session.get(User, user_id)
+        user.is_active = False
+        user.revoke_tokens()
+        db.session.commit()
+        assert client.post(url, json={'kind': 'dislike'}, headers=headers).status_code == 401
+        assert app.extensions['reactions'].flush() == 1
+
+
+class TestAuthRoundTrips:
+    """登录与注册的数据库往返测试"""
+
+    def test_login_single_read_and_write(self, app, client):
+        """测试登录只有一次读取和一次写入，活动日志批量写入"""
+        from sqlalchemy import event
+        from app.models import UserActivity
+
+        User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        db.session.expunge_all()
+        buffer = app.extensions['activity_log']
+        buffer.flush_size = 100
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert response.status_code == 200
+        assert response.get_json()['user']['last_login'] is not None
+        assert statements == ['SELECT', 'UPDATE']
+
+        assert len(buffer) == 1
+        buffer.flush()
+        assert UserActivity.query.filter_by(activity_type='login').count() == 1
+
+    def test_activity_flush_failure_keeps_rows(self, app, client, monkeypatch):
+        """测试活动日志写入失败不影响登录，记录保留并由后台线程写入"""
+        import time
+        from app.models import UserActivity
+
+        User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        buffer = app.extensions['activity_log']
+
+        def fail():
+            raise RuntimeError('database unavailable')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(db.engine, 'begin', fail)
+            response = client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        assert response.status_code == 200
+        assert len(buffer) == 1 and buffer.stats['errors'] == 1
+
+        buffer._flusher.interval = 0.05
+        buffer.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not buffer.stats['flushes'] and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            buffer.stop()
+        assert len(buffer) == 0
+        assert UserActivity.query.filter_by(activity_type='login').count() == 1
+
+    def test_activity_buffer_capped_and_retried_in_background(self, app, monkeypatch):
+        """测试写入失败后 add() 不再重试，缓冲区超出容量时丢弃最早的记录"""
+        from app.models import UserActivity
+        from app.services.activity_log import queue_activity
+
+        user = User.create_user(username='testuser', email='test@example.com', password='password123')
+        db.session.commit()
+        buffer = app.extensions['activity_log']
+        buffer.max_rows = 3
+        attempts = []
+
+        def fail():
+            attempts.append(1)
+            raise RuntimeError('database unavailable')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(db.engine, 'begin', fail)
+            queue_activity(user.id, 'login', {'n': 0})
+            assert len(attempts) == 1 and buffer.stats['errors'] == 1
+
+            buffer._flusher.interval = 3600  # 后台线程运行中，但本测试内不会触发
+            buffer.start()
+            try:
+                for n in range(1, 5):
+                    queue_activity(user.id, 'login', {'n': n})
+            finally:
+                buffer.stop()
+        assert len(attempts) == 1
+        assert len(buffer) == 3 and buffer.stats['dropped'] == 2
+
+        assert buffer.flush() == 3
+        assert sorted(a.details['n'] for a in UserActivity.query.all()) == [2, 3, 4]
+        queue_activity(user.id, 'logout')
+        assert len(buffer) == 0
+
+    def test_register_duplicate_uses_constraint(self, client):
+        """测试重复的用户名和邮箱由唯一约束拒绝"""
+        payload = {'username': 'newuser', 'email': 'newuser@example.com',
+                   'password': 'password123', 'confirm_password': 'password123'}
+        response = client.post('/auth/register', json=payload)
+        assert response.status_code == 201
+        assert response.get_json()['user']['created_at'] is not None
+
+        response = client.post('/auth/register', json=dict(payload, email='other@example.com'))
+        assert response.status_code == 400
+        assert response.get_json()['error'] == ['用户名已存在']
+
+        response = client.post('/auth/register', json=dict(payload, username='other'))
+        assert response.status_code == 400
+        assert response.get_json()['error'] == ['邮箱已被注册']
+
+
+class TestStartup:
+    """应用启动测试"""
+
+    def test_lean_startup(self):
+        """测试创建应用时不建表、不加载 requests 和推荐模块，未知名称不会加载子模块"""
+        import subprocess
+        import sys
+
+        code = (
+            "import sys\n"
+            "from app import create_app, db\n"
+            "app = create_app('testing')\n"
+            "with app.app_context():\n"
+            "    assert not db.inspect(db.engine).get_table_names()\n"
+            "assert 'requests' not in sys.modules\n"
+            "assert 'app.services.recommendation' not in sys.modules\n"
+            "import app.services as services\n"
+            "assert not hasattr(services, 'no_such_service')\n"
+            "assert 'app.services.deepseek' not in sys.modules\n"
+            "from app.services import recommendation, get_personalized_recommendations\n"
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+
+
+class TestPrefork:
+    """预派生部署测试"""
+
+    def test_warmup_and_after_fork(self):
+        """测试主进程预热冻结对象、派生后重启后台刷新，并能读取进程内存"""
+        import subprocess
+        import sys
+
+        code = (
+            "import gc, os\n"
+            "from app import create_app, db\n"
+            "from app.utils.prefork import warmup, after_fork, memory_usage\n"
+            "app = create_app('testing')\n"
+            "app.config['POPULARITY_BACKGROUND_REFRESH'] = True\n"
+            "with app.app_context():\n"
+            "    db.create_all()\n"
+            "popularity = app.extensions['popularity']\n"
+            "popularity.start()\n"
+            "timings = warmup(app)\n"
+            "assert set(timings) == {'services', 'templates', 'popularity', 'answer_keys'}\n"
+            "assert popularity._thread is None\n"
+            "assert gc.get_freeze_count() > 0\n"
+            "after_fork(app)\n"
+            "assert popularity._thread is not None\n"
+            "popularity.stop()\n"
+            "usage = memory_usage(os.getpid())\n"
+            "assert usage is None or usage['Rss'] > 0\n"
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+
+
 class TestAPI:
     """API测试"""
 
@@ -145,6 +1640,48 @@ class TestAPI:
         assert 'items' in data
         assert len(data['items']) > 0
 
+    def test_get_stories_cursor_pagination(self, client, app):
+        """测试故事列表的游标分页"""
+        for i in range(5):
+            db.session.add(Story(title=f'游标{i}', slug=f'cursor-{i}', description='测试'))
+        db.session.commit()
+
+        expected = [s['id'] for s in client.get('/api/stories?per_page=100').get_json()['items']]
+
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = client.get(f'/api/stories?per_page=2&cursor={cursor}').get_json()
+            assert data['total'] is None
+            seen.extend(s['id'] for s in data['items'])
+            cursor = data['next_cursor']
+        assert seen == expected
+
+        response = client.get('/api/stories?cursor=not-a-cursor')
+        assert response.status_code == 400
+
+    def test_cursor_pagination_nullable_column(self, app):
+        """测试可空排序列：NULL 行排在最后且不会在翻页中丢失"""
+        from app.utils.helpers import keyset_paginate
+
+        for i in range(5):
+            db.session.add(Story(title=f'空值{i}', slug=f'null-{i}', description='测试'))
+        db.session.commit()
+        stories = Story.query.order_by(Story.id).all()
+        for story, views in zip(stories, [5, None, 9, None, 5]):
+            story.view_count = views
+        db.session.commit()
+
+        order_by = [(Story.view_count, True), (Story.id, True)]
+        for per_page in (1, 2, 3):
+            seen, cursor = [], None
+            while True:
+                page = keyset_paginate(Story.query, order_by, cursor=cursor, per_page=per_page)
+                seen.extend(story.view_count for story in page['items'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            assert seen == [9, 5, 5, None, None]
+
 
 class TestAuth:
     """认证测试"""